@@ -0,0 +1,113 @@
+'''
+CPU cost of one chat broadcast against the number of recipients.
+
+Compares encoding the payload for every socket (as the userlist path used
+to do) with validating and encoding it once, both sent inline, and with
+the full pipeline that shares one Frame through the per-connection queues.
+
+The pipeline encodes once too, but pays one writer-task wakeup per
+recipient, which costs about as much as encoding a short message again
+and well more than sending it inline. That is the price of isolation: the
+inline paths await every socket in turn, so one slow client stalls the
+broadcast for all, while the pipeline only queues. The last line shows
+this with one recipient that takes SLOW_SEND_MS per send.
+Run from the backend directory:
+
+    uv run python -m benchmarks.broadcast_bench
+'''
+import asyncio
+from datetime import datetime, timezone
+import json
+import time
+
+from src.core.connection_manager import ConnectionManager
+from src.core.frames import Frame
+from src.schemas.ws import ClientEnvelope
+
+
+RECIPIENTS = (10, 100, 1_000, 5_000)
+ROUNDS = 20
+SLOW_SEND_MS = 50
+
+
+class NullWebSocket:
+    async def accept(self, subprotocol: str | None = None):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+
+class SlowWebSocket(NullWebSocket):
+    async def send_text(self, message: str):
+        await asyncio.sleep(SLOW_SEND_MS / 1000)
+
+
+PAYLOAD = {
+    "v": 1,
+    "type": "message",
+    "data": {"content": "Hello world!", "created_at": datetime.now(timezone.utc).isoformat()},
+}
+RAW_MESSAGE = json.dumps(PAYLOAD)
+
+
+async def per_recipient(sockets: list[NullWebSocket]):
+    for websocket in sockets:
+        await websocket.send_text(json.dumps(PAYLOAD))
+
+
+async def encode_once(sockets: list[NullWebSocket]):
+    envelope = ClientEnvelope.validate_json(RAW_MESSAGE)
+    frame = Frame.event("message", envelope.data.model_dump())
+    for websocket in sockets:
+        await websocket.send_text(frame.text)
+
+
+async def pipeline(manager: ConnectionManager):
+    envelope = ClientEnvelope.validate_json(RAW_MESSAGE)
+    await manager.broadcast(Frame.event("message", envelope.data.model_dump()))
+    await asyncio.sleep(0)
+
+
+async def measure(run, *args):
+    started = time.process_time()
+    for _ in range(ROUNDS):
+        await run(*args)
+    return (time.process_time() - started) / ROUNDS * 1_000_000
+
+
+async def main():
+    print(f"{'recipients':>10} {'encode each us':>16} {'encode once us':>16} {'pipeline us':>14}")
+    for count in RECIPIENTS:
+        sockets = [NullWebSocket() for _ in range(count)]
+
+        manager = ConnectionManager(max_queue_size=ROUNDS * 2)
+        for i, websocket in enumerate(sockets):
+            await manager.connect(websocket, f"user{i}")
+        await asyncio.sleep(0.1)
+
+        each = await measure(per_recipient, sockets)
+        once = await measure(encode_once, sockets)
+        queued = await measure(pipeline, manager)
+        print(f"{count:>10} {each:>16.1f} {once:>16.1f} {queued:>14.1f}")
+
+        await manager.stop()
+
+    # Wall time until the broadcast returns with one slow recipient among 1000
+    sockets = [SlowWebSocket()] + [NullWebSocket() for _ in range(999)]
+    manager = ConnectionManager(max_queue_size=ROUNDS * 2)
+    for i, websocket in enumerate(sockets):
+        await manager.connect(websocket, f"user{i}")
+    await asyncio.sleep(0.1)
+    started = time.perf_counter()
+    await encode_once(sockets)
+    inline = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    await manager.broadcast(Frame.event("message", ClientEnvelope.validate_json(RAW_MESSAGE).data.model_dump()))
+    queued = (time.perf_counter() - started) * 1000
+    print(f"one {SLOW_SEND_MS} ms recipient of 1000: inline {inline:.1f} ms, pipeline {queued:.1f} ms")
+    await manager.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
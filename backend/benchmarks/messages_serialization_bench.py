@@ -0,0 +1,105 @@
+'''
+Time to build the GET /api/messages body for pages of 1k, 10k and 100k
+messages, before and after serving pre-serialized JSON:
+
+- cache hit, old: model_validate_json per cached item, MessageListResponse,
+  then FastAPI's response_model validation and serialization
+- cache hit, new: cached items embedded as they are in one orjson pass
+- cache miss, old: ORM objects, to_pydantic() per row, then response_model
+- cache miss, new: plain column rows serialized in one orjson pass
+
+Misses read from a throwaway SQLite file. Run from the backend directory:
+
+    uv run python -m benchmarks.messages_serialization_bench
+'''
+import asyncio
+from datetime import datetime, timezone
+from pathlib import Path
+import tempfile
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.core.message_json import dump_message, dump_messages_page
+from src.database.db import get_messages_page
+from src.database.models.base import Base
+from src.database.models.message import Message
+from src.schemas.message import MessageListResponse
+
+
+SIZES = (1_000, 10_000, 100_000)
+ROUNDS = 3
+RESPONSE_FIELD = create_model_field("Response_get_messages", MessageListResponse, mode="serialization")
+
+
+async def render(messages_response: MessageListResponse):
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=messages_response)
+    return JSONResponse(content).body
+
+
+async def hit_old(items: list[str]):
+    messages = [MessageListResponse.MessageListResponseItem.model_validate_json(item) for item in items]
+    return await render(MessageListResponse(messages=messages))
+
+
+async def hit_new(items: list[str]):
+    return dump_messages_page(items)
+
+
+async def miss_old(session, size: int):
+    result = await session.execute(select(Message).order_by(Message.id.desc()).limit(size))
+    messages = [row.to_pydantic() for row in reversed(result.scalars().all())]
+    return await render(MessageListResponse(messages=messages))
+
+
+async def miss_new(session, size: int):
+    rows, _ = await get_messages_page(session, limit=size)
+    return dump_messages_page(rows)
+
+
+async def best_of(fn, *args):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        await fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+async def main():
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    rows = [
+        {"content": f"message {i}", "created_at": datetime.now(timezone.utc), "created_by": f"user{i % 50}"}
+        for i in range(1, max(SIZES) + 1)
+    ]
+    async with sessions() as session:
+        await session.execute(insert(Message), rows)
+        await session.commit()
+
+    print(f"{'messages':>8} {'hit old ms':>11} {'hit new ms':>11} {'miss old ms':>12} {'miss new ms':>12}")
+    for size in SIZES:
+        async with sessions() as session:
+            page, _ = await get_messages_page(session, limit=size)
+            items = [dump_message(row) for row in page]
+            timings = (
+                await best_of(hit_old, items),
+                await best_of(hit_new, items),
+                await best_of(miss_old, session, size),
+                await best_of(miss_new, session, size),
+            )
+        print(f"{size:>8} {timings[0]:>11.1f} {timings[1]:>11.1f} {timings[2]:>12.1f} {timings[3]:>12.1f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
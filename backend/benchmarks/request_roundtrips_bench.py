@@ -0,0 +1,104 @@
+'''
+Database round trips and pool checkouts per API call, with the old get_db
+(Base.metadata.create_all before every session) and the current one.
+The message cache is bypassed, so every page is read from the database.
+Uses a throwaway SQLite file, so absolute timings are only indicative.
+Run from the backend directory:
+
+    uv run python -m benchmarks.request_roundtrips_bench
+'''
+import asyncio
+from pathlib import Path
+import tempfile
+import time
+
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from src.core.message_cache import CachedPage
+from src.database.db import get_db, get_read_db
+from src.database.models.base import Base
+from src.dependencies import get_current_user
+from src.routes import chat
+from src.schemas.user import TokenData
+
+
+REQUESTS = 200
+
+
+class UncachedRoom:
+    async def page(self, *args, **kwargs):
+        return CachedPage(warm=True, fresh=True)
+
+
+class UncachedRooms:
+    def __init__(self):
+        self.rooms = set()
+
+    def room(self, room_id: int = 1):
+        self.rooms.add(room_id)
+        return UncachedRoom()
+
+    def __contains__(self, room_id: int):
+        return room_id in self.rooms
+
+
+class Counters:
+    def __init__(self):
+        self.statements = 0
+        self.checkouts = 0
+
+
+async def measure(name: str, legacy: bool):
+    path = Path(tempfile.mkdtemp()) / "bench.db"
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    sessions = async_sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    counters = Counters()
+    event.listen(engine.sync_engine, "before_cursor_execute", lambda *_: setattr(counters, "statements", counters.statements + 1))
+    event.listen(engine.sync_engine, "checkout", lambda *_: setattr(counters, "checkouts", counters.checkouts + 1))
+
+    async def legacy_get_db():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with sessions() as session:
+            yield session
+
+    async def lean_get_db():
+        async with sessions() as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api")
+    app.dependency_overrides[chat.limiter] = lambda: None
+    app.dependency_overrides[get_current_user] = lambda: TokenData(username="benchmark")
+    app.dependency_overrides[get_db] = legacy_get_db if legacy else lean_get_db
+    app.dependency_overrides[get_read_db] = legacy_get_db if legacy else lean_get_db
+    chat.message_caches = UncachedRooms()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            response = await client.get("/api/messages", params={"limit": 10})
+            response.raise_for_status()
+        elapsed = time.perf_counter() - started
+
+    await engine.dispose()
+    print(
+        f"{name:>8} {counters.statements / REQUESTS:>14.1f} "
+        f"{counters.checkouts / REQUESTS:>16.1f} {elapsed / REQUESTS * 1000:>10.2f}"
+    )
+
+
+async def main():
+    print(f"{'get_db':>8} {'statements/req':>14} {'checkouts/req':>16} {'ms/req':>10}")
+    await measure("legacy", legacy=True)
+    await measure("lean", legacy=False)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
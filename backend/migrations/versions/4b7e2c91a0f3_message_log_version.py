@@ -0,0 +1,41 @@
+"""message log version
+
+Revision ID: 4b7e2c91a0f3
+Revises: d603de1ed05e
+Create Date: 2026-10-18 10:12:40.512331
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2c91a0f3'
+down_revision: Union[str, Sequence[str], None] = 'd603de1ed05e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    version_table = op.create_table('message_log_version',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # Messages stored before this revision all belong to version 0
+    op.bulk_insert(version_table, [{'id': 1, 'version': 0}])
+    op.create_table('message_changes',
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('change', sa.String(length=7), nullable=False),
+        sa.PrimaryKeyConstraint('version', 'message_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('message_changes')
+    op.drop_table('message_log_version')
@@ -0,0 +1,148 @@
+"""partition messages by month
+
+Revision ID: 7f2b9d4e6a18
+Revises: e3a8f6b2c4d1
+Create Date: 2026-10-18 13:21:45.902113
+
+messages becomes a table partitioned by range of created_at. The existing
+table is not rewritten: it is renamed to messages_legacy and attached as the
+partition of everything before the first day of next month (UTC); monthly
+partitions follow and are kept ahead by the partition maintainer
+(src/core/partitions.py), which also archives and drops partitions past
+MESSAGES_RETENTION_MONTHS.
+
+The primary key becomes (id, created_at) since a partitioned table can only
+enforce keys that include the partition key; ids stay unique through the
+shared messages_id_seq.
+
+Locks: the rename takes ACCESS EXCLUSIVE on messages until the migration
+commits, so everything that scans the existing rows runs before it, in
+autocommit. The new primary key index is built concurrently; the CHECK
+matching the legacy partition bound is added NOT VALID (a brief ACCESS
+EXCLUSIVE) and validated, as is the sender_id foreign key when
+backfill-senders has not already done so, under SHARE UPDATE EXCLUSIVE,
+which lets reads and writes go on. ATTACH PARTITION then finds both proven
+and scans nothing, so the exclusive part only touches the catalog. Rows
+written in between must fall before the bound: do not run this across the
+turn of a month (UTC).
+"""
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f2b9d4e6a18'
+down_revision: Union[str, Sequence[str], None] = 'e3a8f6b2c4d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+
+def month_start(moment: datetime, months: int = 0):
+    month = moment.year * 12 + moment.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    boundary = month_start(datetime.now(timezone.utc), 1)
+
+    # Before taking any lasting lock: the new primary key of the legacy partition, and
+    # the validated CHECK and foreign key without which ATTACH would scan every row
+    with op.get_context().autocommit_block():
+        op.execute('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS messages_legacy_pkey ON messages (id, created_at)')
+        op.execute('ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_legacy_bound')
+        op.execute(
+            f"ALTER TABLE messages ADD CONSTRAINT messages_legacy_bound "
+            f"CHECK (created_at < '{boundary.isoformat()}') NOT VALID"
+        )
+        op.execute('ALTER TABLE messages VALIDATE CONSTRAINT messages_legacy_bound')
+        op.execute('ALTER TABLE messages VALIDATE CONSTRAINT fk_messages_sender_id_users')
+
+    op.execute('ALTER TABLE messages RENAME TO messages_legacy')
+    op.execute('ALTER TABLE messages_legacy DROP CONSTRAINT messages_pkey')
+    op.execute('ALTER TABLE messages_legacy ADD CONSTRAINT messages_legacy_pkey PRIMARY KEY USING INDEX messages_legacy_pkey')
+    op.execute('ALTER INDEX ix_messages_created_at_id RENAME TO messages_legacy_created_at_id_idx')
+    op.execute('ALTER INDEX ix_messages_sender_id_id RENAME TO messages_legacy_sender_id_id_idx')
+    op.execute('ALTER INDEX ix_messages_search_vector RENAME TO messages_legacy_search_vector_idx')
+    op.execute('ALTER TABLE messages_legacy RENAME CONSTRAINT fk_messages_sender_id_users TO messages_legacy_sender_id_fkey')
+    # Replaced by the parent's trigger, which ATTACH clones onto the partition
+    op.execute('DROP TRIGGER messages_search_vector ON messages_legacy')
+
+    op.execute("""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('messages_id_seq'),
+            content varchar NOT NULL,
+            created_at timestamptz NOT NULL,
+            updated_at timestamptz,
+            created_by varchar NOT NULL,
+            sender_id integer,
+            search_vector tsvector,
+            CONSTRAINT messages_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT fk_messages_sender_id_users FOREIGN KEY (sender_id) REFERENCES users (id)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages.id')
+    op.execute('ALTER TABLE messages_legacy ALTER COLUMN id DROP DEFAULT')
+    # On the parent only; attaching picks up the matching legacy indexes instead of rebuilding them
+    op.execute('CREATE INDEX ix_messages_created_at_id ON messages (created_at, id)')
+    op.execute('CREATE INDEX ix_messages_sender_id_id ON messages (sender_id, id)')
+    op.execute('CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)')
+    op.execute(
+        'CREATE TRIGGER messages_search_vector BEFORE INSERT OR UPDATE OF content ON messages '
+        'FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()'
+    )
+
+    # Both proven above: no scan under the exclusive lock
+    op.execute(
+        f"ALTER TABLE messages ATTACH PARTITION messages_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')"
+    )
+    op.execute('ALTER TABLE messages_legacy DROP CONSTRAINT messages_legacy_bound')
+
+    for offset in range(MONTHS_AHEAD + 1):
+        start, end = month_start(boundary, offset), month_start(boundary, offset + 1)
+        op.execute(
+            f"CREATE TABLE messages_p{start:%Y%m} PARTITION OF messages "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    # Catches rows when maintenance has fallen behind rather than failing the insert
+    op.execute('CREATE TABLE messages_default PARTITION OF messages DEFAULT')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        CREATE TABLE messages_unpartitioned (
+            id integer NOT NULL,
+            content varchar NOT NULL,
+            created_at timestamptz NOT NULL,
+            updated_at timestamptz,
+            created_by varchar NOT NULL,
+            sender_id integer,
+            search_vector tsvector
+        )
+    """)
+    op.execute(
+        'INSERT INTO messages_unpartitioned (id, content, created_at, updated_at, created_by, sender_id, search_vector) '
+        'SELECT id, content, created_at, updated_at, created_by, sender_id, search_vector FROM messages'
+    )
+    op.execute('ALTER SEQUENCE messages_id_seq OWNED BY messages_unpartitioned.id')
+    op.execute('DROP TABLE messages')
+    op.execute('ALTER TABLE messages_unpartitioned RENAME TO messages')
+    op.execute("ALTER TABLE messages ALTER COLUMN id SET DEFAULT nextval('messages_id_seq')")
+    op.execute('ALTER TABLE messages ADD CONSTRAINT messages_pkey PRIMARY KEY (id)')
+    op.execute(
+        'ALTER TABLE messages ADD CONSTRAINT fk_messages_sender_id_users '
+        'FOREIGN KEY (sender_id) REFERENCES users (id)'
+    )
+    op.execute('CREATE INDEX ix_messages_created_at_id ON messages (created_at, id)')
+    op.execute('CREATE INDEX ix_messages_sender_id_id ON messages (sender_id, id)')
+    op.execute('CREATE INDEX ix_messages_search_vector ON messages USING gin (search_vector)')
+    op.execute(
+        'CREATE TRIGGER messages_search_vector BEFORE INSERT OR UPDATE OF content ON messages '
+        'FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()'
+    )
@@ -0,0 +1,58 @@
+"""messages full text search
+
+Revision ID: 9c1d5e7f3a2b
+Revises: 4b7e2c91a0f3
+Create Date: 2026-10-18 11:02:17.204518
+
+Online: a GENERATED ... STORED column would rewrite messages under an
+ACCESS EXCLUSIVE lock for as long as that takes. Instead the column is added
+nullable (a catalog change, the lock is held only briefly), a trigger fills
+it for every new or edited message, and the GIN index is built concurrently.
+Existing rows are filled afterwards with `python -m src.cli backfill-search`,
+in short transactions; until then searches do not find them.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1d5e7f3a2b'
+down_revision: Union[str, Sequence[str], None] = '4b7e2c91a0f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Kept out of the ORM model: SQLite (tests) has no tsvector. The 'simple'
+    # configuration must match SEARCH_TEXT_CONFIG in src/database/db.py.
+    op.add_column('messages', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.execute("""
+        CREATE FUNCTION messages_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := to_tsvector('simple', NEW.content);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute(
+        'CREATE TRIGGER messages_search_vector BEFORE INSERT OR UPDATE OF content ON messages '
+        'FOR EACH ROW EXECUTE FUNCTION messages_search_vector_update()'
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_search_vector', 'messages', ['search_vector'],
+            unique=False, postgresql_using='gin', postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_search_vector', table_name='messages', postgresql_concurrently=True)
+    op.execute('DROP TRIGGER messages_search_vector ON messages')
+    op.execute('DROP FUNCTION messages_search_vector_update()')
+    op.drop_column('messages', 'search_vector')
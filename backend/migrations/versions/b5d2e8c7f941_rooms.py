@@ -0,0 +1,76 @@
+"""rooms
+
+Revision ID: b5d2e8c7f941
+Revises: 7f2b9d4e6a18
+Create Date: 2026-10-18 14:05:12.338716
+
+Adds rooms and puts every existing message (and its message log version and
+changes) into the default room 1, "general". messages.room_id gets a
+constant default, so adding it does not rewrite the partitions; the
+(room_id, id) index is built concurrently partition by partition and
+attached to the parent index afterwards. Validating the room foreign key
+still scans messages once.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d2e8c7f941'
+down_revision: Union[str, Sequence[str], None] = '7f2b9d4e6a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def message_partitions():
+    result = op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'messages'::regclass ORDER BY c.relname"
+    ))
+    return list(result.scalars())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('rooms',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('created_by', sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.execute("INSERT INTO rooms (id, name, created_at) VALUES (1, 'general', now())")
+    op.execute("SELECT setval(pg_get_serial_sequence('rooms', 'id'), 1)")
+
+    op.add_column('messages', sa.Column('room_id', sa.Integer(), server_default='1', nullable=False))
+    op.create_foreign_key('fk_messages_room_id_rooms', 'messages', 'rooms', ['room_id'], ['id'])
+
+    op.add_column('message_changes', sa.Column('room_id', sa.Integer(), server_default='1', nullable=False))
+    op.drop_constraint('message_changes_pkey', 'message_changes', type_='primary')
+    op.create_primary_key('message_changes_pkey', 'message_changes', ['room_id', 'version', 'message_id'])
+
+    # An index on a partitioned table cannot be built concurrently; build it
+    # per partition and attach, the parent index is valid once all are attached
+    op.execute('CREATE INDEX ix_messages_room_id_id ON ONLY messages (room_id, id)')
+    partitions = message_partitions()
+    with op.get_context().autocommit_block():
+        for partition in partitions:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition}_room_id_id_idx ON {partition} (room_id, id)')
+    for partition in partitions:
+        op.execute(f'ALTER INDEX ix_messages_room_id_id ATTACH PARTITION {partition}_room_id_id_idx')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP INDEX ix_messages_room_id_id')
+    op.drop_constraint('message_changes_pkey', 'message_changes', type_='primary')
+    op.execute('DELETE FROM message_changes WHERE room_id <> 1')
+    op.create_primary_key('message_changes_pkey', 'message_changes', ['version', 'message_id'])
+    op.drop_column('message_changes', 'room_id')
+    op.execute('DELETE FROM message_log_version WHERE id <> 1')
+    op.drop_constraint('fk_messages_room_id_rooms', 'messages', type_='foreignkey')
+    op.drop_column('messages', 'room_id')
+    op.drop_table('rooms')
@@ -0,0 +1,31 @@
+"""message changes pruning
+
+Revision ID: c8f3a1d6b9e4
+Revises: b5d2e8c7f941
+Create Date: 2026-10-18 21:40:27.904512
+
+message_log_version.pruned_version records up to which version each
+room's change rows were pruned. The constant default makes adding it a
+catalog-only change.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8f3a1d6b9e4'
+down_revision: Union[str, Sequence[str], None] = 'b5d2e8c7f941'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('message_log_version', sa.Column('pruned_version', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('message_log_version', 'pruned_version')
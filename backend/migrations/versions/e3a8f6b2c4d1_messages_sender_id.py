@@ -0,0 +1,45 @@
+"""messages sender_id
+
+Revision ID: e3a8f6b2c4d1
+Revises: 9c1d5e7f3a2b
+Create Date: 2026-10-18 11:48:03.617240
+
+Online: the foreign key is added NOT VALID and the indexes are built
+concurrently, so writes keep going. Existing rows are filled afterwards
+with `python -m src.cli backfill-senders`, which also validates the key.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a8f6b2c4d1'
+down_revision: Union[str, Sequence[str], None] = '9c1d5e7f3a2b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('messages', sa.Column('sender_id', sa.Integer(), nullable=True))
+    op.execute(
+        'ALTER TABLE messages ADD CONSTRAINT fk_messages_sender_id_users '
+        'FOREIGN KEY (sender_id) REFERENCES users (id) NOT VALID'
+    )
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_created_at_id', 'messages', ['created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_messages_sender_id_id', 'messages', ['sender_id', 'id'], unique=False, postgresql_concurrently=True)
+        # The primary key already indexes id
+        op.drop_index('ix_messages_id', table_name='messages', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_messages_id', 'messages', ['id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_messages_sender_id_id', table_name='messages', postgresql_concurrently=True)
+        op.drop_index('ix_messages_created_at_id', table_name='messages', postgresql_concurrently=True)
+    op.drop_constraint('fk_messages_sender_id_users', 'messages', type_='foreignkey')
+    op.drop_column('messages', 'sender_id')
@@ -1,4 +1,5 @@
 from src.app import app
+from src.config import SERVER_HOST, SERVER_PORT, SERVER_RELOAD, WS_PER_MESSAGE_DEFLATE, WS_MAX_FRAME_BYTES
 
 from os import path
 import logging
@@ -14,4 +15,10 @@ logger.debug("Server module imported; logging configured")
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app="server:app", port=8000, reload=True)
\ No newline at end of file
+    # Heartbeats run on the connection manager's timer wheel instead of a keepalive task per socket.
+    # Always start the server this way (the Docker image does), or these settings are lost.
+    # Frames over WS_MAX_FRAME_BYTES are refused by the protocol layer before they are buffered.
+    uvicorn.run(
+        app="server:app", host=SERVER_HOST, port=SERVER_PORT, reload=SERVER_RELOAD,
+        ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE, ws_ping_interval=None, ws_max_size=WS_MAX_FRAME_BYTES
+    )
\ No newline at end of file
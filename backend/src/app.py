@@ -7,28 +7,60 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi_limiter import FastAPILimiter 
 
-from .routes.chat import router
+from .routes.chat import router, manager, message_writer, message_caches
+from .routes.metrics import router as metrics_router
 
 from .core.redis_client import redis_connection
+from .database.db import verify_schema, engine
+from .core.partitions import PartitionMaintainer
+from .core.hashing import password_hasher
 
 from .exceptions import (
     AuthenticationError,
     DuplicateUserError,
-    ChangingPasswordError
+    ChangingPasswordError,
+    InvalidCursorError,
+    PasswordHashingOverloadedError,
+    AdminRequiredError,
+    InvalidImportRecordError,
+    DuplicateRoomError,
+    RoomNotFoundError
 )
 
 
 logger = logging.getLogger(__name__)
 loggerChat = logging.getLogger("src.chat")
 
+partition_maintainer = PartitionMaintainer(engine)
+
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
+    logger.info("Verifying database schema")
+    await verify_schema()
     logger.info("Initializing rate limiter")
     await FastAPILimiter.init(redis_connection)
+    logger.info("Starting WebSocket backplane")
+    await manager.start()
+    logger.info("Starting messages cache invalidation listener")
+    await message_caches.start()
+    logger.info("Starting message writer")
+    await message_writer.start()
+    logger.info("Starting messages partition maintenance")
+    await partition_maintainer.start()
     yield
+    logger.info("Stopping messages partition maintenance")
+    await partition_maintainer.stop()
+    logger.info("Flushing message writer")
+    await message_writer.stop()
+    logger.info("Stopping messages cache invalidation listener")
+    await message_caches.stop()
+    logger.info("Stopping WebSocket backplane")
+    await manager.stop()
     logger.info("Closing rate limiter")
     await FastAPILimiter.close()
+    logger.info("Shutting down password hashing pool")
+    password_hasher.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -74,6 +106,90 @@ async def changing_password_error_handler(request: Request, exc: ChangingPasswor
     )
 
 
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_error_handler(request: Request, exc: InvalidCursorError):
+    logger.warning("Messages page request rejected: invalid cursor")
+    return JSONResponse(
+        status_code=exc.status_code,
+        headers=exc.headers,
+        content={
+            "detail": exc.detail,
+            "error_code": exc.headers["X-Error-Code"],
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+    )
+
+
+@app.exception_handler(PasswordHashingOverloadedError)
+async def password_hashing_overloaded_error_handler(request: Request, exc: PasswordHashingOverloadedError):
+    logger.warning("Authentication request rejected: password hashing pool is full")
+    return JSONResponse(
+        status_code=exc.status_code,
+        headers=exc.headers,
+        content={
+            "detail": exc.detail,
+            "error_code": exc.headers["X-Error-Code"],
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+    )
+
+
+@app.exception_handler(AdminRequiredError)
+async def admin_required_error_handler(request: Request, exc: AdminRequiredError):
+    logger.warning("Admin request rejected: user is not an administrator")
+    return JSONResponse(
+        status_code=exc.status_code,
+        headers=exc.headers,
+        content={
+            "detail": exc.detail,
+            "error_code": exc.headers["X-Error-Code"],
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+    )
+
+
+@app.exception_handler(InvalidImportRecordError)
+async def invalid_import_record_error_handler(request: Request, exc: InvalidImportRecordError):
+    logger.warning("Messages import stopped: invalid record")
+    return JSONResponse(
+        status_code=exc.status_code,
+        headers=exc.headers,
+        content={
+            "detail": exc.detail,
+            "error_code": exc.headers["X-Error-Code"],
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+    )
+
+
+@app.exception_handler(DuplicateRoomError)
+async def duplicate_room_error_handler(request: Request, exc: DuplicateRoomError):
+    loggerChat.warning("Room creation failed: name duplicate")
+    return JSONResponse(
+        status_code=exc.status_code,
+        headers=exc.headers,
+        content={
+            "detail": exc.detail,
+            "error_code": exc.headers["X-Error-Code"],
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+    )
+
+
+@app.exception_handler(RoomNotFoundError)
+async def room_not_found_error_handler(request: Request, exc: RoomNotFoundError):
+    loggerChat.warning("Request for a room that does not exist")
+    return JSONResponse(
+        status_code=exc.status_code,
+        headers=exc.headers,
+        content={
+            "detail": exc.detail,
+            "error_code": exc.headers["X-Error-Code"],
+            "timestamp": datetime.now(tz=timezone.utc).isoformat(),
+        }
+    )
+
+
 app.add_middleware(
     CORSMiddleware, 
     allow_origins=["http://localhost:5173", "http://localhost:5174", "http://localhost:3000"],
@@ -82,4 +198,6 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-app.include_router(router, prefix='/api')
\ No newline at end of file
+app.include_router(router, prefix='/api')
+app.include_router(metrics_router, prefix='/api')
+
@@ -0,0 +1,129 @@
+'''
+Maintenance commands. Run from the backend directory:
+
+    uv run python -m src.cli export --format gzip --since 2025-01-01T00:00:00Z -o messages.ndjson.gz
+    uv run python -m src.cli import messages.ndjson.gz
+    uv run python -m src.cli backfill-senders
+    uv run python -m src.cli backfill-search
+    uv run python -m src.cli partitions
+'''
+import argparse
+import asyncio
+from datetime import datetime
+import logging
+
+from .config import IMPORT_BATCH_SIZE, MESSAGES_RETENTION_MONTHS
+from .core.bulk_import import import_messages, ndjson_records
+from .core.export import export_messages, EXPORT_FORMATS
+from .core.partitions import PartitionMaintainer
+from .database.db import (
+    SessionLocal,
+    ReadSessionLocal,
+    engine,
+    dispose_engines,
+    backfill_message_senders,
+    backfill_message_search
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+async def export_command(args: argparse.Namespace):
+    with open(args.output, "wb") as output:
+        async for chunk in export_messages(ReadSessionLocal, args.format, args.since, args.until, args.created_by):
+            output.write(chunk)
+
+
+async def file_chunks(path: str, size: int = 1 << 20):
+    with open(path, "rb") as source:
+        while chunk := source.read(size):
+            yield chunk
+
+
+async def import_command(args: argparse.Namespace):
+    records = ndjson_records(file_chunks(args.input), gzipped=args.input.endswith(".gz"))
+    _, rooms = await import_messages(SessionLocal, records, args.batch_size)
+    if args.skip_cache:
+        return
+
+    # Imported late: the chat routes module also sets up the WebSocket manager and writer
+    from .routes.chat import message_caches
+    try:
+        for room_id in sorted(rooms):
+            await message_caches.room(room_id).ensure_warm()
+    except Exception:
+        logger.exception("Messages imported but the message cache was not rebuilt")
+
+
+async def backfill_senders_command(args: argparse.Namespace):
+    async with SessionLocal() as session:
+        updated = await backfill_message_senders(session, args.batch_size)
+    logger.info(f"Set sender_id of {updated} messages")
+
+
+async def backfill_search_command(args: argparse.Namespace):
+    async with SessionLocal() as session:
+        updated = await backfill_message_search(session, args.batch_size)
+    logger.info(f"Set search_vector of {updated} messages")
+
+
+async def partitions_command(args: argparse.Namespace):
+    await PartitionMaintainer(engine, retention_months=args.retention_months).maintain()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Chat backend maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Stream the message history to an NDJSON (or gzip) file")
+    export.add_argument("-o", "--output", required=True, help="File to write")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    export.add_argument("--since", type=datetime.fromisoformat, help="Only messages created at or after this time")
+    export.add_argument("--until", type=datetime.fromisoformat, help="Only messages created before this time")
+    export.add_argument("--created-by", help="Only messages of this sender")
+    export.set_defaults(handler=export_command)
+
+    load = commands.add_parser("import", help="Bulk load messages from an NDJSON (or .gz) file in the export format")
+    load.add_argument("input", help="File to read; gzip when it ends with .gz")
+    load.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows per transaction")
+    load.add_argument("--skip-cache", action="store_true", help="Do not rebuild the Redis message caches")
+    load.set_defaults(handler=import_command)
+
+    backfill = commands.add_parser("backfill-senders", help="Fill messages.sender_id from created_by, batch by batch")
+    backfill.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Message ids per transaction")
+    backfill.set_defaults(handler=backfill_senders_command)
+
+    backfill_search = commands.add_parser(
+        "backfill-search", help="Fill messages.search_vector of rows older than the search trigger, batch by batch"
+    )
+    backfill_search.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Message ids per transaction")
+    backfill_search.set_defaults(handler=backfill_search_command)
+
+    partitions = commands.add_parser(
+        "partitions", help="Create upcoming monthly message partitions and archive the expired ones"
+    )
+    partitions.add_argument(
+        "--retention-months", type=int, default=MESSAGES_RETENTION_MONTHS,
+        help="Archive and drop partitions older than this many months (0 keeps everything)"
+    )
+    partitions.set_defaults(handler=partitions_command)
+
+    return parser
+
+
+async def run(args: argparse.Namespace):
+    try:
+        await args.handler(args)
+    finally:
+        await dispose_engines()
+
+
+def main(argv: list[str] | None = None):
+    logging.basicConfig(level=logging.INFO)
+    args = build_parser().parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
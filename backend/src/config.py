@@ -10,10 +10,90 @@ DB_HOST: str = os.getenv("DB_HOST", "")
 DB_PORT: str = os.getenv("DB_PORT", "")
 POSTGRES_DB: str = os.getenv("POSTGRES_DB", "")
 DATABASE_URL: str = f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{DB_HOST}:{DB_PORT}/{POSTGRES_DB}"
+# Optional streaming replica for history reads (search, export, pages outside
+# the cache window); without DB_REPLICA_HOST they go to the primary
+DB_REPLICA_HOST: str = os.getenv("DB_REPLICA_HOST", "")
+DB_REPLICA_PORT: str = os.getenv("DB_REPLICA_PORT", DB_PORT)
+DATABASE_REPLICA_URL: str = (
+    f"postgresql+asyncpg://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{POSTGRES_DB}"
+    if DB_REPLICA_HOST else ""
+)
+# Engine profile: SQL/pool logging is for development only
+DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "0"))
+DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+# Prepared statements cached per connection (0 behind a transaction-pooling PgBouncer)
+DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+DB_APPLICATION_NAME: str = os.getenv("DB_APPLICATION_NAME", "simple-chat-backend")
+# Server-side limit of one statement (0 = none)
+DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# verify: require the Alembic head at startup, create: create_all at startup, off: skip
+DB_SCHEMA_CHECK: str = os.getenv("DB_SCHEMA_CHECK", "verify")
+# Monthly partitions of messages: created this many months ahead; older than
+# MESSAGES_RETENTION_MONTHS months (0 keeps everything) they are archived to MESSAGES_ARCHIVE_DIR
+PARTITION_MONTHS_AHEAD: int = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+MESSAGES_RETENTION_MONTHS: int = int(os.getenv("MESSAGES_RETENTION_MONTHS", "0"))
+MESSAGES_ARCHIVE_DIR: str = os.getenv("MESSAGES_ARCHIVE_DIR", "archive")
+PARTITION_MAINTENANCE_INTERVAL: int = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+# Change rows of each room's message log kept for /messages/changes, in versions (0 keeps all);
+# pruned by the same maintenance run
+MESSAGE_CHANGES_RETENTION_VERSIONS: int = int(os.getenv("MESSAGE_CHANGES_RETENTION_VERSIONS", "100000"))
+# Client-supplied created_at is clamped to within this many seconds of server time, so
+# id order and created_at stay close enough for history pages to bound (and prune) by created_at
+MESSAGES_CLOCK_SKEW_SECONDS: int = int(os.getenv("MESSAGES_CLOCK_SKEW_SECONDS", "3600"))
 
 # Redis configuration
 REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT: str = os.getenv("REDIS_PORT", "6379")
+REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_SOCKET_TIMEOUT_MS: int = int(os.getenv("REDIS_SOCKET_TIMEOUT_MS", "500"))
+REDIS_CONNECT_TIMEOUT_MS: int = int(os.getenv("REDIS_CONNECT_TIMEOUT_MS", "1000"))
+REDIS_RETRIES: int = int(os.getenv("REDIS_RETRIES", "2"))
+REDIS_RETRY_BACKOFF_MS: int = int(os.getenv("REDIS_RETRY_BACKOFF_MS", "20"))
+REDIS_RETRY_BACKOFF_MAX_MS: int = int(os.getenv("REDIS_RETRY_BACKOFF_MAX_MS", "200"))
+REDIS_HEALTH_CHECK_INTERVAL: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+MESSAGES_CACHE_WINDOW: int = int(os.getenv("MESSAGES_CACHE_WINDOW", "1000"))
+MESSAGES_CACHE_TTL: int = int(os.getenv("MESSAGES_CACHE_TTL", "3600"))
+MESSAGES_CACHE_STALE_TTL: int = int(os.getenv("MESSAGES_CACHE_STALE_TTL", "300"))
+MESSAGES_CACHE_LOCK_MS: int = int(os.getenv("MESSAGES_CACHE_LOCK_MS", "5000"))
+# Rooms whose message cache a worker keeps, least recently used dropped first
+MESSAGES_CACHE_ROOMS: int = int(os.getenv("MESSAGES_CACHE_ROOMS", "1000"))
+MESSAGES_LOCAL_CACHE_SIZE: int = int(os.getenv("MESSAGES_LOCAL_CACHE_SIZE", "128"))
+MESSAGES_LOCAL_CACHE_TTL_MS: int = int(os.getenv("MESSAGES_LOCAL_CACHE_TTL_MS", "2000"))
+
+# WebSocket fan-out
+WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+WS_OVERFLOW_POLICY: str = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+WS_BACKPLANE: str = os.getenv("WS_BACKPLANE", "memory")
+WS_PRESENCE_WINDOW_MS: int = int(os.getenv("WS_PRESENCE_WINDOW_MS", "50"))
+WS_PRESENCE_TTL: int = int(os.getenv("WS_PRESENCE_TTL", "30"))
+WS_MAX_FRAME_BYTES: int = int(os.getenv("WS_MAX_FRAME_BYTES", "4096"))
+WS_PER_MESSAGE_DEFLATE: bool = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true"
+WS_REPLAY_BUFFER_SIZE: int = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1024"))
+WS_REPLAY_STREAM_LENGTH: int = int(os.getenv("WS_REPLAY_STREAM_LENGTH", "100000"))
+WS_REPLAY_MAX_EVENTS: int = int(os.getenv("WS_REPLAY_MAX_EVENTS", "5000"))
+WS_HEARTBEAT_INTERVAL: int = int(os.getenv("WS_HEARTBEAT_INTERVAL", "25"))
+WS_IDLE_TIMEOUT: int = int(os.getenv("WS_IDLE_TIMEOUT", "60"))
+WS_TIMER_TICK_MS: int = int(os.getenv("WS_TIMER_TICK_MS", "1000"))
+WS_MAX_CONNECTIONS_PER_USER: int = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "5"))
+
+# Message write-behind
+WRITE_BEHIND_BATCH_SIZE: int = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_MS: int = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "50"))
+WRITE_BEHIND_MAX_PENDING: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+# Server (python server.py)
+SERVER_HOST: str = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT: int = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_RELOAD: bool = os.getenv("SERVER_RELOAD", "true").lower() == "true"
+
+# History export
+EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+IMPORT_BATCH_SIZE: int = int(os.getenv("IMPORT_BATCH_SIZE", "10000"))
 
 # Security
 SECRET_KEY: str = os.getenv("SECRET_KEY", "")
+PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+ADMIN_USERNAMES: set[str] = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
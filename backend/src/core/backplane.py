@@ -0,0 +1,386 @@
+from abc import ABC, abstractmethod
+import asyncio
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+import logging
+from uuid import uuid4
+
+from ..config import WS_REPLAY_STREAM_LENGTH, WS_PRESENCE_TTL
+from .frames import Frame
+from .redis_client import redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "chat:ws:"
+KEY_PRESENCE = "chat:presence"
+# Connections per user of each worker, and when each worker last heartbeated
+KEY_PRESENCE_WORKER = "chat:presence:worker:"
+KEY_PRESENCE_WORKERS = "chat:presence:workers"
+KEY_SEQ = "chat:ws:seq"
+KEY_EVENTS = "chat:ws:events"
+
+# Kinds published through append(); their payloads on the channel carry the sequence number
+SEQUENCED_KINDS = ("message",)
+
+# KEYS: seq, events. ARGV: channel, kind, data, stream length.
+# Numbering, logging and publishing in one script keeps the numbers in publish order.
+APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[4], seq .. '-0', 'kind', ARGV[2], 'data', ARGV[3])
+redis.call('PUBLISH', ARGV[1], seq .. ' ' .. ARGV[3])
+return seq
+"""
+
+# Takes the counts of a worker out of the shared presence; returns the users that went offline.
+DROP_WORKER = """
+local function drop_worker(presence_key, workers_key, worker_key, worker)
+    local offline = {}
+    local counts = redis.call('HGETALL', worker_key)
+    for i = 1, #counts, 2 do
+        if redis.call('HINCRBY', presence_key, counts[i], -tonumber(counts[i + 1])) <= 0 then
+            redis.call('HDEL', presence_key, counts[i])
+            table.insert(offline, counts[i])
+        end
+    end
+    redis.call('DEL', worker_key)
+    redis.call('ZREM', workers_key, worker)
+    return offline
+end
+"""
+
+# KEYS: presence, worker. ARGV: username, +1 or -1.
+CHANGE_PRESENCE_SCRIPT = """
+local own = redis.call('HINCRBY', KEYS[2], ARGV[1], ARGV[2])
+if own <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+end
+if own < 0 then
+    return -1
+end
+local total = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if total <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return 0
+end
+return total
+"""
+
+# KEYS: presence, workers, worker. ARGV: worker id, worker key prefix, ttl, then username/count pairs.
+# Registers the worker, brings its counts in line with its connections and
+# drops the workers that stopped heartbeating.
+HEARTBEAT_SCRIPT = DROP_WORKER + """
+local now = tonumber(redis.call('TIME')[1])
+redis.call('ZADD', KEYS[2], now, ARGV[1])
+local counts = {}
+for i = 4, #ARGV, 2 do
+    counts[ARGV[i]] = tonumber(ARGV[i + 1])
+end
+local stored = redis.call('HGETALL', KEYS[3])
+for i = 1, #stored, 2 do
+    if not counts[stored[i]] then
+        counts[stored[i]] = 0
+    end
+end
+local offline = {}
+for username, count in pairs(counts) do
+    local delta = count - tonumber(redis.call('HGET', KEYS[3], username) or 0)
+    if delta ~= 0 then
+        if count > 0 then
+            redis.call('HSET', KEYS[3], username, count)
+        else
+            redis.call('HDEL', KEYS[3], username)
+        end
+        if redis.call('HINCRBY', KEYS[1], username, delta) <= 0 then
+            redis.call('HDEL', KEYS[1], username)
+            table.insert(offline, username)
+        end
+    end
+end
+for _, worker in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[3]))) do
+    for _, username in ipairs(drop_worker(KEYS[1], KEYS[2], ARGV[2] .. worker, worker)) do
+        table.insert(offline, username)
+    end
+end
+return offline
+"""
+
+# KEYS: presence, workers, worker. ARGV: worker id.
+LEAVE_WORKER_SCRIPT = DROP_WORKER + """
+return drop_worker(KEYS[1], KEYS[2], KEYS[3], ARGV[1])
+"""
+
+EventHandler = Callable[[str, str, int | None], Awaitable[None]]
+Event = tuple[int, str, str]
+
+
+class Backplane(ABC):
+    '''
+    Carries broadcast events between every process serving websockets.
+    Each process receives every published event exactly once and fans it
+    out to its own local connections. Kinds may carry a suffix after a
+    colon, such as the room of "message:<room_id>".
+
+    Events published with append() get the next number of one sequence
+    shared by all processes and are logged, so clients that missed some
+    can have them replayed; publish() is for events nobody replays, such
+    as presence and typing. Subclasses implement every abstract method;
+    an incomplete one cannot be instantiated.
+    '''
+
+    def __init__(self):
+        self._handler: EventHandler | None = None
+
+    def bind(self, handler: EventHandler):
+        self._handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, kind: str, data: str):
+        '''
+        Publish an event to every process, unnumbered and not logged.
+        '''
+
+    @abstractmethod
+    async def append(self, kind: str, data: str) -> int:
+        '''
+        Publish a sequenced event and log it; returns its sequence number.
+        '''
+
+    @abstractmethod
+    async def history(self, after: int, limit: int) -> list[Event] | None:
+        '''
+        The logged events numbered after `after`, oldest first, as
+        (seq, kind, data). None when some of them are no longer logged or
+        there are more than limit of them.
+        '''
+
+    @abstractmethod
+    async def join(self, username: str) -> bool:
+        '''
+        Count one more connection of the user; True when the user just came online.
+        '''
+
+    @abstractmethod
+    async def leave(self, username: str) -> bool:
+        '''
+        Count one connection of the user less; True when the user just went offline.
+        '''
+
+    @abstractmethod
+    async def members(self) -> list[str]:
+        '''
+        The users with at least one connection on any process.
+        '''
+
+    async def _dispatch(self, kind: str, data: str, seq: int | None = None):
+        if self._handler is None:
+            return
+        try:
+            await self._handler(kind, data, seq)
+        except Exception:
+            logger.exception(f"Backplane handler failed for {kind} event")
+
+
+class InMemoryHub:
+    '''
+    Shared state of in-memory backplanes; several backplanes on one hub
+    behave like processes behind one Redis.
+    '''
+
+    def __init__(self, events_length: int = WS_REPLAY_STREAM_LENGTH):
+        self.backplanes: list["InMemoryBackplane"] = []
+        self.presence: Counter[str] = Counter()
+        self.seq = 0
+        self.events: deque[Event] = deque(maxlen=events_length)
+
+
+class InMemoryBackplane(Backplane):
+    def __init__(self, hub: InMemoryHub | None = None):
+        super().__init__()
+        self.hub = hub or InMemoryHub()
+        self.hub.backplanes.append(self)
+
+    async def publish(self, kind: str, data: str):
+        for backplane in list(self.hub.backplanes):
+            await backplane._dispatch(kind, data)
+
+    async def append(self, kind: str, data: str):
+        self.hub.seq += 1
+        seq = self.hub.seq
+        self.hub.events.append((seq, kind, data))
+        for backplane in list(self.hub.backplanes):
+            await backplane._dispatch(kind, data, seq)
+        return seq
+
+    async def history(self, after: int, limit: int):
+        events = [event for event in self.hub.events if event[0] > after]
+        if len(events) > limit:
+            return None
+        if events:
+            return events if events[0][0] == after + 1 else None
+        return [] if after >= self.hub.seq else None
+
+    async def join(self, username: str):
+        self.hub.presence[username] += 1
+        return self.hub.presence[username] == 1
+
+    async def leave(self, username: str):
+        self.hub.presence[username] -= 1
+        if self.hub.presence[username] <= 0:
+            del self.hub.presence[username]
+            return True
+        return False
+
+    async def members(self):
+        return list(self.hub.presence)
+
+
+class RedisBackplane(Backplane):
+    '''
+    Backplane over Redis pub/sub, with the event log in a stream.
+
+    Presence is counted per worker as well as in total. Every worker
+    heartbeats every presence_ttl / 3 seconds, correcting its own counts
+    from its connections, and takes the users of workers silent for
+    presence_ttl out of the total, so a crashed worker does not keep its
+    users online. A worker stopping cleanly leaves right away.
+    '''
+
+    def __init__(
+        self,
+        redis_conn=redis_connection,
+        kinds: tuple[str, ...] = ("message", "transient", "presence"),
+        presence_ttl: float = WS_PRESENCE_TTL
+    ):
+        super().__init__()
+        self.redis = redis_conn
+        self._append = redis_conn.register_script(APPEND_SCRIPT)
+        self._change_presence = redis_conn.register_script(CHANGE_PRESENCE_SCRIPT)
+        self._heartbeat = redis_conn.register_script(HEARTBEAT_SCRIPT)
+        self._leave_worker = redis_conn.register_script(LEAVE_WORKER_SCRIPT)
+        self.channels = [CHANNEL_PREFIX + kind for kind in kinds]
+        self.worker_id = uuid4().hex
+        self.presence_ttl = presence_ttl
+        self.local_presence: Counter[str] = Counter()
+        self._listener: asyncio.Task | None = None
+        self._heartbeats: asyncio.Task | None = None
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+        self._heartbeats = asyncio.create_task(self._run_heartbeats())
+        logger.info("Redis backplane started")
+
+    async def stop(self):
+        for task in (self._heartbeats, self._listener):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        try:
+            offline = await self._leave_worker(
+                keys=[KEY_PRESENCE, KEY_PRESENCE_WORKERS, KEY_PRESENCE_WORKER + self.worker_id], args=[self.worker_id]
+            )
+            await self._publish_offline(offline)
+        except Exception as e:
+            logger.error(f"Could not take the presence of this worker out of Redis: {e}")
+        logger.info("Redis backplane stopped")
+
+    async def heartbeat(self):
+        '''
+        Refresh this worker's presence and take the users of dead workers offline.
+        '''
+        counts = [value for username, count in self.local_presence.items() for value in (username, count)]
+        offline = await self._heartbeat(
+            keys=[KEY_PRESENCE, KEY_PRESENCE_WORKERS, KEY_PRESENCE_WORKER + self.worker_id],
+            args=[self.worker_id, KEY_PRESENCE_WORKER, self.presence_ttl, *counts]
+        )
+        await self._publish_offline(offline)
+
+    async def _run_heartbeats(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"Presence heartbeat failed: {e}")
+            await asyncio.sleep(self.presence_ttl / 3)
+
+    async def _publish_offline(self, usernames: list[str]):
+        if usernames:
+            logger.info(f"{len(usernames)} users went offline with their worker")
+            await self.publish("presence", Frame.event("presence", {"joined": [], "left": usernames}).text)
+
+    async def publish(self, kind: str, data: str):
+        await self.redis.publish(CHANNEL_PREFIX + kind, data)
+
+    async def append(self, kind: str, data: str):
+        return await self._append(
+            keys=[KEY_SEQ, KEY_EVENTS], args=[CHANNEL_PREFIX + kind, kind, data, WS_REPLAY_STREAM_LENGTH]
+        )
+
+    async def history(self, after: int, limit: int):
+        entries = await self.redis.xrange(KEY_EVENTS, min=str(after + 1), max="+", count=limit + 1)
+        events = [(int(entry_id.split("-")[0]), fields["kind"], fields["data"]) for entry_id, fields in entries]
+        if len(events) > limit:
+            return None
+        if events:
+            return events if events[0][0] == after + 1 else None
+        return [] if after >= int(await self.redis.get(KEY_SEQ) or 0) else None
+
+    async def join(self, username: str):
+        self.local_presence[username] += 1
+        return await self._change(username, 1) == 1
+
+    async def leave(self, username: str):
+        self.local_presence[username] -= 1
+        if self.local_presence[username] <= 0:
+            del self.local_presence[username]
+        # -1: the worker was taken for dead meanwhile, so its users already left
+        return await self._change(username, -1) == 0
+
+    async def _change(self, username: str, delta: int):
+        return await self._change_presence(
+            keys=[KEY_PRESENCE, KEY_PRESENCE_WORKER + self.worker_id], args=[username, delta]
+        )
+
+    async def members(self):
+        return await self.redis.hkeys(KEY_PRESENCE)
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                # Patterns, so "message" also covers the per-room "message:<room_id>" channels
+                await pubsub.psubscribe(*(channel + "*" for channel in self.channels))
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    kind = message["channel"].removeprefix(CHANNEL_PREFIX)
+                    if kind.partition(":")[0] in SEQUENCED_KINDS:
+                        seq, _, data = message["data"].partition(" ")
+                        await self._dispatch(kind, data, int(seq))
+                    else:
+                        await self._dispatch(kind, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis backplane subscription lost, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                with suppress(Exception):
+                    await pubsub.aclose()
+
+
+def create_backplane(name: str) -> Backplane:
+    if name == "redis":
+        return RedisBackplane()
+    if name == "memory":
+        return InMemoryBackplane()
+    raise ValueError(f"Unknown WebSocket backplane: {name}")
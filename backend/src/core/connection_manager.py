@@ -0,0 +1,472 @@
+import asyncio
+from collections import Counter, deque
+from contextlib import suppress
+from enum import Enum
+from functools import partial
+import logging
+import time
+
+from fastapi import WebSocket, status
+
+from ..config import (
+    WS_SEND_QUEUE_SIZE,
+    WS_OVERFLOW_POLICY,
+    WS_PRESENCE_WINDOW_MS,
+    WS_REPLAY_BUFFER_SIZE,
+    WS_REPLAY_MAX_EVENTS,
+    WS_HEARTBEAT_INTERVAL,
+    WS_IDLE_TIMEOUT,
+    WS_TIMER_TICK_MS,
+    WS_MAX_CONNECTIONS_PER_USER
+)
+from ..schemas.room import DEFAULT_ROOM_ID
+from .backplane import Backplane, InMemoryBackplane
+from .presence import PresenceBatcher
+from .frames import Frame, SUBPROTOCOL_MSGPACK
+from .replay import ReplayBuffer
+from .timer_wheel import TimerWheel
+
+
+logger = logging.getLogger(__name__)
+
+# The heartbeat is the same for everybody, so it is encoded once
+PING = Frame.event("ping", {})
+
+
+class OverflowPolicy(str, Enum):
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+    DISCONNECT = "disconnect"
+
+
+class Connection:
+    '''
+    One accepted websocket with its own bounded outbound queue.
+    A dedicated writer task drains the queue, so a slow client only
+    delays its own frames and never the rest of the broadcast.
+    Binary connections get the MessagePack form of every frame.
+    '''
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        username: str,
+        max_queue_size: int,
+        overflow_policy: OverflowPolicy,
+        binary: bool = False
+    ):
+        self.websocket = websocket
+        self.username = username
+        self.binary = binary
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self.rooms: set[int] = set()
+        self._queue: deque[tuple[str | None, Frame]] = deque()
+        self._held: list[tuple[int, Frame]] | None = None
+        # Set while the writer waits for frames; resolving it wakes the writer
+        self._waiter: asyncio.Future | None = None
+        self._writer: asyncio.Task | None = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, frame: Frame, coalesce_key: str | None = None, seq: int | None = None):
+        '''
+        Enqueue a frame without waiting for the socket.
+        Returns False when the connection overflowed under the disconnect policy.
+        '''
+        if self.closed:
+            return True
+
+        if seq is not None and self._held is not None:
+            self._held.append((seq, frame))
+            return True
+
+        if coalesce_key is not None and self.overflow_policy == OverflowPolicy.COALESCE:
+            for index, (key, _) in enumerate(self._queue):
+                if key == coalesce_key:
+                    self._queue[index] = (coalesce_key, frame)
+                    return True
+
+        if len(self._queue) >= self.max_queue_size:
+            if self.overflow_policy == OverflowPolicy.DISCONNECT:
+                return False
+            self._queue.popleft()
+            self.dropped += 1
+
+        self._queue.append((coalesce_key, frame))
+        self._wake()
+        return True
+
+    def replay(self, frames: list[Frame]):
+        '''
+        Enqueue replayed frames past the queue bound: the client asked for
+        every one of them, and WS_REPLAY_MAX_EVENTS bounds how many there are.
+        '''
+        if self.closed or not frames:
+            return
+        self._queue.extend((None, frame) for frame in frames)
+        self._wake()
+
+    def _wake(self):
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def hold(self):
+        '''
+        Keep sequenced frames back instead of queueing them, until release().
+        '''
+        self._held = []
+
+    def release(self, after_seq: int):
+        '''
+        Queue the frames held back, except those numbered up to after_seq
+        which a replay already queued.
+        '''
+        held, self._held = self._held or [], None
+        for seq, frame in held:
+            if seq > after_seq:
+                self.send(frame)
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                while self._queue:
+                    _, frame = self._queue.popleft()
+                    if self.binary:
+                        await self.websocket.send_bytes(frame.packed)
+                    else:
+                        await self.websocket.send_text(frame.text)
+                self._waiter = loop.create_future()
+                await self._waiter
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.closed = True
+            logger.warning(f"WebSocket writer for user {self.username} stopped: {e}")
+
+    async def close(self):
+        self.closed = True
+        self._queue.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._writer
+
+
+class ConnectionManager:
+    '''
+    Tracks the websockets of this process. Broadcasts and presence changes
+    go through the backplane, which hands every event back to each process
+    once; the manager then fans it out to its local connections.
+
+    Messages are broadcast to one room. Every connection subscribes to the
+    rooms it wants (the default room on connect), and the manager keeps an
+    index from room to subscribed connections, so delivering a message
+    costs O(members of the room) however many rooms the process serves.
+    Presence still goes to every connection.
+
+    Room events carry the sequence number the backplane gave them. The
+    latest are kept in a replay buffer, so a client that reconnects with
+    the last number it saw gets only what it missed; older events come
+    from the backplane's log. Transient events, such as typing, are not
+    numbered and never replayed.
+
+    Liveness of every connection runs on one shared timer wheel. A client
+    silent for heartbeat_interval gets a ping; one silent for idle_timeout,
+    or whose writer died, is evicted, so half-open sockets do not pile up.
+    Every user may hold at most max_connections_per_user sockets here.
+    '''
+
+    def __init__(
+        self,
+        max_queue_size: int = WS_SEND_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy | str = WS_OVERFLOW_POLICY,
+        backplane: Backplane | None = None,
+        presence_window: float = WS_PRESENCE_WINDOW_MS / 1000,
+        replay_buffer_size: int = WS_REPLAY_BUFFER_SIZE,
+        replay_max_events: int = WS_REPLAY_MAX_EVENTS,
+        heartbeat_interval: float = WS_HEARTBEAT_INTERVAL,
+        idle_timeout: float = WS_IDLE_TIMEOUT,
+        timer_tick: float = WS_TIMER_TICK_MS / 1000,
+        max_connections_per_user: int = WS_MAX_CONNECTIONS_PER_USER
+    ):
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.activate_connections: dict[WebSocket, Connection] = {}
+        self.rooms: dict[int, set[Connection]] = {}
+        self.backplane = backplane or InMemoryBackplane()
+        self.backplane.bind(self._on_event)
+        self.presence = PresenceBatcher(self.backplane, presence_window)
+        self.replay = ReplayBuffer(replay_buffer_size)
+        self.replay_max_events = replay_max_events
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.max_connections_per_user = max_connections_per_user
+        self.timers = TimerWheel(timer_tick)
+        self.user_connections: Counter[str] = Counter()
+        self.accepted = 0
+        self.disconnected = 0
+        self.refused = 0
+        self.evicted: Counter[str] = Counter()
+        self._evictions: set[asyncio.Task] = set()
+
+    async def start(self):
+        await self.backplane.start()
+        await self.timers.start()
+
+    async def stop(self):
+        '''
+        Close every local connection and take its user's presence out of
+        the backplane, so users of a stopped worker do not stay online.
+        '''
+        await self.timers.stop()
+        for connection in list(self.activate_connections.values()):
+            self._forget(connection)
+            await connection.close()
+            with suppress(Exception):
+                await connection.websocket.close(code=status.WS_1001_GOING_AWAY)
+            try:
+                await self._leave(connection.username)
+            except Exception as e:
+                logger.error(f"Could not leave the presence of {connection.username}: {e}")
+        await self.presence.close()
+        await self.backplane.stop()
+        self.rooms.clear()
+        self.user_connections.clear()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        username: str,
+        rooms: tuple[int, ...] = (DEFAULT_ROOM_ID,),
+        subprotocol: str | None = None
+    ):
+        '''
+        Accept the websocket, or close it and return False when the user
+        already has max_connections_per_user of them or the backplane
+        cannot record the user's presence.
+        '''
+        if self.max_connections_per_user and self.user_connections[username] >= self.max_connections_per_user:
+            self.refused += 1
+            logger.warning(f"Refusing WebSocket of user {username}: {self.user_connections[username]} already open")
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return False
+
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(
+            websocket, username, self.max_queue_size, self.overflow_policy,
+            binary=subprotocol == SUBPROTOCOL_MSGPACK
+        )
+        connection.start()
+        self.activate_connections[websocket] = connection
+        self.user_connections[username] += 1
+        self.accepted += 1
+        self.timers.schedule(connection, self.heartbeat_interval, partial(self._check_liveness, connection))
+        for room_id in rooms:
+            self.subscribe(websocket, room_id)
+        try:
+            joined = await self.backplane.join(username)
+        except Exception as e:
+            logger.error(f"Could not record the presence of {username}, closing the WebSocket: {e}")
+            self._forget(connection)
+            await connection.close()
+            with suppress(Exception):
+                await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+            return False
+        if joined:
+            self.presence.record(username, "joined")
+
+        # Only the newcomer gets the full list; everybody else gets the delta
+        snapshot = Frame.event("presence", {"members": await self.backplane.members()})
+        connection.send(snapshot, coalesce_key="presence")
+        return True
+
+    async def disconnect(self, websocket: WebSocket):
+        connection = self.activate_connections.get(websocket)
+        if connection is None:
+            return
+        self._forget(connection)
+        self.disconnected += 1
+        await connection.close()
+        await self._leave(connection.username)
+
+    def touch(self, websocket: WebSocket):
+        '''
+        Note that the client just sent a frame; any frame counts as a sign of life.
+        '''
+        connection = self.activate_connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    def stats(self):
+        return {
+            "live": len(self.activate_connections),
+            "users": len(self.user_connections),
+            "accepted": self.accepted,
+            "disconnected": self.disconnected,
+            "refused": self.refused,
+            "evicted": dict(self.evicted),
+            "timers": len(self.timers),
+        }
+
+    def send(self, websocket: WebSocket, frame: Frame):
+        '''
+        Queue a frame for one local connection only, such as an ack.
+        '''
+        connection = self.activate_connections.get(websocket)
+        if connection is not None:
+            connection.send(frame)
+
+    def subscribe(self, websocket: WebSocket, room_id: int):
+        connection = self.activate_connections.get(websocket)
+        if connection is None:
+            return False
+        connection.rooms.add(room_id)
+        self.rooms.setdefault(room_id, set()).add(connection)
+        return True
+
+    def unsubscribe(self, websocket: WebSocket, room_id: int):
+        connection = self.activate_connections.get(websocket)
+        if connection is None or room_id not in connection.rooms:
+            return False
+        connection.rooms.discard(room_id)
+        self._leave_room(connection, room_id)
+        return True
+
+    def is_subscribed(self, websocket: WebSocket, room_id: int):
+        connection = self.activate_connections.get(websocket)
+        return connection is not None and room_id in connection.rooms
+
+    def _leave_rooms(self, connection: Connection):
+        for room_id in connection.rooms:
+            self._leave_room(connection, room_id)
+        connection.rooms.clear()
+
+    def _leave_room(self, connection: Connection, room_id: int):
+        members = self.rooms.get(room_id)
+        if members is None:
+            return
+        members.discard(connection)
+        if not members:
+            del self.rooms[room_id]
+
+    async def broadcast(self, frame: Frame, room_id: int = DEFAULT_ROOM_ID, transient: bool = False):
+        '''
+        Send an envelope to the room on every process. Returns the sequence
+        number of the event, or None for a transient one.
+        '''
+        if transient:
+            await self.backplane.publish(f"transient:{room_id}", frame.text)
+            return None
+        return await self.backplane.append(f"message:{room_id}", frame.text)
+
+    async def resume(self, websocket: WebSocket, last_seq: int):
+        '''
+        Queue the events of the connection's rooms numbered after last_seq.
+        Returns how many were replayed and whether that was all of them;
+        when it was not, the client has to reload the history instead.
+        '''
+        connection = self.activate_connections.get(websocket)
+        if connection is None:
+            return 0, False
+
+        events = self.replay.since(last_seq)
+        if events is not None:
+            return self._replay(connection, events), True
+
+        # Events arriving while the log is read are held back to keep the replay in order
+        connection.hold()
+        try:
+            logged = await self.backplane.history(last_seq, self.replay_max_events)
+        except Exception as e:
+            logger.error(f"Could not read the event log to resume {connection.username}: {e}")
+            logged = None
+        if logged is None:
+            connection.release(last_seq)
+            return 0, False
+
+        events = [(seq, int(kind.partition(":")[2]), Frame(text=data).with_seq(seq)) for seq, kind, data in logged]
+        replayed = self._replay(connection, events)
+        connection.release(events[-1][0] if events else last_seq)
+        return replayed, True
+
+    def _replay(self, connection: Connection, events: list[tuple[int, int, Frame]]):
+        frames = [frame for _, room_id, frame in events if room_id in connection.rooms]
+        connection.replay(frames)
+        return len(frames)
+
+    async def _on_event(self, kind: str, data: str, seq: int | None = None):
+        if kind == "presence":
+            await self._deliver(Frame(text=data), self.activate_connections.values())
+        elif kind.startswith(("message:", "transient:")):
+            room_id = int(kind.partition(":")[2])
+            frame = Frame(text=data)
+            if seq is not None:
+                frame = frame.with_seq(seq)
+                self.replay.append(seq, room_id, frame)
+            members = self.rooms.get(room_id)
+            if members:
+                await self._deliver(frame, members, seq)
+
+    async def _deliver(self, frame: Frame, connections, seq: int | None = None):
+        overflowed = [connection for connection in list(connections) if not connection.send(frame, seq=seq)]
+        for connection in overflowed:
+            await self._evict(connection)
+
+    def _check_liveness(self, connection: Connection):
+        '''
+        Timer of one connection. Frames from the client only stamp
+        last_seen; the timer works out from it when to look again.
+        '''
+        if self.activate_connections.get(connection.websocket) is not connection:
+            return
+
+        idle = time.monotonic() - connection.last_seen
+        if connection.closed:
+            self._spawn_eviction(connection, "dead", status.WS_1011_INTERNAL_ERROR)
+        elif idle >= self.idle_timeout:
+            self._spawn_eviction(connection, "idle", status.WS_1001_GOING_AWAY)
+        elif idle >= self.heartbeat_interval:
+            connection.send(PING, coalesce_key="ping")
+            delay = min(self.heartbeat_interval, self.idle_timeout - idle)
+            self.timers.schedule(connection, delay, partial(self._check_liveness, connection))
+        else:
+            delay = self.heartbeat_interval - idle
+            self.timers.schedule(connection, delay, partial(self._check_liveness, connection))
+
+    def _spawn_eviction(self, connection: Connection, reason: str, code: int):
+        # Closing a half-open socket can take a while; the wheel must not wait for it
+        task = asyncio.create_task(self._evict(connection, reason, code))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    def _forget(self, connection: Connection):
+        del self.activate_connections[connection.websocket]
+        self._leave_rooms(connection)
+        self.timers.cancel(connection)
+        self.user_connections[connection.username] -= 1
+        if self.user_connections[connection.username] <= 0:
+            del self.user_connections[connection.username]
+
+    async def _evict(self, connection: Connection, reason: str = "slow", code: int = status.WS_1013_TRY_AGAIN_LATER):
+        if self.activate_connections.get(connection.websocket) is not connection:
+            return
+        self._forget(connection)
+        self.evicted[reason] += 1
+        logger.warning(f"Disconnecting {reason} WebSocket consumer: {connection.username}")
+        await connection.close()
+        with suppress(Exception):
+            await connection.websocket.close(code=code)
+        await self._leave(connection.username)
+
+    async def _leave(self, username: str):
+        if await self.backplane.leave(username):
+            self.presence.record(username, "left")
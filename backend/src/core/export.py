@@ -0,0 +1,42 @@
+from collections.abc import AsyncIterator
+from datetime import datetime
+import logging
+import zlib
+
+from sqlalchemy.ext.asyncio.session import async_sessionmaker
+
+from ..database.db import stream_messages
+from .message_json import dump_messages_ndjson
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("ndjson", "gzip")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "gzip": "application/gzip"}
+
+
+async def export_messages(
+    session_factory: async_sessionmaker,
+    format: str = "ndjson",
+    since: datetime | None = None,
+    until: datetime | None = None,
+    created_by: str | None = None
+) -> AsyncIterator[bytes]:
+    '''
+    The message history as NDJSON chunks, one per cursor batch, gzip
+    compressed on the fly when format is "gzip". Opens its own session
+    because the stream outlives the request handler.
+    '''
+    compressor = zlib.compressobj(wbits=31) if format == "gzip" else None
+    exported = 0
+    async with session_factory() as session:
+        async for rows in stream_messages(session, since, until, created_by):
+            exported += len(rows)
+            chunk = dump_messages_ndjson(rows)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+    logger.info(f"Exported {exported} messages")
@@ -0,0 +1,79 @@
+import orjson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from ..schemas.ws import PROTOCOL_VERSION
+
+
+# WebSocket subprotocols in order of preference; MessagePack only when installed
+SUBPROTOCOL_JSON = f"chat.v{PROTOCOL_VERSION}.json"
+SUBPROTOCOL_MSGPACK = f"chat.v{PROTOCOL_VERSION}.msgpack"
+SUBPROTOCOLS = (SUBPROTOCOL_MSGPACK, SUBPROTOCOL_JSON) if msgpack is not None else (SUBPROTOCOL_JSON,)
+
+
+def negotiate_subprotocol(offered: list[str]) -> str | None:
+    '''
+    The first subprotocol the client offered that the server speaks, or
+    None (plain JSON) when the client offered none of them.
+    '''
+    for subprotocol in offered:
+        if subprotocol in SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+class Frame:
+    '''
+    A websocket payload encoded once and shared by every recipient.
+    The text form, the UTF-8 bytes and the MessagePack form are each
+    cached on first use.
+    '''
+
+    __slots__ = ("_text", "_data", "_packed")
+
+    def __init__(self, text: str | None = None, data: bytes | None = None):
+        self._text = text
+        self._data = data
+        self._packed = None
+
+    @classmethod
+    def from_object(cls, payload):
+        return cls(data=orjson.dumps(payload))
+
+    @classmethod
+    def event(cls, type: str, data: dict, ref: str | None = None):
+        '''
+        A server frame in the versioned envelope of the WebSocket protocol.
+        '''
+        envelope = {"v": PROTOCOL_VERSION, "type": type, "data": data}
+        if ref is not None:
+            envelope["ref"] = ref
+        return cls.from_object(envelope)
+
+    def with_seq(self, seq: int):
+        '''
+        This envelope with the sequence number of its room event added,
+        spliced into the encoded object instead of encoding it again.
+        '''
+        return Frame(data=b'{"seq":%d,%s' % (seq, self.data[1:]))
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._data.decode()
+        return self._text
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = self._text.encode()
+        return self._data
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            self._packed = msgpack.packb(orjson.loads(self.data))
+        return self._packed
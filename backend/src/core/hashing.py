@@ -0,0 +1,55 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from ..config import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+from ..exceptions import PasswordHashingOverloadedError
+
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    '''
+    Runs bcrypt on a small dedicated thread pool so hashing never blocks
+    the event loop (bcrypt releases the GIL while it works). At most
+    max_pending calls may be queued or running; further calls are
+    rejected right away instead of piling up behind a login burst.
+    '''
+
+    def __init__(self, max_workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+
+    async def run(self, fn: Callable, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"Password hashing overloaded: {self.pending} pending")
+            raise PasswordHashingOverloadedError(pending=self.pending)
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHasher()
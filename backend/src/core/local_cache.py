@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from collections.abc import Hashable
+import time
+from typing import Any
+
+
+class LocalCache:
+    '''
+    In-process LRU of at most max_size values, each expiring ttl seconds
+    after it was put. It lives on the event loop of one worker, so there is
+    no locking.
+
+    clear() starts a new generation. A value read from the shared cache
+    before a clear is put with the generation of that read and dropped,
+    so a read racing an invalidation cannot bring the old value back.
+    '''
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value, generation: int | None = None):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
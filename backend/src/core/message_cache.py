@@ -0,0 +1,489 @@
+import asyncio
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+import logging
+from typing import NamedTuple
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from ..config import (
+    MESSAGES_CACHE_WINDOW,
+    MESSAGES_CACHE_TTL,
+    MESSAGES_CACHE_STALE_TTL,
+    MESSAGES_CACHE_LOCK_MS,
+    MESSAGES_CACHE_ROOMS,
+    MESSAGES_LOCAL_CACHE_SIZE,
+    MESSAGES_LOCAL_CACHE_TTL_MS
+)
+from ..schemas.room import DEFAULT_ROOM_ID
+from .local_cache import LocalCache
+from .single_flight import SingleFlight
+
+
+logger = logging.getLogger(__name__)
+
+# Each room has its own set of keys: the prefix followed by the room id
+KEY_LOG = "chat:messages:log"
+KEY_FLOOR = "chat:messages:floor"
+KEY_FRESH = "chat:messages:fresh"
+KEY_REBUILD_LOCK = "chat:messages:rebuild-lock"
+KEY_VERSION = "chat:messages:version"
+KEY_VERSION_PENDING = "chat:messages:version-pending"
+
+# Every change of a room's cache is announced here with the room id, so
+# all workers drop their local copies of that room's pages
+CHANNEL_INVALIDATE = "chat:messages:invalidate"
+
+# Every change of the log carries its database version. KEY_VERSION holds
+# the version up to which all changes are applied; versions that arrive
+# ahead of a missing one wait in KEY_VERSION_PENDING.
+APPLY_VERSION = """
+local function apply_version(version_key, pending_key, version)
+    local current = redis.call('GET', version_key)
+    version = tonumber(version)
+    if not current or not version then
+        return
+    end
+    current = tonumber(current)
+    if version <= current then
+        return
+    end
+    redis.call('ZADD', pending_key, version, version)
+    while redis.call('ZSCORE', pending_key, current + 1) do
+        current = current + 1
+        redis.call('ZREM', pending_key, current)
+    end
+    redis.call('SET', version_key, current, 'KEEPTTL')
+    local ttl = redis.call('TTL', version_key)
+    if ttl > 0 then
+        redis.call('EXPIRE', pending_key, ttl)
+    end
+end
+"""
+
+# KEYS: log, floor, version, pending. ARGV: window, version, channel, room id, then id/json pairs.
+APPEND_SCRIPT = APPLY_VERSION + """
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+local floor = redis.call('GET', KEYS[2])
+if not floor then
+    return 0
+end
+floor = tonumber(floor)
+for i = 5, #ARGV, 2 do
+    if tonumber(ARGV[i]) >= floor then
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], ARGV[i], ARGV[i])
+        redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+local window = tonumber(ARGV[1])
+if redis.call('ZCARD', KEYS[1]) > window then
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -window - 1)
+    local first = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    redis.call('SET', KEYS[2], first[2], 'KEEPTTL')
+end
+apply_version(KEYS[3], KEYS[4], ARGV[2])
+return 1
+"""
+
+# KEYS: log, version, pending. ARGV: id, content, updated_at, version, channel, room id.
+PATCH_SCRIPT = APPLY_VERSION + """
+redis.call('PUBLISH', ARGV[5], ARGV[6])
+apply_version(KEYS[2], KEYS[3], ARGV[4])
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+if #items == 0 then
+    return 0
+end
+local message = cjson.decode(items[1])
+message['content'] = ARGV[2]
+message['updated_at'] = ARGV[3]
+redis.call('ZREMRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+redis.call('ZADD', KEYS[1], ARGV[1], cjson.encode(message))
+return 1
+"""
+
+# KEYS: log, version, pending. ARGV: id, version, channel, room id.
+REMOVE_SCRIPT = APPLY_VERSION + """
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+apply_version(KEYS[2], KEYS[3], ARGV[2])
+return redis.call('ZREMRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[1])
+"""
+
+# KEYS: lock. ARGV: token.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+Loader = Callable[[int], Awaitable[tuple[dict[int, str], bool, int]]]
+
+
+class CachedPage(NamedTuple):
+    warm: bool
+    fresh: bool
+    items: list[str] | None = None
+    has_more: bool = False
+    ids: list[int] | None = None
+    version: int | None = None
+    etag: str | None = None
+    not_modified: bool = False
+
+
+class MessageCache:
+    '''
+    Write-through cache of the most recent messages in a Redis sorted set
+    scored by message id, one serialized message per member. The floor key
+    holds the lowest id from which on every message is cached (0 when the
+    whole history fits). Creates append, edits patch one member, deletes
+    remove one member; only a cold cache is rebuilt from the database.
+
+    Rebuilds run once per process (single-flight) and once across workers
+    (Redis lock). After ttl seconds the cache turns stale: it is still
+    served for stale_ttl more seconds while one caller refreshes it.
+
+    The cache also tracks the message log version it reflects; its ETag
+    changes with every change applied to the cache.
+
+    One MessageCache holds the messages of one room (room_id).
+
+    Fresh pages read from Redis are also kept in a small local cache of
+    this worker for local_ttl seconds. Every change publishes the room id
+    on CHANNEL_INVALIDATE from the same script that applies it, and
+    RoomMessageCaches drops the room's local pages on every worker.
+
+    A change that cannot be applied because Redis is unavailable marks the
+    cache dirty instead of failing the write, which is already stored. A
+    dirty cache is dropped from Redis as soon as Redis answers again: in
+    the background, retried with backoff, and before this worker uses the
+    cache again. Dropping it makes the cache cold for every worker, so the
+    next reader anywhere rebuilds it.
+    '''
+
+    def __init__(
+        self,
+        redis_conn,
+        loader: Loader,
+        window: int = MESSAGES_CACHE_WINDOW,
+        ttl: int = MESSAGES_CACHE_TTL,
+        stale_ttl: int = MESSAGES_CACHE_STALE_TTL,
+        lock_ms: int = MESSAGES_CACHE_LOCK_MS,
+        room_id: int = DEFAULT_ROOM_ID,
+        local_size: int = MESSAGES_LOCAL_CACHE_SIZE,
+        local_ttl: float = MESSAGES_LOCAL_CACHE_TTL_MS / 1000
+    ):
+        self.redis = redis_conn
+        self.loader = loader
+        self.window = window
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock_ms = lock_ms
+        self.room_id = room_id
+        self.key_log = f"{KEY_LOG}:{room_id}"
+        self.key_floor = f"{KEY_FLOOR}:{room_id}"
+        self.key_fresh = f"{KEY_FRESH}:{room_id}"
+        self.key_rebuild_lock = f"{KEY_REBUILD_LOCK}:{room_id}"
+        self.key_version = f"{KEY_VERSION}:{room_id}"
+        self.key_version_pending = f"{KEY_VERSION_PENDING}:{room_id}"
+        self._append = redis_conn.register_script(APPEND_SCRIPT)
+        self._patch = redis_conn.register_script(PATCH_SCRIPT)
+        self._remove = redis_conn.register_script(REMOVE_SCRIPT)
+        self._release = redis_conn.register_script(RELEASE_SCRIPT)
+        self._single_flight = SingleFlight()
+        self.local = LocalCache(local_size, local_ttl)
+        self.dirty = False
+
+    async def page(self, before_id: int | None, after_id: int | None, limit: int, if_none_match: str | None = None):
+        '''
+        Serialized messages of one page in ascending id order and whether
+        another page follows in the same direction. items is None when the
+        page is not (completely) in the cache, or when the cache still
+        matches if_none_match (not_modified).
+        '''
+        key = (before_id, after_id, limit)
+        page = self.local.get(key)
+        if page is not None:
+            if page.etag is not None and page.etag == if_none_match:
+                return page._replace(items=None, ids=None, not_modified=True)
+            return page
+
+        generation = self.local.generation
+        page = await self._redis_page(before_id, after_id, limit, if_none_match)
+        # Stale pages stay out, so their callers keep triggering the refresh
+        if page.fresh and page.items is not None:
+            self.local.put(key, page, generation)
+        return page
+
+    async def _redis_page(self, before_id: int | None, after_id: int | None, limit: int, if_none_match: str | None):
+        await self._repair()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.mget(self.key_floor, self.key_fresh, self.key_version)
+            pipe.zcard(self.key_version_pending)
+            (floor, fresh, version), pending = await pipe.execute()
+        if floor is None:
+            return CachedPage(warm=False, fresh=False)
+        floor = int(floor)
+        fresh = fresh is not None
+        version = int(version) if version is not None else None
+        # Ahead-of-order changes only add to the pending set until the
+        # version catches up, so its size tells those cache states apart
+        etag = None if version is None else f'"{version}.{pending}"' if pending else f'"{version}"'
+        meta = {"version": version, "etag": etag}
+        if etag is not None and etag == if_none_match:
+            return CachedPage(True, fresh, not_modified=True, **meta)
+
+        if after_id is not None:
+            if after_id + 1 < floor:
+                return CachedPage(True, fresh, **meta)
+            scored = await self.redis.zrangebyscore(
+                self.key_log, f"({after_id}", "+inf", start=0, num=limit + 1, withscores=True, score_cast_func=int
+            )
+            return self._found(fresh, scored[:limit], len(scored) > limit, meta)
+
+        upper = f"({before_id}" if before_id is not None else "+inf"
+        scored = await self.redis.zrevrangebyscore(
+            self.key_log, upper, floor, start=0, num=limit + 1, withscores=True, score_cast_func=int
+        )
+        if len(scored) > limit:
+            return self._found(fresh, scored[:limit][::-1], True, meta)
+        if floor == 0:
+            return self._found(fresh, scored[::-1], False, meta)
+        return CachedPage(True, fresh, **meta)
+
+    @staticmethod
+    def _found(fresh: bool, scored: list[tuple[str, int]], has_more: bool, meta: dict):
+        items = [item for item, _ in scored]
+        ids = [id for _, id in scored]
+        return CachedPage(True, fresh, items, has_more, ids, **meta)
+
+    async def ensure_warm(self):
+        '''
+        Rebuild a cold cache, sharing one rebuild among all concurrent callers.
+        '''
+        await self._single_flight.do(self.key_log, self._rebuild_locked)
+
+    def refresh_in_background(self):
+        self._single_flight.start(self.key_log, self._rebuild_locked)
+
+    async def _rebuild_locked(self):
+        token = uuid4().hex
+        try:
+            locked = await self.redis.set(self.key_rebuild_lock, token, nx=True, px=self.lock_ms)
+        except RedisError as e:
+            logger.warning(f"Messages cache rebuild skipped, Redis unavailable: {e}")
+            return
+        if locked:
+            try:
+                messages, complete, version = await self.loader(self.window)
+                await self.rebuild(messages, complete, version)
+            except Exception:
+                logger.exception("Messages cache rebuild failed")
+            finally:
+                await self._release(keys=[self.key_rebuild_lock], args=[token])
+            return
+
+        # Another worker holds the lock: wait for its result instead of scanning too
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ms / 1000
+        while loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            if await self.redis.exists(self.key_fresh):
+                return
+        logger.warning("Timed out waiting for another worker to rebuild the messages cache")
+
+    async def rebuild(self, messages: dict[int, str], complete: bool, version: int = 0):
+        '''
+        Replace the cache with the given latest messages (id -> serialized).
+        complete tells that no older messages exist; version is the message
+        log version read before the messages.
+        '''
+        floor = 0 if complete or not messages else min(messages)
+        hard_ttl = self.ttl + self.stale_ttl
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key_log, self.key_version_pending)
+            if messages:
+                pipe.zadd(self.key_log, {item: id for id, item in messages.items()})
+                pipe.expire(self.key_log, hard_ttl)
+            pipe.set(self.key_floor, floor, ex=hard_ttl)
+            pipe.set(self.key_version, version, ex=hard_ttl)
+            pipe.set(self.key_fresh, 1, ex=self.ttl)
+            pipe.publish(CHANNEL_INVALIDATE, self.room_id)
+            await pipe.execute()
+        self.local.clear()
+        logger.debug(f"Rebuilt messages cache with {len(messages)} messages")
+
+    async def append(self, messages: dict[int, str], version: int | None = None):
+        async with self._applying():
+            await self.stage_append(self.redis, messages, version)
+
+    async def stage_append(self, client, messages: dict[int, str], version: int | None = None):
+        '''
+        Run the append on client, which may be a pipeline that runs it later.
+        '''
+        args = [self.window, version or "", CHANNEL_INVALIDATE, self.room_id]
+        for id, item in messages.items():
+            args.extend((id, item))
+        await self._append(
+            keys=[self.key_log, self.key_floor, self.key_version, self.key_version_pending], args=args, client=client
+        )
+
+    async def patch(self, id: int, content: str, updated_at: str, version: int | None = None):
+        async with self._applying():
+            await self._patch(
+                keys=[self.key_log, self.key_version, self.key_version_pending],
+                args=[id, content, updated_at, version or "", CHANNEL_INVALIDATE, self.room_id]
+            )
+
+    async def remove(self, id: int, version: int | None = None):
+        async with self._applying():
+            await self._remove(
+                keys=[self.key_log, self.key_version, self.key_version_pending],
+                args=[id, version or "", CHANNEL_INVALIDATE, self.room_id]
+            )
+
+    @asynccontextmanager
+    async def _applying(self):
+        try:
+            await self._repair()
+            yield
+        except RedisError as e:
+            logger.warning(f"Messages cache of room {self.room_id} missed a change, dropping it once Redis is back: {e}")
+            self.mark_dirty()
+        finally:
+            self.local.clear()
+
+    def mark_dirty(self):
+        self.dirty = True
+        self._single_flight.start(self.key_floor, self._repair_until_done)
+
+    async def _repair_until_done(self):
+        delay = 0.05
+        while self.dirty:
+            try:
+                await self._repair()
+            except RedisError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    async def _repair(self):
+        if self.dirty:
+            # Without the floor the cache is cold on every worker; the publish drops their local pages
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self.key_floor, self.key_fresh)
+                pipe.publish(CHANNEL_INVALIDATE, self.room_id)
+                await pipe.execute()
+            self.dirty = False
+            logger.info(f"Messages cache of room {self.room_id} dropped after a missed change")
+
+
+class RoomMessageCaches:
+    '''
+    The MessageCache of every room, created on first use; only the
+    max_rooms most recently used are kept. loader_factory builds the loader
+    of one room from its id; options are passed on to each MessageCache.
+    Callers only ask for rooms that exist, so a room found here exists.
+
+    While started it listens on CHANNEL_INVALIDATE and drops the local
+    pages of the rooms changed by any worker.
+    '''
+
+    def __init__(
+        self,
+        redis_conn,
+        loader_factory: Callable[[int], Loader],
+        max_rooms: int = MESSAGES_CACHE_ROOMS,
+        **options
+    ):
+        self.redis = redis_conn
+        self.loader_factory = loader_factory
+        self.max_rooms = max_rooms
+        self.options = options
+        self._caches: OrderedDict[int, MessageCache] = OrderedDict()
+        self._listener: asyncio.Task | None = None
+
+    def room(self, room_id: int = DEFAULT_ROOM_ID) -> MessageCache:
+        cache = self._caches.get(room_id)
+        if cache is None:
+            cache = MessageCache(self.redis, self.loader_factory(room_id), room_id=room_id, **self.options)
+            self._caches[room_id] = cache
+            while len(self._caches) > self.max_rooms:
+                self._caches.popitem(last=False)
+        self._caches.move_to_end(room_id)
+        return cache
+
+    def __contains__(self, room_id: int):
+        return room_id in self._caches
+
+    async def append_rooms(self, changes: dict[int, tuple[dict[int, str], int | None]]):
+        '''
+        Append new messages to the caches of several rooms in one round
+        trip; changes maps each room to its messages and log version.
+        '''
+        caches = {room_id: self.room(room_id) for room_id in changes}
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for room_id, (messages, version) in changes.items():
+                    await caches[room_id]._repair()
+                    await caches[room_id].stage_append(pipe, messages, version)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Messages caches missed new messages, dropping them once Redis is back: {e}")
+            for cache in caches.values():
+                cache.mark_dirty()
+        finally:
+            for cache in caches.values():
+                cache.local.clear()
+
+    def invalidate(self, room_id: int | None = None):
+        '''
+        Drop the local pages of one room, or of every room.
+        '''
+        if room_id is None:
+            caches = list(self._caches.values())
+        else:
+            caches = [self._caches[room_id]] if room_id in self._caches else []
+        for cache in caches:
+            cache.local.clear()
+
+    def stats(self):
+        local_caches = [cache.local for cache in self._caches.values()]
+        return {
+            "rooms": len(local_caches),
+            "local_pages": sum(len(local) for local in local_caches),
+            "local_hits": sum(local.hits for local in local_caches),
+            "local_misses": sum(local.misses for local in local_caches),
+        }
+
+    async def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._listener
+        self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL_INVALIDATE)
+                # Changes may have been missed while not subscribed
+                self.invalidate()
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self.invalidate(int(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Messages cache invalidation subscription lost, resubscribing: {e}")
+                self.invalidate()
+                await asyncio.sleep(1)
+            finally:
+                with suppress(Exception):
+                    await pubsub.aclose()
@@ -0,0 +1,35 @@
+import orjson
+
+
+# Same field order and datetime format as MessageListResponseItem.model_dump_json()
+MESSAGE_FIELDS = ("content", "created_at", "updated_at", "created_by", "room_id", "id")
+OPTIONS = orjson.OPT_UTC_Z
+
+
+def dump_message(message) -> str:
+    '''
+    Serialize one message given as a row or a mapping with the message fields.
+    '''
+    if not isinstance(message, dict):
+        message = message._asdict()
+    return orjson.dumps({field: message.get(field) for field in MESSAGE_FIELDS}, option=OPTIONS).decode()
+
+
+def dump_messages_page(messages, **fields) -> bytes:
+    '''
+    The MessageListResponse body in one pass. messages is either a list of
+    database rows or the already serialized messages from the cache, which
+    are embedded as they are.
+    '''
+    if messages and isinstance(messages[0], str):
+        messages = orjson.Fragment("[" + ",".join(messages) + "]")
+    else:
+        messages = [row._asdict() for row in messages]
+    return orjson.dumps({"messages": messages, **fields}, option=OPTIONS)
+
+
+def dump_messages_ndjson(rows) -> bytes:
+    '''
+    Database rows as newline-delimited JSON, one message per line.
+    '''
+    return b"".join(orjson.dumps(row._asdict(), option=OPTIONS) + b"\n" for row in rows)
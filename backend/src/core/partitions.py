@@ -0,0 +1,231 @@
+import asyncio
+from contextlib import suppress
+from datetime import datetime, timezone
+import logging
+import os
+from pathlib import Path
+import re
+from typing import NamedTuple
+import zlib
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from ..config import (
+    PARTITION_MONTHS_AHEAD,
+    MESSAGES_RETENTION_MONTHS,
+    MESSAGES_ARCHIVE_DIR,
+    PARTITION_MAINTENANCE_INTERVAL,
+    MESSAGE_CHANGES_RETENTION_VERSIONS
+)
+from ..database.db import prune_message_changes
+from .message_json import MESSAGE_FIELDS, dump_messages_ndjson
+
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "messages_p"
+LEGACY_PARTITION = "messages_legacy"
+ADVISORY_LOCK_KEY = "messages_partitions"
+ARCHIVE_BATCH_SIZE = 5000
+
+BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+class Partition(NamedTuple):
+    name: str
+    lower: datetime | None
+    upper: datetime | None
+    default: bool = False
+
+
+def month_start(moment: datetime, months: int = 0):
+    month = moment.year * 12 + moment.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(start: datetime):
+    return f"{PARTITION_PREFIX}{start:%Y%m}"
+
+
+def parse_bound(bound: str):
+    '''
+    One side of a range partition bound as printed by pg_get_expr:
+    MINVALUE/MAXVALUE (None) or a quoted timestamp.
+    '''
+    if bound in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(bound.strip("'")).astimezone(timezone.utc)
+
+
+def parse_partition(name: str, expression: str):
+    if expression == "DEFAULT":
+        return Partition(name, None, None, default=True)
+    lower, upper = BOUND_PATTERN.search(expression).groups()
+    return Partition(name, parse_bound(lower), parse_bound(upper))
+
+
+def missing_partitions(existing: list[Partition], now: datetime, months_ahead: int):
+    '''
+    (name, start, end) of the monthly partitions from the current month up
+    to months_ahead months ahead that no existing partition covers yet.
+    '''
+    missing = []
+    for offset in range(months_ahead + 1):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        covered = any(
+            not partition.default
+            and (partition.lower is None or partition.lower < end)
+            and (partition.upper is None or partition.upper > start)
+            for partition in existing
+        )
+        if not covered:
+            missing.append((partition_name(start), start, end))
+    return missing
+
+
+def expired_partitions(existing: list[Partition], now: datetime, retention_months: int):
+    '''
+    Partitions holding only messages older than retention_months whole
+    months before the current one.
+    '''
+    cutoff = month_start(now, -retention_months)
+    return [
+        partition for partition in existing
+        if not partition.default and partition.upper is not None and partition.upper <= cutoff
+    ]
+
+
+async def list_partitions(conn: AsyncConnection):
+    result = await conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'messages'::regclass"
+    ))
+    return [parse_partition(name, expression) for name, expression in result]
+
+
+async def detached_partitions(conn: AsyncConnection):
+    '''
+    Former partitions left behind by an archive run that stopped between
+    detaching and dropping them.
+    '''
+    result = await conn.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+        "AND (relname = :legacy OR relname ~ :pattern)"
+    ), {"legacy": LEGACY_PARTITION, "pattern": f"^{PARTITION_PREFIX}[0-9]{{6}}$"})
+    return list(result.scalars())
+
+
+class PartitionMaintainer:
+    '''
+    Keeps the monthly partitions of the PostgreSQL messages table
+    (partitioned by created_at) ahead of time and, when retention_months is
+    set, detaches partitions past retention, archives them as gzipped NDJSON
+    files in archive_dir and drops them. Runs every interval seconds in one
+    worker at a time (advisory lock); does nothing when messages is not
+    partitioned (SQLite, DB_SCHEMA_CHECK=create).
+
+    Every run, on any database, also prunes the message_changes rows
+    older than the last changes_retention versions of each room.
+    '''
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        months_ahead: int = PARTITION_MONTHS_AHEAD,
+        retention_months: int = MESSAGES_RETENTION_MONTHS,
+        archive_dir: str = MESSAGES_ARCHIVE_DIR,
+        interval: float = PARTITION_MAINTENANCE_INTERVAL,
+        changes_retention: int = MESSAGE_CHANGES_RETENTION_VERSIONS
+    ):
+        self.engine = engine
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.archive_dir = Path(archive_dir)
+        self.interval = interval
+        self.changes_retention = changes_retention
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception:
+                logger.exception("Messages partition maintenance failed")
+            await asyncio.sleep(self.interval)
+
+    async def maintain(self, now: datetime | None = None):
+        if self.changes_retention > 0:
+            async with AsyncSession(self.engine) as session:
+                pruned = await prune_message_changes(session, self.changes_retention)
+            if pruned:
+                logger.info(f"Pruned {pruned} message change rows")
+        if self.engine.dialect.name != "postgresql":
+            return
+        now = now or datetime.now(timezone.utc)
+        async with self.engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            partitioned = await conn.scalar(text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'messages'::regclass"))
+            if not partitioned:
+                return
+            if not await conn.scalar(text("SELECT pg_try_advisory_lock(hashtext(:key))"), {"key": ADVISORY_LOCK_KEY}):
+                return
+            try:
+                existing = await list_partitions(conn)
+                for name, start, end in missing_partitions(existing, now, self.months_ahead):
+                    await conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF messages "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    ))
+                    logger.info(f"Created messages partition {name}")
+
+                if self.retention_months > 0:
+                    leftovers = await detached_partitions(conn)
+                    for partition in expired_partitions(existing, now, self.retention_months):
+                        # A short lock_timeout keeps a blocked DETACH from stalling all writes
+                        await conn.execute(text("SET lock_timeout = '5s'"))
+                        await conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {partition.name}"))
+                        await conn.execute(text("RESET lock_timeout"))
+                        leftovers.append(partition.name)
+                    for name in leftovers:
+                        await self.archive(conn, name)
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": ADVISORY_LOCK_KEY})
+
+    async def archive(self, conn: AsyncConnection, name: str):
+        '''
+        Write a detached partition to archive_dir/<name>.ndjson.gz, then drop it.
+        '''
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        path = self.archive_dir / f"{name}.ndjson.gz"
+        partial = path.with_suffix(".gz.part")
+        compressor = zlib.compressobj(wbits=31)
+        archived = 0
+        # Server-side cursors need a transaction, which conn (autocommit) has not
+        async with self.engine.connect() as reader:
+            result = await reader.stream(
+                text(f"SELECT {', '.join(MESSAGE_FIELDS)} FROM {name} ORDER BY id"),
+                execution_options={"yield_per": ARCHIVE_BATCH_SIZE}
+            )
+            with open(partial, "wb") as output:
+                async for rows in result.partitions():
+                    archived += len(rows)
+                    output.write(compressor.compress(dump_messages_ndjson(rows)))
+                output.write(compressor.flush())
+                output.flush()
+                os.fsync(output.fileno())
+        partial.rename(path)
+
+        await conn.execute(text(f"DROP TABLE {name}"))
+        logger.info(f"Archived {archived} messages of partition {name} to {path}")
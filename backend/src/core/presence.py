@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+from .backplane import Backplane
+from .frames import Frame
+
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceBatcher:
+    '''
+    Collects users coming online or going offline and publishes them as one
+    joined/left delta per coalescing window. The delta is serialized once
+    and every recipient gets the same frame.
+    '''
+
+    def __init__(self, backplane: Backplane, window: float):
+        self.backplane = backplane
+        self.window = window
+        self._pending: dict[str, str] = {}
+        self._flush_task: asyncio.Task | None = None
+
+    def record(self, username: str, change: str):
+        opposite = "left" if change == "joined" else "joined"
+        if self._pending.get(username) == opposite:
+            # Joined and left again within one window: nobody needs to know
+            del self._pending[username]
+        else:
+            self._pending[username] = change
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        delta = {
+            "joined": [username for username, change in pending.items() if change == "joined"],
+            "left": [username for username, change in pending.items() if change == "left"],
+        }
+        logger.debug(f"Publishing presence delta: {len(delta['joined'])} joined, {len(delta['left'])} left")
+        await self.backplane.publish("presence", Frame.event("presence", delta).text)
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
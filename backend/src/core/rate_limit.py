@@ -0,0 +1,28 @@
+import logging
+
+from fastapi_limiter.depends import RateLimiter
+from redis.exceptions import NoScriptError, RedisError
+
+
+logger = logging.getLogger(__name__)
+
+
+class FailOpenRateLimiter(RateLimiter):
+    '''
+    RateLimiter that lets requests through while Redis is unreachable or
+    slower than its socket timeout, instead of failing them: an outage of
+    the limiter should not become an outage of the chat.
+    '''
+
+    allowed_unchecked = 0
+
+    async def _check(self, key):
+        try:
+            return await super()._check(key)
+        except NoScriptError:
+            # RateLimiter reloads the script and checks again
+            raise
+        except RedisError as e:
+            FailOpenRateLimiter.allowed_unchecked += 1
+            logger.warning(f"Rate limit not checked, Redis unavailable: {e}")
+            return 0
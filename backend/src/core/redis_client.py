@@ -1,10 +1,113 @@
+import bisect
 import logging
+import time
+
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
 
-from ..config import REDIS_HOST, REDIS_PORT
+from ..config import (
+    REDIS_HOST,
+    REDIS_PORT,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_SOCKET_TIMEOUT_MS,
+    REDIS_CONNECT_TIMEOUT_MS,
+    REDIS_RETRIES,
+    REDIS_RETRY_BACKOFF_MS,
+    REDIS_RETRY_BACKOFF_MAX_MS,
+    REDIS_HEALTH_CHECK_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds of the latency buckets, in milliseconds; the last bucket is everything slower
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LatencyHistograms:
+    '''
+    Per-command latency histograms with fixed buckets, cheap enough to
+    record every call: one bisect and two additions.
+    '''
+
+    def __init__(self, buckets_ms: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._counts: dict[str, list[int]] = {}
+        self._totals: dict[str, float] = {}
+        self.errors = 0
+
+    def observe(self, command: str, seconds: float):
+        elapsed_ms = seconds * 1000
+        counts = self._counts.get(command)
+        if counts is None:
+            counts = self._counts[command] = [0] * (len(self.buckets_ms) + 1)
+            self._totals[command] = 0.0
+        counts[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+        self._totals[command] += elapsed_ms
+
+    def stats(self):
+        labels = [f"le_{bound}ms" for bound in self.buckets_ms] + ["inf"]
+        return {
+            "errors": self.errors,
+            "commands": {
+                command: {
+                    "count": sum(counts),
+                    "total_ms": round(self._totals[command], 3),
+                    "buckets": dict(zip(labels, counts)),
+                }
+                for command, counts in self._counts.items()
+            },
+        }
+
+
+redis_latency = LatencyHistograms()
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        except redis.RedisError:
+            redis_latency.errors += 1
+            raise
+        finally:
+            redis_latency.observe("PIPELINE", time.perf_counter() - started)
+
+
+class InstrumentedRedis(redis.Redis):
+    '''
+    Redis client recording the latency of every command, and of every
+    pipeline as one PIPELINE round trip, in redis_latency.
+    '''
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        except redis.RedisError:
+            redis_latency.errors += 1
+            raise
+        finally:
+            redis_latency.observe(str(args[0]).upper(), time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
 redis_url = f"redis://{REDIS_HOST}:{REDIS_PORT}"
-redis_connection = redis.from_url(url=redis_url, decode_responses=True)
+# A blocking pool makes bursts wait for a free connection instead of failing;
+# timeouts keep a slow Redis from holding requests, which then fall back
+redis_pool = redis.BlockingConnectionPool.from_url(
+    redis_url,
+    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_CONNECT_TIMEOUT_MS / 1000,
+    socket_timeout=REDIS_SOCKET_TIMEOUT_MS / 1000,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT_MS / 1000,
+    retry=Retry(ExponentialBackoff(cap=REDIS_RETRY_BACKOFF_MAX_MS / 1000, base=REDIS_RETRY_BACKOFF_MS / 1000), REDIS_RETRIES),
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL
+)
+redis_connection = InstrumentedRedis(connection_pool=redis_pool)
 logger.debug("Initialized Redis connection")
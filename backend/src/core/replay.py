@@ -0,0 +1,31 @@
+from collections import deque
+from itertools import islice
+
+from .frames import Frame
+
+
+class ReplayBuffer:
+    '''
+    The latest sequenced room events this process delivered, as
+    (seq, room_id, frame). The buffer only ever holds consecutive numbers:
+    an event arriving after a gap (a lost backplane subscription) starts
+    it over, so whatever it returns has no holes.
+    '''
+
+    def __init__(self, size: int):
+        self._events: deque[tuple[int, int, Frame]] = deque(maxlen=size)
+
+    def append(self, seq: int, room_id: int, frame: Frame):
+        if self._events and seq != self._events[-1][0] + 1:
+            self._events.clear()
+        self._events.append((seq, room_id, frame))
+
+    def since(self, last_seq: int) -> list[tuple[int, int, Frame]] | None:
+        '''
+        The events numbered after last_seq, or None when the buffer does
+        not reach back that far.
+        '''
+        if not self._events or self._events[0][0] > last_seq + 1:
+            return None
+        start = max(last_seq + 1 - self._events[0][0], 0)
+        return list(islice(self._events, start, None))
@@ -0,0 +1,24 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    '''
+    Coalesces concurrent calls for the same key within this process:
+    the first caller runs the coroutine, later callers await its result.
+    '''
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        # shield: a cancelled waiter must not cancel the call the others wait for
+        return await asyncio.shield(self.start(key, fn))
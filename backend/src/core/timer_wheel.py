@@ -0,0 +1,85 @@
+import asyncio
+from collections.abc import Callable, Hashable
+from contextlib import suppress
+import logging
+import math
+
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    '''
+    One-shot timers for any number of objects, driven by a single task.
+    The wheel is a ring of slots, one per tick; a timer sits in the slot
+    of the tick it is due on, with the number of full turns still to
+    wait. Scheduling and cancelling are O(1) and a tick only looks at
+    one slot, so ten thousand sockets cost one wakeup per tick instead of
+    ten thousand sleeping tasks. Timers fire up to one tick late.
+
+    Callbacks are plain functions run on the wheel's task; anything slow
+    has to be started as a task of its own.
+    '''
+
+    def __init__(self, tick: float, slots: int = 512):
+        self.tick = tick
+        self._slots: list[dict[Hashable, tuple[int, Callable[[], None]]]] = [{} for _ in range(slots)]
+        self._slot_of: dict[Hashable, int] = {}
+        self._cursor = 0
+        self._task: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[[], None]):
+        '''
+        Run the callback once after delay seconds, replacing the key's pending timer.
+        '''
+        self.cancel(key)
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks - 1, len(self._slots))
+        index = (self._cursor + 1 + offset) % len(self._slots)
+        self._slots[index][key] = (rounds, callback)
+        self._slot_of[key] = index
+
+    def cancel(self, key: Hashable):
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self):
+        '''
+        Move one tick forward and run the timers that became due.
+        '''
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        slot = self._slots[self._cursor]
+        due = []
+        for key, (rounds, callback) in list(slot.items()):
+            if rounds:
+                slot[key] = (rounds - 1, callback)
+            else:
+                del slot[key]
+                del self._slot_of[key]
+                due.append(callback)
+
+        for callback in due:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Timer callback failed")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
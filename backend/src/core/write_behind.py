@@ -0,0 +1,130 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from contextlib import suppress
+from datetime import datetime, timezone
+import logging
+
+from sqlalchemy.ext.asyncio.session import async_sessionmaker
+
+from ..config import WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_FLUSH_MS, WRITE_BEHIND_MAX_PENDING
+from ..database.db import create_messages
+from ..schemas.room import DEFAULT_ROOM_ID
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ATTEMPTS = 3
+
+
+class MessageWriter:
+    '''
+    Batched persistence for chat messages. A background task stores
+    queued messages in batches of batch_size or every flush_interval
+    seconds, whichever comes first, and submit() returns the id once the
+    message's batch is committed. Ids come from the id sequence at insert
+    time, so they follow commit order like every other insert and the
+    message is only broadcast after it is stored. When max_pending
+    messages are waiting, submit() blocks; when a batch still fails after
+    FLUSH_ATTEMPTS tries, submit() raises for each message of it.
+    on_flush gets each stored batch, ids filled in, with the new message
+    log version of every room in it.
+    '''
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_MS / 1000,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        on_flush: Callable[[list[dict], dict[int, int]], Awaitable[None]] | None = None
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future]] = asyncio.Queue(maxsize=max_pending)
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        '''
+        Flush everything already submitted, then stop the background task.
+        '''
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        logger.info("Message writer flushed and stopped")
+
+    async def submit(
+        self,
+        content: str,
+        created_at: datetime | None,
+        created_by: str,
+        room_id: int = DEFAULT_ROOM_ID
+    ):
+        stored = asyncio.get_running_loop().create_future()
+        await self._queue.put(({
+            "content": content,
+            "created_at": created_at or datetime.now(timezone.utc),
+            "created_by": created_by,
+            "room_id": room_id,
+        }, stored))
+        # A sender that goes away must not cancel the outcome for the batch
+        return await asyncio.shield(stored)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list[tuple[dict, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                async with self.session_factory() as session:
+                    ids, versions = await create_messages(session, rows)
+                break
+            except Exception as e:
+                logger.exception(f"Failed to store {len(batch)} messages (attempt {attempt})")
+                if attempt == FLUSH_ATTEMPTS:
+                    logger.error(f"Rejected {len(batch)} messages after {FLUSH_ATTEMPTS} attempts")
+                    for _, stored in batch:
+                        if not stored.done():
+                            stored.set_exception(e)
+                            # Nobody may be left to retrieve it
+                            stored.exception()
+                    return
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+        for row, message_id in zip(rows, ids):
+            row["id"] = message_id
+        logger.debug(f"Stored {len(batch)} messages")
+        if self.on_flush is not None:
+            try:
+                await self.on_flush(rows, versions)
+            except Exception:
+                logger.exception("Message writer flush callback failed")
+        for row, stored in batch:
+            if not stored.done():
+                stored.set_result(row["id"])
@@ -1,42 +1,126 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import logging
+from pathlib import Path
 from passlib.context import CryptContext
 
-from sqlalchemy import select
+from alembic.config import Config as AlembicConfig
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from sqlalchemy import REAL, select, insert, update, func, text, literal, literal_column, cast, tuple_
 from sqlalchemy.ext.asyncio.engine import create_async_engine
 from sqlalchemy.ext.asyncio.session import async_sessionmaker, AsyncSession
 from sqlalchemy.exc import IntegrityError
 
-from ..config import DATABASE_URL
+from ..config import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URL,
+    DB_ECHO,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_APPLICATION_NAME,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_SCHEMA_CHECK,
+    EXPORT_BATCH_SIZE,
+    MESSAGES_CLOCK_SKEW_SECONDS,
+    IMPORT_BATCH_SIZE
+)
+from ..core.hashing import password_hasher
+from ..core.message_json import MESSAGE_FIELDS
 from .models.base import Base
-from .models.message import Message
+from .models.message import Message, MessageChange, MessageLogVersion
+from .models.room import Room
 from .models.user import User
+from ..schemas.room import DEFAULT_ROOM_ID
 
 from ..exceptions import (
     AuthenticationError,
     DuplicateUserError,
-    ChangingPasswordError
+    ChangingPasswordError,
+    DuplicateRoomError
 )
 
 
 logger = logging.getLogger(__name__)
+ALEMBIC_CONFIG_PATH = Path(__file__).resolve().parents[2] / "alembic.ini"
+# Text search configuration of the messages.search_vector column (see its migration)
+SEARCH_TEXT_CONFIG = "simple"
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-engine = create_async_engine(
-    url=DATABASE_URL, 
-    echo=True, 
-    echo_pool=True,
-    pool_size=20, 
-    max_overflow=0, 
-    pool_recycle=3600, 
-    pool_pre_ping=True
-)
 
+def create_engine(url: str):
+    '''
+    An engine with the profile from the environment. On asyncpg both the
+    driver's and SQLAlchemy's prepared statement caches get
+    DB_STATEMENT_CACHE_SIZE entries, and every connection reports
+    DB_APPLICATION_NAME and runs under DB_STATEMENT_TIMEOUT_MS.
+    '''
+    connect_args = {}
+    if url.startswith("postgresql+asyncpg"):
+        connect_args = {
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "server_settings": {
+                "application_name": DB_APPLICATION_NAME,
+                "statement_timeout": str(DB_STATEMENT_TIMEOUT_MS),
+            },
+        }
+    return create_async_engine(
+        url=url,
+        echo=DB_ECHO,
+        echo_pool=DB_ECHO,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=connect_args
+    )
+
+
+engine = create_engine(DATABASE_URL)
 SessionLocal = async_sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+# History reads that tolerate replication lag go to the replica when there is one.
+# The message cache, the changes feed and everything written stay on the primary,
+# so versions and ETags never go backwards.
+read_engine = create_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
+ReadSessionLocal = async_sessionmaker(bind=read_engine, autocommit=False, autoflush=False)
+
+
+async def dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+async def verify_schema():
+    '''
+    Check once at startup that the database is migrated to the Alembic head
+    (or create the tables outright when DB_SCHEMA_CHECK=create).
+    '''
+    if DB_SCHEMA_CHECK == "off":
+        return
+    if DB_SCHEMA_CHECK == "create":
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        return
+
+    script = ScriptDirectory.from_config(AlembicConfig(ALEMBIC_CONFIG_PATH))
+    expected = set(script.get_heads())
+    async with engine.connect() as conn:
+        current = set(await conn.run_sync(
+            lambda sync_conn: MigrationContext.configure(sync_conn).get_current_heads()
+        ))
+    if current != expected:
+        raise RuntimeError(
+            f"Database schema revision {sorted(current)} does not match Alembic head {sorted(expected)}; "
+            "run 'alembic upgrade head'"
+        )
+    logger.info(f"Database schema at revision {sorted(current)}")
+
+
 async def get_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
     async with SessionLocal() as session:
         try:
             yield session
@@ -48,56 +132,558 @@ async def get_db():
             await session.close()
 
 
-async def get_all_messages(session: AsyncSession):
-    stmt = select(Message).order_by(Message.id)
-    result = await session.execute(stmt)
-    messages = result.scalars().all()
-    
+async def get_read_db():
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        except Exception as e:
+            logger.exception("DB session error")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+
+def sent_by(username: str):
+    '''
+    Filter on the indexed sender_id instead of the created_by text.
+    '''
+    return Message.sender_id == select(User.id).where(User.username == username).scalar_subquery()
+
+
+async def get_user_ids(session: AsyncSession, usernames):
+    result = await session.execute(select(User.username, User.id).where(User.username.in_(set(usernames))))
+    return dict(result.all())
+
+
+async def stream_messages(
+    session: AsyncSession,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    created_by: str | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+):
+    '''
+    All messages in id order as batches of plain column rows, read through a
+    server-side cursor so only one batch is held in memory at a time.
+    since/until bound created_at (inclusive/exclusive).
+    '''
+    stmt = select(*(Message.__table__.c[field] for field in MESSAGE_FIELDS)).order_by(Message.id)
+    if since is not None:
+        stmt = stmt.where(Message.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(Message.created_at < until)
+    if created_by is not None:
+        stmt = stmt.where(sent_by(created_by))
+
+    result = await session.stream(stmt.execution_options(yield_per=batch_size))
+    async for rows in result.partitions():
+        yield rows
+
+
+def clamp_created_at(created_at: datetime | None):
+    '''
+    A client-supplied message time within MESSAGES_CLOCK_SKEW_SECONDS of
+    server time (naive times are UTC), or the server time when missing.
+    '''
+    now = datetime.now(timezone.utc)
+    if created_at is None:
+        return now
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    skew = timedelta(seconds=MESSAGES_CLOCK_SKEW_SECONDS)
+    return min(max(created_at, now - skew), now + skew)
+
+
+async def get_messages_page(
+    session: AsyncSession,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    limit: int = 50,
+    room_id: int = DEFAULT_ROOM_ID
+):
+    '''
+    Rows of plain message columns (no ORM objects) of one room in ascending
+    id order, and whether another page follows in the same direction.
+    '''
+    stmt = select(*(Message.__table__.c[field] for field in MESSAGE_FIELDS)).where(Message.room_id == room_id)
+    if after_id is not None:
+        stmt = stmt.where(Message.id > after_id).order_by(Message.id.asc())
+    else:
+        if before_id is not None:
+            stmt = stmt.where(Message.id < before_id)
+        stmt = stmt.order_by(Message.id.desc())
+
+    cursor_created_at = None
+    if before_id is not None or after_id:
+        result = await session.execute(select(Message.created_at).where(Message.id == (after_id or before_id)))
+        cursor_created_at = result.scalar_one_or_none()
+
+    # One extra row tells whether another page exists in the same direction
+    if cursor_created_at is None:
+        messages = list((await session.execute(stmt.limit(limit + 1))).all())
+    else:
+        messages = await _bounded_page(session, stmt, cursor_created_at, before_id, after_id, limit, room_id)
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after_id is None:
+        messages.reverse()
+
+    return messages, has_more
+
+
+async def _bounded_page(
+    session: AsyncSession,
+    stmt,
+    cursor_created_at: datetime,
+    before_id: int | None,
+    after_id: int | None,
+    limit: int,
+    room_id: int
+):
+    '''
+    The page bounded by created_at around the cursor's time, so PostgreSQL
+    prunes the month partitions it cannot reach. Times only roughly follow
+    ids (old rows, imports), so the id span the page covers is checked for
+    rows outside the bound; when there are any the page is read unbounded.
+    '''
+    window = timedelta(seconds=3 * MESSAGES_CLOCK_SKEW_SECONDS)
+    if after_id is not None:
+        bound = Message.created_at >= cursor_created_at - window
+        span = [Message.id > after_id]
+    else:
+        bound = Message.created_at <= cursor_created_at + window
+        span = [Message.id < before_id]
+
+    messages = list((await session.execute(stmt.where(bound).limit(limit + 1))).all())
+    if len(messages) > limit:
+        last_id = messages[-1].id
+        span.append(Message.id < last_id if after_id is not None else Message.id > last_id)
+    # The complement prunes to the other partitions and stops at the first row
+    outside = select(Message.id).where(Message.room_id == room_id, *span, ~bound).limit(1)
+    if (await session.execute(outside)).first() is not None:
+        messages = list((await session.execute(stmt.limit(limit + 1))).all())
     return messages
 
 
+async def get_messages_version(session: AsyncSession, room_id: int = DEFAULT_ROOM_ID):
+    result = await session.execute(select(MessageLogVersion.version).filter_by(id=room_id))
+    return result.scalar_one_or_none() or 0
+
+
+async def bump_messages_version(
+    session: AsyncSession,
+    change: str,
+    message_ids: list[int],
+    room_id: int = DEFAULT_ROOM_ID
+):
+    '''
+    Take the next version of the room's message log and record which
+    messages it changed. The counter row stays locked until the caller
+    commits, so versions become visible in the order they were taken.
+    '''
+    stmt = (
+        update(MessageLogVersion)
+        .filter_by(id=room_id)
+        .values(version=MessageLogVersion.version + 1)
+        .returning(MessageLogVersion.version)
+    )
+    version = (await session.execute(stmt)).scalar_one_or_none()
+    if version is None:
+        version = 1
+        session.add(MessageLogVersion(id=room_id, version=version))
+        await session.flush()
+    if message_ids:
+        await session.execute(insert(MessageChange), [
+            {"room_id": room_id, "version": version, "message_id": message_id, "change": change}
+            for message_id in message_ids
+        ])
+
+    return version
+
+
+async def get_message_changes(session: AsyncSession, since_version: int, room_id: int = DEFAULT_ROOM_ID):
+    '''
+    Ids of the messages of a room created, updated and deleted after
+    since_version, the current version, and whether the client has to
+    reload instead because the changes after since_version are pruned.
+    A message created and deleted in that span is left out; one created
+    and then edited is only reported as created.
+    '''
+    result = await session.execute(
+        select(MessageLogVersion.version, MessageLogVersion.pruned_version).filter_by(id=room_id)
+    )
+    version, pruned_version = result.one_or_none() or (0, 0)
+    if since_version < pruned_version:
+        return version, [], [], [], True
+    stmt = (
+        select(MessageChange.message_id, MessageChange.change)
+        .where(
+            MessageChange.room_id == room_id,
+            MessageChange.version > since_version,
+            MessageChange.version <= version
+        )
+        .order_by(MessageChange.version)
+    )
+    result = await session.execute(stmt)
+
+    created, updated, deleted = set(), set(), set()
+    for message_id, change in result:
+        if change == "created":
+            created.add(message_id)
+        elif change == "updated":
+            if message_id not in created:
+                updated.add(message_id)
+        elif message_id in created:
+            created.discard(message_id)
+        else:
+            updated.discard(message_id)
+            deleted.add(message_id)
+
+    return version, sorted(created), sorted(updated), sorted(deleted), False
+
+
+async def prune_message_changes(session: AsyncSession, keep_versions: int):
+    '''
+    Delete the change rows of every room older than its last keep_versions
+    versions and remember up to where, so get_message_changes can tell
+    clients behind that point to reload. Returns the number of rows deleted.
+    '''
+    stmt = (
+        update(MessageLogVersion)
+        .where(MessageLogVersion.version - keep_versions > MessageLogVersion.pruned_version)
+        .values(pruned_version=MessageLogVersion.version - keep_versions)
+        .returning(MessageLogVersion.id, MessageLogVersion.pruned_version)
+    )
+    pruned = (await session.execute(stmt)).all()
+    deleted = 0
+    for room_id, pruned_version in pruned:
+        result = await session.execute(
+            MessageChange.__table__.delete()
+            .where(MessageChange.room_id == room_id, MessageChange.version <= pruned_version)
+        )
+        deleted += result.rowcount
+    await session.commit()
+
+    return deleted
+
+
+async def search_messages(
+    session: AsyncSession,
+    query: str,
+    created_by: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    order: str = "rank",
+    after: tuple[float, int] | None = None,
+    limit: int = 20,
+    room_id: int | None = None
+):
+    '''
+    Messages matching a web-search style query, best first (order="rank")
+    or newest first (order="recent"), with their rank, and whether more
+    results follow. after is the (rank, id) of the last result already seen.
+    Searches every room unless room_id is given.
+
+    PostgreSQL matches the GIN-indexed search_vector column; other dialects
+    (SQLite in tests) fall back to a substring LIKE with rank 0.
+    '''
+    if session.bind.dialect.name == "postgresql":
+        search_vector = literal_column("messages.search_vector")
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{SEARCH_TEXT_CONFIG}'::regconfig"), query)
+        match = search_vector.op("@@")(tsquery)
+        rank = func.ts_rank(search_vector, tsquery)
+    else:
+        pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        match = Message.content.like(f"%{pattern}%", escape="\\")
+        rank = cast(literal(0.0), REAL)
+
+    stmt = select(*(Message.__table__.c[field] for field in MESSAGE_FIELDS), rank.label("rank")).where(match)
+    if created_by is not None:
+        stmt = stmt.where(sent_by(created_by))
+    if room_id is not None:
+        stmt = stmt.where(Message.room_id == room_id)
+    if since is not None:
+        stmt = stmt.where(Message.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(Message.created_at < until)
+
+    if order == "rank":
+        if after is not None:
+            stmt = stmt.where(tuple_(rank, Message.id) < tuple_(cast(after[0], REAL), after[1]))
+        stmt = stmt.order_by(rank.desc(), Message.id.desc())
+    else:
+        if after is not None:
+            stmt = stmt.where(Message.id < after[1])
+        stmt = stmt.order_by(Message.id.desc())
+
+    result = await session.execute(stmt.limit(limit + 1))
+    messages = list(result.all())
+
+    return messages[:limit], len(messages) > limit
+
+
 async def create_message(
     session: AsyncSession,
     content: str,
     created_at: datetime,
-    created_by: str
+    created_by: str,
+    room_id: int = DEFAULT_ROOM_ID
 ):
     db_message = Message(
         content=content,
         created_at=created_at,
-        created_by=created_by
+        created_by=created_by,
+        room_id=room_id,
+        sender_id=select(User.id).where(User.username == created_by).scalar_subquery()
     )
     
     session.add(db_message)
+    await session.flush()
+    version = await bump_messages_version(session, "created", [db_message.id], room_id)
     await session.commit()
     await session.refresh(db_message)
 
-    return db_message
+    return db_message, version
+
+
+async def create_messages(session: AsyncSession, messages: list[dict]):
+    '''
+    Store a batch of messages with one multi-row INSERT ... RETURNING.
+    The messages of each room share one version of that room's log;
+    returns the ids and the version per room.
+    '''
+    sender_ids = await get_user_ids(session, (message["created_by"] for message in messages))
+    rows = [
+        {**message, "room_id": message.get("room_id", DEFAULT_ROOM_ID), "sender_id": sender_ids.get(message["created_by"])}
+        for message in messages
+    ]
+    result = await session.execute(insert(Message).returning(Message.id, sort_by_parameter_order=True), rows)
+    ids = result.scalars().all()
+    versions = await bump_room_versions(session, (row["room_id"] for row in rows), ids)
+    await session.commit()
+
+    return ids, versions
+
+
+async def bump_room_versions(session: AsyncSession, room_ids, message_ids: list[int]):
+    '''
+    One "created" version per room for messages inserted together;
+    room_ids runs parallel to message_ids. Rooms are bumped in id order so
+    concurrent batches lock the counter rows in the same order.
+    '''
+    by_room: dict[int, list[int]] = {}
+    for room_id, message_id in zip(room_ids, message_ids):
+        by_room.setdefault(room_id, []).append(message_id)
+    return {
+        room_id: await bump_messages_version(session, "created", by_room[room_id], room_id)
+        for room_id in sorted(by_room)
+    }
+
+
+async def reserve_message_ids(session: AsyncSession, count: int):
+    '''
+    Take a block of ids for messages that will be inserted later.
+    On PostgreSQL the ids come from the messages id sequence; other
+    dialects (SQLite in tests) count up from the current maximum.
+    '''
+    if session.bind.dialect.name == "postgresql":
+        stmt = text("SELECT nextval(pg_get_serial_sequence('messages', 'id')) FROM generate_series(1, :count)")
+        result = await session.execute(stmt, {"count": count})
+        return [row[0] for row in result]
+
+    result = await session.execute(select(func.coalesce(func.max(Message.id), 0)))
+    start = result.scalar_one() + 1
+    return list(range(start, start + count))
+
+
+async def copy_messages(session: AsyncSession, rows: list[dict]):
+    '''
+    Bulk insert one batch of messages and commit it as one version of each
+    room's message log; returns the version per room. PostgreSQL gets the
+    rows through COPY; other dialects (SQLite in tests) through an
+    executemany INSERT. Rows without an id take one from the id sequence;
+    explicit ids are kept, so call sync_message_id_sequence afterwards.
+    '''
+    missing = [row for row in rows if row.get("id") is None]
+    if missing:
+        for row, message_id in zip(missing, await reserve_message_ids(session, len(missing))):
+            row["id"] = message_id
+    sender_ids = await get_user_ids(session, (row["created_by"] for row in rows))
+    for row in rows:
+        row["sender_id"] = sender_ids.get(row["created_by"])
+        row["room_id"] = row.get("room_id") or DEFAULT_ROOM_ID
+    versions = {
+        room_id: await bump_messages_version(session, "created", [], room_id)
+        for room_id in sorted({row["room_id"] for row in rows})
+    }
+    changes = [
+        {"room_id": row["room_id"], "version": versions[row["room_id"]], "message_id": row["id"], "change": "created"}
+        for row in rows
+    ]
+
+    columns = (*MESSAGE_FIELDS, "sender_id")
+    if session.bind.dialect.name == "postgresql":
+        connection = await (await session.connection()).get_raw_connection()
+        driver = connection.driver_connection
+        await driver.copy_records_to_table("messages", columns=columns, records=[
+            tuple(row.get(column) for column in columns) for row in rows
+        ])
+        change_columns = ("room_id", "version", "message_id", "change")
+        await driver.copy_records_to_table("message_changes", columns=change_columns, records=[
+            tuple(change[column] for column in change_columns) for change in changes
+        ])
+    else:
+        await session.execute(insert(Message), [{column: row.get(column) for column in columns} for row in rows])
+        await session.execute(insert(MessageChange), changes)
+    await session.commit()
+
+    return versions
+
+
+async def backfill_message_senders(session: AsyncSession, batch_size: int = IMPORT_BATCH_SIZE):
+    '''
+    Fill messages.sender_id from created_by in short transactions of
+    batch_size ids each, so it can run while the app is serving; running it
+    again resumes where sender_id is still null. Validates the foreign key
+    afterwards on PostgreSQL. Returns the number of updated messages.
+    '''
+    updated = 0
+    last_id = 0
+    while True:
+        window = select(Message.id).where(Message.id > last_id).order_by(Message.id).limit(batch_size).subquery()
+        upto = (await session.execute(select(func.max(window.c.id)))).scalar_one_or_none()
+        if upto is None:
+            break
+        stmt = (
+            update(Message)
+            .values(sender_id=User.id)
+            .where(
+                User.username == Message.created_by,
+                Message.id > last_id,
+                Message.id <= upto,
+                Message.sender_id.is_(None)
+            )
+        )
+        result = await session.execute(stmt, execution_options={"synchronize_session": False})
+        await session.commit()
+        updated += result.rowcount
+        last_id = upto
+        logger.info(f"Backfilled message senders up to id {last_id}")
+
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text("ALTER TABLE messages VALIDATE CONSTRAINT fk_messages_sender_id_users"))
+        await session.commit()
+
+    return updated
+
+
+async def backfill_message_search(session: AsyncSession, batch_size: int = IMPORT_BATCH_SIZE):
+    '''
+    Fill messages.search_vector of the rows stored before the full text
+    search migration, in short transactions of batch_size ids each like
+    backfill_message_senders; newer rows get it from the trigger. Only
+    PostgreSQL has the column. Returns the number of updated messages.
+    '''
+    if session.bind.dialect.name != "postgresql":
+        return 0
+
+    updated = 0
+    last_id = 0
+    stmt = text(
+        "UPDATE messages SET search_vector = to_tsvector(CAST(:config AS regconfig), content) "
+        "WHERE id > :last_id AND id <= :upto AND search_vector IS NULL"
+    )
+    while True:
+        window = select(Message.id).where(Message.id > last_id).order_by(Message.id).limit(batch_size).subquery()
+        upto = (await session.execute(select(func.max(window.c.id)))).scalar_one_or_none()
+        if upto is None:
+            break
+        result = await session.execute(stmt, {"config": SEARCH_TEXT_CONFIG, "last_id": last_id, "upto": upto})
+        await session.commit()
+        updated += result.rowcount
+        last_id = upto
+        logger.info(f"Backfilled message search vectors up to id {last_id}")
+
+    return updated
+
+
+async def sync_message_id_sequence(session: AsyncSession):
+    '''
+    Move the messages id sequence past the highest stored id. It never
+    moves back, since ids handed out earlier may not be stored yet.
+    '''
+    if session.bind.dialect.name != "postgresql":
+        return
+    await session.execute(text(
+        "SELECT setval(pg_get_serial_sequence('messages', 'id'), "
+        "greatest(coalesce(max(id), 0), nextval(pg_get_serial_sequence('messages', 'id')))) FROM messages"
+    ))
+    await session.commit()
 
 
 async def delete_message_from_db(session: AsyncSession, id: int):
+    '''
+    Returns whether the message was deleted, the new version of its room's
+    message log and the room.
+    '''
     stmt = select(Message).filter_by(id=id)
     result = await session.execute(stmt)
     message = result.scalar_one()
 
     if message:
+        room_id = message.room_id
         await session.delete(message)
+        version = await bump_messages_version(session, "deleted", [id], room_id)
         await session.commit()
-        return True
-    return False
+        return True, version, room_id
+    return False, None, None
 
 
-async def update_message_from_db(session: AsyncSession, id: int, content: str):
+async def update_message_from_db(session: AsyncSession, id: int, content: str, updated_at: datetime | None = None):
+    '''
+    Returns whether the message was updated, the new version of its room's
+    message log and the room.
+    '''
     stmt = select(Message).filter_by(id=id)
     result = await session.execute(stmt)
     message = result.scalar_one()
 
     if message:
+        room_id = message.room_id
         message.content = content
-        message.updated_at = datetime.now(timezone.utc)
+        message.updated_at = updated_at or datetime.now(timezone.utc)
+        version = await bump_messages_version(session, "updated", [id], room_id)
+        await session.commit()
+        return True, version, room_id
+    return False, None, None
+
+
+async def get_rooms(session: AsyncSession):
+    result = await session.execute(select(Room).order_by(Room.id))
+    return result.scalars().all()
+
+
+async def get_room(session: AsyncSession, room_id: int):
+    return await session.get(Room, room_id)
+
+
+async def create_room(session: AsyncSession, name: str, created_by: str | None = None):
+    '''
+    Create a room together with the counter row of its message log.
+    '''
+    room = Room(name=name, created_at=datetime.now(timezone.utc), created_by=created_by)
+    try:
+        session.add(room)
+        await session.flush()
+        session.add(MessageLogVersion(id=room.id, version=0))
         await session.commit()
-        return True
-    return False
+        await session.refresh(room)
+    except IntegrityError:
+        await session.rollback()
+        raise DuplicateRoomError(name=name)
+
+    return room
 
 
 def get_password_hash(password: str):
@@ -118,13 +704,13 @@ async def get_by_username(session: AsyncSession, username: str):
 
 async def authenticate_user(session: AsyncSession, username: str, password: str):
     user = await get_by_username(session, username)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await password_hasher.run(verify_password, password, user.hashed_password):
         raise AuthenticationError(username=username)
     return user 
 
 
 async def create_user(session: AsyncSession, username: str, password: str):
-    hashed_password = get_password_hash(password)
+    hashed_password = await password_hasher.run(get_password_hash, password)
     user = User(username=username, hashed_password=hashed_password)
     try:
         session.add(user)
@@ -140,9 +726,9 @@ async def create_user(session: AsyncSession, username: str, password: str):
 async def change_password_in_db(session: AsyncSession, username: str, old_password: str, new_password: str):
     user = await get_by_username(session, username)
 
-    if not user or not verify_password(old_password, user.hashed_password):
+    if not user or not await password_hasher.run(verify_password, old_password, user.hashed_password):
         raise ChangingPasswordError(username=username)
-    user.hashed_password = get_password_hash(new_password)
+    user.hashed_password = await password_hasher.run(get_password_hash, new_password)
     await session.commit()
     
     return True
\ No newline at end of file
@@ -1,18 +1,35 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, BigInteger, ForeignKey, Index
 from sqlalchemy.types import TIMESTAMP
 
 from .base import Base
+from .room import Room
 from ...schemas.message import MessageListResponse
+from ...schemas.room import DEFAULT_ROOM_ID
 
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        Index('ix_messages_created_at_id', 'created_at', 'id'),
+        Index('ix_messages_sender_id_id', 'sender_id', 'id'),
+        Index('ix_messages_room_id_id', 'room_id', 'id'),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     content = Column(String, nullable=False)
     created_at = Column(type_=TIMESTAMP(timezone=True), nullable=False)
     updated_at = Column(type_=TIMESTAMP(timezone=True), default=None)
     created_by = Column(String, nullable=False)
+    # Null until backfilled (python -m src.cli backfill-senders) or when no user has that name
+    sender_id = Column(Integer, ForeignKey('users.id', name='fk_messages_sender_id_users'), nullable=True)
+    room_id = Column(
+        Integer, ForeignKey(Room.id, name='fk_messages_room_id_rooms'),
+        nullable=False, default=DEFAULT_ROOM_ID, server_default=str(DEFAULT_ROOM_ID)
+    )
+    # PostgreSQL also has the search_vector column (GIN-indexed, filled by a trigger),
+    # see the full text search migration and search_messages(). There the
+    # table is partitioned by month of created_at with the primary key
+    # (id, created_at), see the partitioning migration and core/partitions.py
 
 
     def to_pydantic(self):
@@ -21,5 +38,25 @@ class Message(Base):
             content=self.content,
             created_at=self.created_at,
             updated_at=self.updated_at,
-            created_by=self.created_by        
-        )
\ No newline at end of file
+            created_by=self.created_by,
+            room_id=self.room_id
+        )
+
+
+class MessageLogVersion(Base):
+    __tablename__ = 'message_log_version'
+
+    # One counter row per room, keyed by the room id
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False, default=0)
+    # Changes up to this version are pruned; syncing from before it needs a full reload
+    pruned_version = Column(BigInteger, nullable=False, default=0, server_default='0')
+
+
+class MessageChange(Base):
+    __tablename__ = 'message_changes'
+
+    room_id = Column(Integer, primary_key=True, default=DEFAULT_ROOM_ID, server_default=str(DEFAULT_ROOM_ID))
+    version = Column(BigInteger, primary_key=True)
+    message_id = Column(Integer, primary_key=True)
+    change = Column(String(7), nullable=False)
@@ -0,0 +1,25 @@
+from sqlalchemy import DDL, Column, Integer, String, event
+from sqlalchemy.types import TIMESTAMP
+
+from .base import Base
+from ...schemas.room import DEFAULT_ROOM_ID, RoomResponse
+
+
+class Room(Base):
+    __tablename__ = "rooms"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+    created_at = Column(type_=TIMESTAMP(timezone=True), nullable=False)
+    created_by = Column(String, nullable=True)
+
+
+    def to_pydantic(self):
+        return RoomResponse(id=self.id, name=self.name, created_at=self.created_at, created_by=self.created_by)
+
+
+# Same default room as the rooms migration when the tables are created from
+# the models (DB_SCHEMA_CHECK=create, tests)
+event.listen(Room.__table__, "after_create", DDL(
+    f"INSERT INTO rooms (id, name, created_at) VALUES ({DEFAULT_ROOM_ID}, 'general', CURRENT_TIMESTAMP)"
+))
@@ -1,12 +1,19 @@
 from typing import Annotated
 from fastapi import Depends
 
-from .utils import oauth2_scheme, verify_token
+from .config import ADMIN_USERNAMES
+from .exceptions import AdminRequiredError
 from .schemas.user import TokenData
+from .utils import oauth2_scheme, verified_token, token_revocations
 
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    payload = verify_token(token)
-    username = payload.get("sub")
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    verified = verified_token(token)
+    await token_revocations.check(verified)
+    return verified.user
 
-    return TokenData(username=username)
\ No newline at end of file
+
+def get_admin_user(user: Annotated[TokenData, Depends(get_current_user)]):
+    if user.username not in ADMIN_USERNAMES:
+        raise AdminRequiredError(username=user.username)
+    return user
@@ -43,3 +43,70 @@ class ChangingPasswordError(UserException):
                 "X-Error-Code": "CHANGING_PASSWORD"
             },
         )
+
+
+class InvalidCursorError(UserException):
+    def __init__(self, cursor: str):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Pagination cursor {cursor} is malformed or conflicts with other paging parameters",
+            headers={
+                "X-Error-Code": "INVALID_CURSOR"
+            },
+        )
+
+
+class PasswordHashingOverloadedError(UserException):
+    def __init__(self, pending: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many password checks in progress ({pending}), try again later",
+            headers={
+                "Retry-After": "1",
+                "X-Error-Code": "PASSWORD_HASHING_OVERLOADED"
+            },
+        )
+
+
+class AdminRequiredError(UserException):
+    def __init__(self, username: str):
+        super().__init__(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"User {username} is not an administrator",
+            headers={
+                "X-Error-Code": "ADMIN_REQUIRED"
+            },
+        )
+
+
+class InvalidImportRecordError(UserException):
+    def __init__(self, line: int):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Import record on line {line} is not a valid message",
+            headers={
+                "X-Error-Code": "INVALID_IMPORT_RECORD"
+            },
+        )
+
+
+class DuplicateRoomError(UserException):
+    def __init__(self, name: str):
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Room with name {name} already exists",
+            headers={
+                "X-Error-Code": "ROOM_DUPLICATE"
+            },
+        )
+
+
+class RoomNotFoundError(UserException):
+    def __init__(self, room_id: int, line: int | None = None):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Room {room_id} does not exist" + (f" (import record on line {line})" if line else ""),
+            headers={
+                "X-Error-Code": "ROOM_NOT_FOUND"
+            },
+        )
@@ -1,27 +1,41 @@
-from typing import Annotated
-import json
+from typing import Annotated, Literal
+from datetime import datetime, timezone
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, WebSocket, WebSocketDisconnect, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Header, WebSocket, WebSocketDisconnect, Response, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.ext.asyncio.session import AsyncSession
+from pydantic import ValidationError
+from redis.exceptions import RedisError
 from secure import Secure
-from fastapi.encoders import jsonable_encoder
 
 from ..database.db import (
+    SessionLocal,
+    ReadSessionLocal,
     authenticate_user,
     create_user,
     get_db,
-    get_all_messages,
+    get_read_db,
+    get_messages_page,
+    get_messages_version,
+    get_message_changes,
+    search_messages,
     create_message,
+    clamp_created_at,
     delete_message_from_db,
     update_message_from_db,
-    change_password_in_db
+    change_password_in_db,
+    get_rooms,
+    get_room,
+    create_room
 )
 
 from ..schemas.message import (
     MessageListResponse,
+    MessageChangesResponse,
+    MessageSearchResponse,
+    ImportMessagesResponse,
     CreateMessageRequest,
     CreateMessageResponse,
     DeleteMessageRequest,
@@ -29,6 +43,13 @@ from ..schemas.message import (
     UpdateMessageRequest,
     UpdateMessageResponse
 )
+from ..schemas.room import (
+    DEFAULT_ROOM_ID,
+    RoomResponse,
+    RoomListResponse,
+    CreateRoomRequest
+)
+from ..schemas.ws import ClientEnvelope
 from ..schemas.user import (
     TokenResponse,
     UserRequest,
@@ -38,46 +59,88 @@ from ..schemas.user import (
 )
 
 from ..core.redis_client import redis_connection
+from ..core.connection_manager import ConnectionManager
+from ..core.backplane import create_backplane
+from ..core.frames import Frame, SUBPROTOCOL_MSGPACK, msgpack, negotiate_subprotocol
+from ..core.write_behind import MessageWriter
+from ..core.message_cache import CachedPage, MessageCache, RoomMessageCaches
+from ..core.rate_limit import FailOpenRateLimiter
+from ..core.message_json import MESSAGE_FIELDS, dump_message, dump_messages_page
+from ..core.export import export_messages, MEDIA_TYPES
+from ..core.bulk_import import import_messages, ndjson_records
+
+from ..utils import (
+    create_access_token,
+    encode_cursor,
+    decode_cursor,
+    encode_search_cursor,
+    decode_search_cursor,
+    token_revocations
+)
+
+from ..dependencies import get_current_user, get_admin_user
 
-from ..utils import create_access_token
+from ..exceptions import InvalidCursorError, RoomNotFoundError
 
-from ..dependencies import get_current_user
+from ..config import WS_BACKPLANE, WS_MAX_FRAME_BYTES
 
 
-CACHE_KEY_MESSAGES = "chat:messages"
+MESSAGES_PAGE_DEFAULT_LIMIT = 50
+MESSAGES_PAGE_MAX_LIMIT = 200
+SEARCH_PAGE_DEFAULT_LIMIT = 20
 
 logger = logging.getLogger(__name__)
 
-class ConnectionManager:
-    def __init__(self):
-        self.activate_connections: dict[WebSocket, str] = {}
+manager = ConnectionManager(backplane=create_backplane(WS_BACKPLANE))
 
-    async def connect(self, websocket: WebSocket, username: str):
-        await websocket.accept()
-        self.activate_connections[websocket] = username
-        await self.broadcast_userlist()
 
-    async def disconnect(self, websocket: WebSocket):
-        del self.activate_connections[websocket]
-        await self.broadcast_userlist()
+def latest_messages_loader(session_factory, room_id: int = DEFAULT_ROOM_ID):
+    async def load(limit: int):
+        async with session_factory() as session:
+            version = await get_messages_version(session, room_id)
+            rows, has_more = await get_messages_page(session, limit=limit, room_id=room_id)
+        return {row.id: dump_message(row) for row in rows}, not has_more, version
+    return load
 
-    async def broadcast(self, message: str):
-        for connection in self.activate_connections:
-            await connection.send_text(message)
 
-    async def broadcast_userlist(self):
-        for connection in self.activate_connections:
-            message = json.dumps({"userlist": list(self.activate_connections.values())})
-            await connection.send_text(message)
+message_caches = RoomMessageCaches(redis_connection, lambda room_id: latest_messages_loader(SessionLocal, room_id))
 
 
-manager = ConnectionManager()
+async def append_to_messages_cache(batch: list[dict], versions: dict[int, int]):
+    await message_caches.append_rooms({
+        room_id: ({row["id"]: dump_message(row) for row in batch if row["room_id"] == room_id}, version)
+        for room_id, version in versions.items()
+    })
+
+
+message_writer = MessageWriter(SessionLocal, on_flush=append_to_messages_cache)
 
 router = APIRouter()
 
 secure_headers = Secure.with_default_headers()
 
-limiter = RateLimiter(times=100, seconds=60)
+limiter = FailOpenRateLimiter(times=100, seconds=60)
+
+def _page_link(request: Request, cursor: str, limit: int):
+    url = request.url.remove_query_params(["before_id", "after_id", "cursor", "limit"])
+    return str(url.include_query_params(cursor=cursor, limit=limit))
+
+
+def _raw_response(response: Response, etag: str | None, body: bytes = b"", status_code: int = 200):
+    '''
+    Turn the injected response (which already carries the secure headers)
+    into the final one with a pre-serialized JSON body.
+    '''
+    response.status_code = status_code
+    response.body = body
+    if etag is not None:
+        response.headers["ETag"] = etag
+    if status_code == 304:
+        del response.headers["content-length"]
+    else:
+        response.headers["content-type"] = "application/json"
+        response.headers["content-length"] = str(len(body))
+    return response
 
 
 @router.post('/sign-up', response_model=UserResponse, dependencies=[Depends(limiter)])
@@ -125,56 +188,275 @@ async def change_password(
 ):
     '''
     Change user password.
-    Validates old password and updates to new password.
+    Validates old password and updates to new password; tokens issued
+    before the change stop working on every worker.
     '''
     secure_headers.set_headers(response)
 
     success = await change_password_in_db(session, request.username, request.old_password, request.new_password)
+    await token_revocations.revoke_user(request.username)
     
     logger.info("Password changed")
     return ChangeUserPasswordResponse(success=success)
 
 
+@router.get('/rooms', response_model=RoomListResponse, dependencies=[Depends(limiter)])
+async def list_rooms(
+    response: Response,
+    user: Annotated[get_current_user, Depends()],
+    session: Annotated[AsyncSession, Depends(get_db)]
+):
+    '''
+    List the rooms of the chat.
+    '''
+    secure_headers.set_headers(response)
+
+    rooms = await get_rooms(session)
+    return RoomListResponse(rooms=[room.to_pydantic() for room in rooms])
+
+
+@router.post('/rooms', response_model=RoomResponse, dependencies=[Depends(limiter)])
+async def add_room(
+    response: Response,
+    user: Annotated[get_current_user, Depends()],
+    room_request: Annotated[CreateRoomRequest, Body],
+    session: Annotated[AsyncSession, Depends(get_db)]
+):
+    '''
+    Create a new room. Clients join it by subscribing over the WebSocket.
+    '''
+    secure_headers.set_headers(response)
+
+    room = await create_room(session, room_request.name, user.username)
+
+    logger.info("Room created")
+    return room.to_pydantic()
+
+
 @router.get('/messages', response_model=MessageListResponse, dependencies=[Depends(limiter)])
 async def get_messages(
+    request: Request,
     response: Response, 
     user: Annotated[get_current_user, Depends()],
-    session: Annotated[AsyncSession, Depends(get_db)]
+    session: Annotated[AsyncSession, Depends(get_db)],
+    read_session: Annotated[AsyncSession, Depends(get_read_db)],
+    before_id: Annotated[int | None, Query(ge=1)] = None,
+    after_id: Annotated[int | None, Query(ge=0)] = None,
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=MESSAGES_PAGE_MAX_LIMIT)] = MESSAGES_PAGE_DEFAULT_LIMIT,
+    room_id: Annotated[int, Query(ge=1)] = DEFAULT_ROOM_ID,
+    if_none_match: Annotated[str | None, Header()] = None
 ):
     '''
-    Retrieve all messages from the chat.
-    Returns a list of all messages with their details including id, sender, content, and timestamp.
-    Results are cached in Redis for 1 hour.
+    Retrieve a page of messages of one room (the default room unless
+    room_id is given), ordered by id.
+    Without paging parameters returns the latest page. Use before_id/after_id
+    or the opaque cursor from next/prev links to walk the history.
+    Pages within the most recent MESSAGES_CACHE_WINDOW messages of the room are served from Redis,
+    and repeated reads of a page for MESSAGES_LOCAL_CACHE_TTL_MS from the worker's memory.
+    Otherwise the version and the latest pages come from the primary; only pages
+    before a given id are read from the replica when one is configured.
+    The ETag follows the room's message log version; a matching If-None-Match gets 304.
     '''
     secure_headers.set_headers(response)
 
-    cached_messages_json = await redis_connection.get(CACHE_KEY_MESSAGES)
-    if cached_messages_json:
-        cached_payload = json.loads(cached_messages_json)
-        response.headers["X-Cache"] = "HIT"
-        logger.debug("Messages cache hit")
-        return MessageListResponse(**cached_payload)
+    if cursor is not None:
+        if before_id is not None or after_id is not None:
+            raise InvalidCursorError(cursor=cursor)
+        direction, message_id = decode_cursor(cursor)
+        if direction == "before":
+            before_id = message_id
+        else:
+            after_id = message_id
+    elif before_id is not None and after_id is not None:
+        raise InvalidCursorError(cursor=f"before_id={before_id}&after_id={after_id}")
+    await _require_room(session, room_id)
 
     try:
-        messages = await get_all_messages(session)
-        messages_response = MessageListResponse(
-            messages=[message.to_pydantic() for message in messages]
-        )
-
-        serialized = (
-            messages_response.model_dump_json() if hasattr(messages_response, 'model_dump_json')
-            else json.dumps(jsonable_encoder(messages_response))
-        )
-        await redis_connection.set(CACHE_KEY_MESSAGES, serialized, ex=3600)
-
-        response.headers["X-Cache"] = "MISS"
-        logger.debug("Messages cache miss; fetched from DB and cached")
-        return messages_response
+        page = await _cached_page(message_caches.room(room_id), before_id, after_id, limit, if_none_match)
+
+        if page.not_modified:
+            response.headers["X-Cache"] = "HIT"
+            return _raw_response(response, page.etag, status_code=304)
+
+        # The body is written straight from the cached JSON or the database
+        # rows; response_model only documents its shape
+        version, etag = page.version, page.etag
+        if page.items is not None:
+            messages, ids, has_more = page.items, page.ids, page.has_more
+            response.headers["X-Cache"] = "HIT"
+            logger.debug("Messages page served from cache")
+        else:
+            version = await get_messages_version(session, room_id)
+            etag = f'"{version}"'
+            response.headers["X-Cache"] = "MISS"
+            if etag == if_none_match:
+                return _raw_response(response, etag, status_code=304)
+            # A lagging replica would hand out an older version and miss new messages
+            page_session = read_session if before_id is not None else session
+            messages, has_more = await get_messages_page(page_session, before_id, after_id, limit, room_id)
+            ids = [row.id for row in messages]
+            logger.debug("Messages page outside cached window; fetched from DB")
+
+        has_newer = has_more if after_id is not None else before_id is not None
+        has_older = has_more if after_id is None else after_id > 0
+        links = {"next_cursor": None, "prev_cursor": None, "next": None, "prev": None}
+        if ids and has_newer:
+            links["next_cursor"] = encode_cursor("after", ids[-1])
+            links["next"] = _page_link(request, links["next_cursor"], limit)
+        if ids and has_older:
+            links["prev_cursor"] = encode_cursor("before", ids[0])
+            links["prev"] = _page_link(request, links["prev_cursor"], limit)
+
+        return _raw_response(response, etag, dump_messages_page(messages, **links, version=version))
     except Exception as e:
         logger.exception("Error fetching or caching messages")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _require_room(session: AsyncSession, room_id: int):
+    '''
+    Raise RoomNotFoundError unless the room exists. Rooms are never deleted,
+    so one that has a message cache on this worker needs no query.
+    '''
+    if room_id not in message_caches and await get_room(session, room_id) is None:
+        raise RoomNotFoundError(room_id=room_id)
+
+
+async def _cached_page(message_cache: MessageCache, before_id, after_id, limit: int, if_none_match: str | None):
+    '''
+    The page from the room's cache, rebuilding a cold cache first. While
+    Redis is unavailable the page comes back without items, so it is read
+    from the database.
+    '''
+    try:
+        page = await message_cache.page(before_id, after_id, limit, if_none_match)
+        if not page.warm:
+            await message_cache.ensure_warm()
+            page = await message_cache.page(before_id, after_id, limit, if_none_match)
+        elif not page.fresh:
+            message_cache.refresh_in_background()
+        return page
+    except RedisError as e:
+        logger.warning(f"Messages cache unavailable, reading from the database: {e}")
+        return CachedPage(warm=False, fresh=False)
+
+
+@router.get('/messages/changes', response_model=MessageChangesResponse, dependencies=[Depends(limiter)])
+async def get_messages_changes(
+    response: Response,
+    user: Annotated[get_current_user, Depends()],
+    session: Annotated[AsyncSession, Depends(get_db)],
+    since_version: Annotated[int, Query(ge=0)],
+    room_id: Annotated[int, Query(ge=1)] = DEFAULT_ROOM_ID
+):
+    '''
+    Ids of the messages of a room created, updated and deleted since the given
+    version of the room's message log (the version field of a messages page).
+    Lets a reconnecting client resync without refetching whole pages. Only the
+    last MESSAGE_CHANGES_RETENTION_VERSIONS versions are kept; for an older
+    since_version the answer has resync true and the pages have to be reloaded.
+    '''
+    secure_headers.set_headers(response)
+    await _require_room(session, room_id)
+
+    version, created, updated, deleted, resync = await get_message_changes(session, since_version, room_id)
+
+    logger.debug(f"Message changes since version {since_version} up to {version}")
+    return MessageChangesResponse(version=version, created=created, updated=updated, deleted=deleted, resync=resync)
+
+
+@router.get('/messages/search', response_model=MessageSearchResponse, dependencies=[Depends(limiter)])
+async def search_messages_history(
+    request: Request,
+    response: Response,
+    user: Annotated[get_current_user, Depends()],
+    session: Annotated[AsyncSession, Depends(get_read_db)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    created_by: Annotated[str | None, Query()] = None,
+    since: Annotated[datetime | None, Query()] = None,
+    until: Annotated[datetime | None, Query()] = None,
+    order: Annotated[Literal["rank", "recent"], Query()] = "rank",
+    room_id: Annotated[int | None, Query(ge=1)] = None,
+    cursor: Annotated[str | None, Query()] = None,
+    limit: Annotated[int, Query(ge=1, le=MESSAGES_PAGE_MAX_LIMIT)] = SEARCH_PAGE_DEFAULT_LIMIT
+):
+    '''
+    Full text search over the message history, best matches first
+    (order=rank) or newest first (order=recent). Supports web-search
+    syntax ("quoted phrases", or, -excluded), created_by, room_id and
+    created_at [since, until) filters. Follow next/next_cursor for more results.
+    '''
+    secure_headers.set_headers(response)
+
+    if room_id is not None:
+        await _require_room(session, room_id)
+    after = decode_search_cursor(cursor) if cursor is not None else None
+    rows, has_more = await search_messages(session, q, created_by, since, until, order, after, limit, room_id)
+
+    search_response = MessageSearchResponse(messages=[
+        MessageSearchResponse.MessageSearchResponseItem(**row._asdict()) for row in rows
+    ])
+    if rows and has_more:
+        search_response.next_cursor = encode_search_cursor(rows[-1].rank, rows[-1].id)
+        url = request.url.remove_query_params(["cursor"])
+        search_response.next = str(url.include_query_params(cursor=search_response.next_cursor))
+
+    logger.debug(f"Message search returned {len(rows)} results")
+    return search_response
+
+
+@router.get('/messages/export', response_class=StreamingResponse, dependencies=[Depends(limiter)])
+async def export_messages_history(
+    response: Response,
+    admin: Annotated[get_admin_user, Depends()],
+    format: Annotated[Literal["ndjson", "gzip"], Query()] = "ndjson",
+    since: Annotated[datetime | None, Query()] = None,
+    until: Annotated[datetime | None, Query()] = None,
+    created_by: Annotated[str | None, Query()] = None
+):
+    '''
+    Stream the whole message history (or the messages created in
+    [since, until) and/or by created_by) as NDJSON, optionally gzipped.
+    Rows are read through a server-side cursor, so memory use stays flat.
+    Like the import, only ADMIN_USERNAMES may export.
+    '''
+    secure_headers.set_headers(response)
+    filename = "messages.ndjson.gz" if format == "gzip" else "messages.ndjson"
+    headers = {key: value for key, value in response.headers.items() if key != "content-length"}
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    logger.info(f"Messages export started by admin: {admin.username}")
+    return StreamingResponse(
+        export_messages(ReadSessionLocal, format, since, until, created_by),
+        media_type=MEDIA_TYPES[format],
+        headers=headers
+    )
+
+
+@router.post('/admin/import-messages', response_model=ImportMessagesResponse)
+async def import_messages_history(
+    request: Request,
+    response: Response,
+    admin: Annotated[get_admin_user, Depends()]
+):
+    '''
+    Bulk load messages sent as NDJSON in the export format (gzip with
+    Content-Encoding: gzip). Rows are copied in IMPORT_BATCH_SIZE
+    transactions; the message caches of the rooms are rebuilt afterwards.
+    Only for users listed in ADMIN_USERNAMES.
+    '''
+    secure_headers.set_headers(response)
+
+    gzipped = request.headers.get("content-encoding") == "gzip"
+    imported, rooms = await import_messages(SessionLocal, ndjson_records(request.stream(), gzipped))
+    for room_id in sorted(rooms):
+        await message_caches.room(room_id).ensure_warm()
+
+    logger.info(f"User {admin.username} imported {imported} messages")
+    return ImportMessagesResponse(imported=imported)
+
+
 @router.post('/send-message', response_model=CreateMessageResponse, dependencies=[Depends(limiter)])
 async def send_message(
     response: Response,
@@ -183,21 +465,28 @@ async def send_message(
     session: Annotated[AsyncSession, Depends(get_db)]
 ):
     '''
-    Create and send a new message to the chat.
+    Create and send a new message to a room of the chat (the default room
+    unless room_id is given).
     Validates message content and stores it in the database.
-    Returns the ID of the created message. Invalidates message cache.
+    Returns the ID of the created message. Appends it to the room's message cache.
     '''
     secure_headers.set_headers(response)
 
+    if await get_room(session, message_request.room_id) is None:
+        raise RoomNotFoundError(room_id=message_request.room_id)
+
     try:
-        new_message = await create_message(
+        new_message, version = await create_message(
             session=session,
             content=message_request.content,
-            created_at=message_request.created_at,
+            created_at=clamp_created_at(message_request.created_at),
             created_by=message_request.created_by,
+            room_id=message_request.room_id
         )
 
-        await redis_connection.delete(CACHE_KEY_MESSAGES)
+        await message_caches.room(new_message.room_id).append(
+            {new_message.id: new_message.to_pydantic().model_dump_json()}, version
+        )
 
         message_response = CreateMessageResponse(id=new_message.id)
 
@@ -218,14 +507,14 @@ async def delete_message(
     '''
     Delete a specific message from the chat by its ID.
     Returns success status indicating whether the message was deleted.
-    Invalidates message cache.
+    Removes it from the message cache of its room.
     '''
     secure_headers.set_headers(response)
 
     try:
-        success = await delete_message_from_db(session, message_request.id)
+        success, version, room_id = await delete_message_from_db(session, message_request.id)
 
-        await redis_connection.delete(CACHE_KEY_MESSAGES)
+        await message_caches.room(room_id).remove(message_request.id, version)
 
         logger.info("Message deleted")
         return DeleteMessageResponse(success=success)
@@ -244,14 +533,17 @@ async def update_message(
     '''
     Update content field of a specific message from the chat by its ID.
     Returns success status indicating whether the message was updated.
-    Invalidates message cache.
+    Patches the cached copy of the message in its room's cache.
     '''
     secure_headers.set_headers(response)
 
     try:
-        success = await update_message_from_db(session, message_request.id, message_request.content)
+        updated_at = datetime.now(timezone.utc)
+        success, version, room_id = await update_message_from_db(
+            session, message_request.id, message_request.content, updated_at
+        )
 
-        await redis_connection.delete(CACHE_KEY_MESSAGES)
+        await message_caches.room(room_id).patch(message_request.id, message_request.content, updated_at.isoformat(), version)
 
         logger.info("Message updated")
         return UpdateMessageResponse(success=success)
@@ -264,22 +556,71 @@ async def update_message(
 async def websocket_endpoint(
     response: Response,
     user: Annotated[get_current_user, Depends()],
-    websocket: WebSocket,
-    username: Annotated[str, Query]
+    websocket: WebSocket
 ):
     '''
     WebSocket endpoint for real-time chat functionality.
     Establishes connection for live message broadcasting and user status updates.
-    Requires username as query parameter for user identification.
+    The user is the one of the access token; messages, presence and the
+    per-user connection cap all go by that name.
+
+    Every frame is a versioned envelope {"v": 1, "type", "data", "ref"}.
+    Clients send message, edit, delete, typing, subscribe, unsubscribe,
+    resume and pong; the server sends message, edit, delete, typing,
+    presence, ping and ack (the outcome of a client frame, carrying its
+    ref). Frames are JSON text, or
+    MessagePack binary when the client negotiates the chat.v1.msgpack
+    subprotocol. Oversized or malformed frames are answered with a failed
+    ack and never reach the fan-out.
+
+    The connection starts subscribed to the default room. New messages are
+    stored by the message writer in small batches and broadcast to their
+    room once stored; a message that cannot be stored gets a failed ack.
+
+    Message, edit and delete frames from the server carry a "seq" that grows
+    by one with every room event. After reconnecting (and subscribing to
+    its rooms) a client sends resume with the last seq it got and receives
+    just the events it missed; an ack with complete false means the gap is
+    too old and the history has to be fetched again.
+
+    A client that has sent nothing for WS_HEARTBEAT_INTERVAL seconds gets a
+    ping and should answer with pong (any frame will do); after
+    WS_IDLE_TIMEOUT seconds of silence the socket is closed. A user gets
+    at most WS_MAX_CONNECTIONS_PER_USER sockets per worker.
     '''
     secure_headers.set_headers(response)
-    
+    username = user.username
+
     logger.info(f"WebSocket connection attempt for user: {username}")
-    await manager.connect(websocket, username)
+    subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []))
+    if not await manager.connect(websocket, username, subprotocol=subprotocol):
+        return
+    binary = subprotocol == SUBPROTOCOL_MSGPACK
     try:
         while True:
-            data = await websocket.receive_text()
-            await manager.broadcast(data)
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(received.get("code", 1000))
+            manager.touch(websocket)
+            payload = received.get("bytes") if binary else received.get("text")
+            if payload is not None and not binary:
+                payload = payload.encode()
+            if payload is None or len(payload) > WS_MAX_FRAME_BYTES:
+                logger.warning(f"Rejected oversized or mistyped WebSocket frame from user: {username}")
+                _ack(websocket, None, error="frame too large or of the wrong type")
+                continue
+            try:
+                if binary:
+                    envelope = ClientEnvelope.validate_python(msgpack.unpackb(payload))
+                else:
+                    envelope = ClientEnvelope.validate_json(payload)
+            except (ValidationError, ValueError):
+                logger.warning(f"Rejected malformed WebSocket frame from user: {username}")
+                _ack(websocket, None, error="malformed frame")
+                continue
+            if envelope.type == "pong":
+                continue
+            await handle_client_event(websocket, username, envelope)
     except WebSocketDisconnect:
         logger.info(f"WebSocket disconnected for user: {username}")
         await manager.disconnect(websocket)
@@ -287,3 +628,75 @@ async def websocket_endpoint(
         logger.error(f"WebSocket error for user {username}: {e}")
         await manager.disconnect(websocket)
 
+
+def _ack(websocket: WebSocket, ref: str | None, error: str | None = None, **data):
+    if error is not None:
+        frame = Frame.event("ack", {"ok": False, "error": error}, ref)
+    else:
+        frame = Frame.event("ack", {"ok": True, **data}, ref)
+    manager.send(websocket, frame)
+
+
+async def handle_client_event(websocket: WebSocket, username: str, envelope):
+    data = envelope.data
+    if envelope.type == "subscribe":
+        async with SessionLocal() as session:
+            room = await get_room(session, data.room_id)
+        if room is None:
+            _ack(websocket, envelope.ref, error=f"room {data.room_id} does not exist")
+            return
+        manager.subscribe(websocket, data.room_id)
+        _ack(websocket, envelope.ref, room_id=data.room_id)
+        return
+    if envelope.type == "unsubscribe":
+        manager.unsubscribe(websocket, data.room_id)
+        _ack(websocket, envelope.ref, room_id=data.room_id)
+        return
+    if envelope.type == "resume":
+        replayed, complete = await manager.resume(websocket, data.last_seq)
+        _ack(websocket, envelope.ref, replayed=replayed, complete=complete)
+        return
+
+    if envelope.type == "message":
+        if not manager.is_subscribed(websocket, data.room_id):
+            _ack(websocket, envelope.ref, error=f"not subscribed to room {data.room_id}")
+            return
+        created_at = clamp_created_at(data.created_at)
+        try:
+            message_id = await message_writer.submit(data.content, created_at, username, data.room_id)
+        except Exception:
+            logger.warning(f"Message of user {username} could not be stored")
+            _ack(websocket, envelope.ref, error="message could not be stored")
+            return
+        message = dict(zip(MESSAGE_FIELDS, (data.content, created_at, None, username, data.room_id, message_id)))
+        seq = await manager.broadcast(Frame.event("message", message), data.room_id)
+        _ack(websocket, envelope.ref, id=message_id, seq=seq)
+        return
+    if envelope.type == "typing":
+        if manager.is_subscribed(websocket, data.room_id):
+            typing = Frame.event("typing", {"room_id": data.room_id, "username": username})
+            await manager.broadcast(typing, data.room_id, transient=True)
+        return
+
+    # edit and delete: the message may not be in memory yet (write-behind) or not exist
+    try:
+        async with SessionLocal() as session:
+            if envelope.type == "edit":
+                updated_at = datetime.now(timezone.utc)
+                _, version, room_id = await update_message_from_db(session, data.id, data.content, updated_at)
+            else:
+                _, version, room_id = await delete_message_from_db(session, data.id)
+    except Exception:
+        logger.warning(f"User {username} could not {envelope.type} message {data.id}")
+        _ack(websocket, envelope.ref, error=f"message {data.id} not found")
+        return
+
+    cache = message_caches.room(room_id)
+    if envelope.type == "edit":
+        await cache.patch(data.id, data.content, updated_at.isoformat(), version)
+        change = {"id": data.id, "content": data.content, "updated_at": updated_at, "room_id": room_id}
+    else:
+        await cache.remove(data.id, version)
+        change = {"id": data.id, "room_id": room_id}
+    seq = await manager.broadcast(Frame.event(envelope.type, change), room_id)
+    _ack(websocket, envelope.ref, id=data.id, seq=seq)
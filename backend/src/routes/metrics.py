@@ -0,0 +1,30 @@
+import logging
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+
+from ..core.hashing import password_hasher
+from ..core.rate_limit import FailOpenRateLimiter
+from ..core.redis_client import redis_latency
+from ..dependencies import get_admin_user
+from .chat import manager, message_caches
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get('/metrics')
+async def get_metrics(admin: Annotated[get_admin_user, Depends()]):
+    '''
+    Runtime counters of the backend subsystems of this worker.
+    Only for ADMIN_USERNAMES: pool, queue and cache internals are not public.
+    '''
+    return {
+        "password_hashing": password_hasher.stats(),
+        "websockets": manager.stats(),
+        "messages_cache": message_caches.stats(),
+        "redis": redis_latency.stats(),
+        "rate_limit": {"allowed_unchecked": FailOpenRateLimiter.allowed_unchecked},
+    }
@@ -5,6 +5,12 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "secret_key"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # PEM files for asymmetric algorithms such as EdDSA or RS256
+    PRIVATE_KEY_PATH: str | None = None
+    PUBLIC_KEY_PATH: str | None = None
+    TOKEN_CACHE_SIZE: int = 10000
+    # Seconds a worker trusts the password change time it last read from Redis
+    TOKEN_REVOCATION_REFRESH_SECONDS: float = 5
 
     class ConfigDict:
         env_file = "../.env"
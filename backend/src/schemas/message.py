@@ -1,12 +1,15 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 
+from .room import DEFAULT_ROOM_ID
+
 
 class MessageBase(BaseModel):
     content: str = Field(max_length=100, description="The content of the message", examples=["Hello world!"])
     created_at: datetime = Field(description="The datetime when the message has been created")
     updated_at: datetime | None = Field(default=None, description="The datetime when the message has been updated")
     created_by: str = Field(description="The sender of the message")
+    room_id: int = Field(default=DEFAULT_ROOM_ID, description="The room the message belongs to")
 
 
 class MessageListResponse(BaseModel):
@@ -14,6 +17,33 @@ class MessageListResponse(BaseModel):
         id: int = Field(description="The number in the database")
 
     messages: list[MessageListResponseItem]
+    next_cursor: str | None = Field(default=None, description="Opaque cursor of the page with newer messages")
+    prev_cursor: str | None = Field(default=None, description="Opaque cursor of the page with older messages")
+    next: str | None = Field(default=None, description="Link to the page with newer messages")
+    prev: str | None = Field(default=None, description="Link to the page with older messages")
+    version: int | None = Field(default=None, description="Version of the room's message log the page reflects")
+
+
+class MessageSearchResponse(BaseModel):
+    class MessageSearchResponseItem(MessageBase):
+        id: int = Field(description="The number in the database")
+        rank: float = Field(description="Relevance of the message to the query (0 without full text search)")
+
+    messages: list[MessageSearchResponseItem]
+    next_cursor: str | None = Field(default=None, description="Opaque cursor of the next page of results")
+    next: str | None = Field(default=None, description="Link to the next page of results")
+
+
+class MessageChangesResponse(BaseModel):
+    version: int = Field(description="Current version of the room's message log")
+    created: list[int] = Field(description="Ids of the messages created since the given version")
+    updated: list[int] = Field(description="Ids of the messages updated since the given version")
+    deleted: list[int] = Field(description="Ids of the messages deleted since the given version")
+    resync: bool = Field(default=False, description="The changes since the given version are no longer kept; reload the pages instead")
+
+
+class ImportMessagesResponse(BaseModel):
+    imported: int = Field(description="The number of imported messages")
 
 
 class CreateMessageRequest(MessageBase):
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+
+# Created by the rooms migration; holds every message that predates rooms
+DEFAULT_ROOM_ID = 1
+
+
+class RoomResponse(BaseModel):
+    id: int = Field(description="The number in the database")
+    name: str = Field(description="Unique name of the room")
+    created_at: datetime = Field(description="The datetime when the room has been created")
+    created_by: str | None = Field(default=None, description="The user who created the room")
+
+
+class RoomListResponse(BaseModel):
+    rooms: list[RoomResponse]
+
+
+class CreateRoomRequest(BaseModel):
+    name: str = Field(min_length=1, max_length=64, description="Unique name of the room", examples=["general"])
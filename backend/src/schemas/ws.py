@@ -0,0 +1,78 @@
+from datetime import datetime
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from .room import DEFAULT_ROOM_ID
+
+
+PROTOCOL_VERSION = 1
+
+
+class EnvelopeBase(BaseModel):
+    v: Literal[1] = Field(description="Protocol version")
+    ref: str | None = Field(default=None, max_length=64, description="Client reference echoed back in the ack")
+
+
+class MessageData(BaseModel):
+    content: str = Field(max_length=100, description="The content of the message", examples=["Hello world!"])
+    room_id: int = Field(default=DEFAULT_ROOM_ID, description="The room the message is sent to")
+    created_at: datetime | None = Field(default=None, description="The datetime when the message has been created")
+
+
+class EditData(BaseModel):
+    id: int = Field(description="The number in the database")
+    content: str = Field(max_length=100, description="The new content of the message")
+
+
+class DeleteData(BaseModel):
+    id: int = Field(description="The number in the database")
+
+
+class RoomData(BaseModel):
+    room_id: int = Field(description="The room the event is about")
+
+
+class ResumeData(BaseModel):
+    last_seq: int = Field(ge=0, description="The sequence number of the last room event the client received")
+
+
+class MessageEnvelope(EnvelopeBase):
+    type: Literal["message"]
+    data: MessageData
+
+
+class EditEnvelope(EnvelopeBase):
+    type: Literal["edit"]
+    data: EditData
+
+
+class DeleteEnvelope(EnvelopeBase):
+    type: Literal["delete"]
+    data: DeleteData
+
+
+class TypingEnvelope(EnvelopeBase):
+    type: Literal["typing"]
+    data: RoomData
+
+
+class SubscribeEnvelope(EnvelopeBase):
+    type: Literal["subscribe", "unsubscribe"]
+    data: RoomData
+
+
+class PongEnvelope(EnvelopeBase):
+    type: Literal["pong"]
+
+
+class ResumeEnvelope(EnvelopeBase):
+    type: Literal["resume"]
+    data: ResumeData
+
+
+# Frames a client may send; presence and ack only go from the server to clients
+ClientEnvelope = TypeAdapter(Annotated[
+    MessageEnvelope | EditEnvelope | DeleteEnvelope | TypingEnvelope | SubscribeEnvelope | ResumeEnvelope | PongEnvelope,
+    Field(discriminator="type")
+])
@@ -1,15 +1,28 @@
-from typing import Annotated
+from typing import Annotated, NamedTuple
+import base64
+import binascii
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
+import hashlib
+import logging
+from pathlib import Path
+import time
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from jwt.exceptions import InvalidTokenError
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+from redis.exceptions import RedisError
 
+from .core.redis_client import redis_connection
 from .schemas.config import settings
+from .schemas.user import TokenData
 
-from .exceptions import AuthenticationError
+from .exceptions import AuthenticationError, InvalidCursorError
 
 
+logger = logging.getLogger(__name__)
+
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
@@ -17,18 +30,200 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token")
 
 
+def load_signing_keys(algorithm: str, secret_key: str, private_key_path: str | None, public_key_path: str | None):
+    '''
+    Keys for signing and verifying tokens. HMAC algorithms use the shared
+    secret; asymmetric ones parse the PEM files once so no call pays for it.
+    A node that only verifies tokens may leave out the private key.
+    '''
+    if algorithm.startswith("HS"):
+        return secret_key, secret_key
+    signing_key = load_pem_private_key(Path(private_key_path).read_bytes(), password=None) if private_key_path else None
+    verifying_key = load_pem_public_key(Path(public_key_path).read_bytes())
+    return signing_key, verifying_key
+
+
+SIGNING_KEY, VERIFYING_KEY = load_signing_keys(
+    ALGORITHM, SECRET_KEY, settings.PRIVATE_KEY_PATH, settings.PUBLIC_KEY_PATH
+)
+
+
+class VerifiedToken(NamedTuple):
+    expires_at: float
+    payload: dict
+    user: TokenData
+
+
+class VerifiedTokenCache:
+    '''
+    Bounded LRU of tokens whose signature has already been checked, keyed by
+    the SHA-256 digest of the token. Entries are dropped once the token's
+    exp passes and all entries of a user go when the user's password changes.
+    Only used from the event loop, so it needs no lock.
+    '''
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[bytes, VerifiedToken] = OrderedDict()
+        self._by_user: dict[str, set[bytes]] = {}
+
+    def get(self, token: str):
+        digest = hashlib.sha256(token.encode()).digest()
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(digest)
+            return None
+        self._entries.move_to_end(digest)
+        return entry
+
+    def put(self, token: str, payload: dict):
+        digest = hashlib.sha256(token.encode()).digest()
+        username = payload.get("sub")
+        expires_at = payload.get("exp", time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+        entry = VerifiedToken(expires_at=expires_at, payload=payload, user=TokenData(username=username))
+        self._entries[digest] = entry
+        self._entries.move_to_end(digest)
+        self._by_user.setdefault(username, set()).add(digest)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate_user(self, username: str):
+        for digest in list(self._by_user.get(username, ())):
+            self._remove(digest)
+
+    def _remove(self, digest: bytes):
+        entry = self._entries.pop(digest)
+        digests = self._by_user.get(entry.user.username)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[entry.user.username]
+
+
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_SIZE)
+
+
+class TokenRevocations:
+    '''
+    When each user last changed their password; tokens issued before that
+    are rejected. The time is kept in Redis for as long as a token lives,
+    so every worker sees it. What a worker read is trusted for refresh
+    seconds (at most max_size users), so requests do not wait on Redis;
+    changes made on this worker apply at once, also while Redis is
+    unavailable.
+    '''
+
+    KEY_PREFIX = "chat:auth:password-changed:"
+
+    def __init__(self, redis_conn, lifetime: float, refresh: float, max_size: int):
+        self.redis = redis_conn
+        self.lifetime = lifetime
+        self.refresh = refresh
+        self.max_size = max_size
+        self._local: dict[str, float] = {}
+        # username -> (change time read from Redis, monotonic time of the read)
+        self._read: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def revoke_user(self, username: str):
+        changed_at = time.time()
+        self._local[username] = changed_at
+        token_cache.invalidate_user(username)
+        try:
+            await self.redis.set(self.KEY_PREFIX + username, repr(changed_at), ex=int(self.lifetime) + 1)
+        except RedisError as e:
+            logger.error(f"Could not revoke the tokens of {username} on other workers: {e}")
+
+    async def revoked_before(self, username: str):
+        now = time.monotonic()
+        read = self._read.get(username)
+        if read is not None and now - read[1] < self.refresh:
+            changed_at = read[0]
+        else:
+            try:
+                changed_at = float(await self.redis.get(self.KEY_PREFIX + username) or 0)
+            except RedisError as e:
+                logger.warning(f"Token revocations unavailable, checking this worker's only: {e}")
+                changed_at = 0.0
+            self._read[username] = (changed_at, now)
+            self._read.move_to_end(username)
+            while len(self._read) > self.max_size:
+                self._read.popitem(last=False)
+        return max(changed_at, self._local.get(username, 0.0))
+
+    async def check(self, verified: VerifiedToken):
+        issued_at = verified.payload.get("iat", verified.expires_at - self.lifetime)
+        if issued_at < await self.revoked_before(verified.user.username):
+            raise AuthenticationError(username=verified.user.username)
+
+
+token_revocations = TokenRevocations(
+    redis_connection,
+    ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    settings.TOKEN_REVOCATION_REFRESH_SECONDS,
+    settings.TOKEN_CACHE_SIZE
+)
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, ALGORITHM)
+    # Fractional, so a token issued right after a password change outlives it
+    to_encode.update({"exp": expire, "iat": time.time()})
+    return jwt.encode(to_encode, SIGNING_KEY, ALGORITHM)
+
+
+def verified_token(token: str):
+    cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+
+    try:
+        payload = jwt.decode(token, VERIFYING_KEY, [ALGORITHM])
+    except InvalidTokenError:
+        raise AuthenticationError(username=_unverified_subject(token))
+
+    return token_cache.put(token, payload)
 
 
 def verify_token(token: Annotated[str, Depends(oauth2_scheme)]):
+    return verified_token(token).payload
+
+
+def _unverified_subject(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, [ALGORITHM])
+        return jwt.decode(token, options={"verify_signature": False}).get("sub")
     except InvalidTokenError:
-        raise AuthenticationError(username=payload.get("sub"))
+        return None
+
+
+def encode_cursor(direction: str, message_id: int):
+    raw = f"{direction}:{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
 
-    return payload
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, message_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        if direction not in ("before", "after"):
+            raise ValueError(direction)
+        return direction, int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError(cursor=cursor)
+
+
+def encode_search_cursor(rank: float, message_id: int):
+    raw = f"{rank!r}:{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
+
+def decode_search_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, message_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return float(rank), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError(cursor=cursor)
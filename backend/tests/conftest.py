@@ -1,25 +1,30 @@
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 import pytest_asyncio
 from fastapi import FastAPI
 from fastapi_limiter import FastAPILimiter
 from httpx import ASGITransport, AsyncClient
-from unittest.mock import AsyncMock
+from fakeredis import FakeAsyncRedis
 from asgi_lifespan import LifespanManager
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
+from src.routes import chat
 from src.routes.chat import router, limiter
+from src.core.message_cache import RoomMessageCaches
+from src.dependencies import get_current_user
+from src.schemas.user import TokenData
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
+from src.utils import token_revocations
 from src.database.models.base import Base
 
 
 @pytest_asyncio.fixture()
 async def redis_connection():
-    mock_redis = AsyncMock()
-    mock_redis.get = AsyncMock(return_value=None)
-    mock_redis.set = AsyncMock(return_value=True)
-    mock_redis.delete = AsyncMock(return_value=1)
-    return mock_redis
+    fake_redis = FakeAsyncRedis(decode_responses=True)
+    yield fake_redis
+    await fake_redis.flushall()
+    await fake_redis.aclose()
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///backend/tests/test.db"
@@ -61,7 +66,7 @@ async def db():
 
 
 @pytest_asyncio.fixture
-async def app(db, redis_connection) -> FastAPI:
+async def app(db, redis_connection, monkeypatch) -> FastAPI:
     async def lifespan_wrapper(app: FastAPI):
         async with test_lifespan(app, redis_connection):
             yield
@@ -73,8 +78,17 @@ async def app(db, redis_connection) -> FastAPI:
         async with TestingAsyncSessionLocal() as session:
             yield session
 
+    monkeypatch.setattr(chat, "redis_connection", redis_connection)
+    monkeypatch.setattr(token_revocations, "redis", redis_connection)
+    monkeypatch.setattr(token_revocations, "_read", OrderedDict())
+    monkeypatch.setattr(chat, "message_caches", RoomMessageCaches(
+        redis_connection, lambda room_id: chat.latest_messages_loader(TestingAsyncSessionLocal, room_id)
+    ))
+
     app.dependency_overrides[limiter] = lambda: None
+    app.dependency_overrides[get_current_user] = lambda: TokenData(username="testname")
     app.dependency_overrides[get_db] = override_get_session
+    app.dependency_overrides[get_read_db] = override_get_session
 
     return app
 
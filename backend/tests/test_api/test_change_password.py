@@ -1,6 +1,11 @@
 import pytest
 import httpx
 
+from src.database.db import get_password_hash
+from src.database.models.user import User
+from src.dependencies import get_current_user
+from src.utils import create_access_token
+
 
 @pytest.mark.skip(reason="no way of currently testing this")
 @pytest.mark.asyncio
@@ -54,4 +59,22 @@ async def test_change_password_with_unvalid_new_password():
         }
         response = await ac.patch(url="http://localhost:8000/api/change-password", json=data)
 
-        assert response.status_code == 422
\ No newline at end of file
+        assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_old_token_is_rejected_after_password_change(app, async_client, db):
+    db.add(User(username="alice", hashed_password=get_password_hash("old_password")))
+    await db.commit()
+    app.dependency_overrides.pop(get_current_user)
+    old_token = create_access_token({"sub": "alice"})
+    headers = {"Authorization": f"Bearer {old_token}"}
+    assert (await async_client.get("/api/rooms", headers=headers)).status_code == 200
+
+    response = await async_client.patch("/api/change-password", json={
+        "username": "alice", "old_password": "old_password", "new_password": "new_password"
+    })
+    assert response.status_code == 200
+
+    assert (await async_client.get("/api/rooms", headers=headers)).status_code == 401
+    new_token = create_access_token({"sub": "alice"})
+    assert (await async_client.get("/api/rooms", headers={"Authorization": f"Bearer {new_token}"})).status_code == 200
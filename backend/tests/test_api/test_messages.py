@@ -0,0 +1,379 @@
+from datetime import datetime, timezone
+import gzip
+import orjson
+import pytest
+
+from src.core.message_cache import CachedPage
+from src.database.db import backfill_message_senders, get_read_db, prune_message_changes
+from src.database.models.message import Message
+from src.database.models.user import User
+from src.routes import chat
+from src import dependencies
+
+from ..conftest import TestingAsyncSessionLocal
+
+
+async def seed_users(db, *usernames: str):
+    db.add_all([User(username=username, hashed_password="hash") for username in usernames])
+    await db.commit()
+    await backfill_message_senders(db)
+
+
+async def seed_messages(db, count: int):
+    db.add_all([
+        Message(content=f"message {i}", created_at=datetime.now(timezone.utc), created_by="testname")
+        for i in range(1, count + 1)
+    ])
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_get_messages_returns_latest_page(async_client, db):
+    await seed_messages(db, 60)
+
+    response = await async_client.get("/api/messages")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [m["id"] for m in data["messages"]] == list(range(11, 61))
+    assert data["next_cursor"] is None
+    assert data["prev_cursor"] is not None
+    assert response.headers["X-Cache"] == "HIT"
+
+
+@pytest.mark.asyncio
+async def test_get_messages_walks_history_with_cursors(async_client, db):
+    await seed_messages(db, 25)
+
+    first = (await async_client.get("/api/messages", params={"limit": 10})).json()
+    older = (await async_client.get("/api/messages", params={"cursor": first["prev_cursor"], "limit": 10})).json()
+    oldest = (await async_client.get(older["prev"])).json()
+
+    assert [m["id"] for m in first["messages"]] == list(range(16, 26))
+    assert [m["id"] for m in older["messages"]] == list(range(6, 16))
+    assert [m["id"] for m in oldest["messages"]] == list(range(1, 6))
+    assert oldest["prev_cursor"] is None
+
+    newer = (await async_client.get("/api/messages", params={"cursor": oldest["next_cursor"], "limit": 10})).json()
+    assert [m["id"] for m in newer["messages"]] == list(range(6, 16))
+
+
+@pytest.mark.asyncio
+async def test_get_messages_after_id(async_client, db):
+    await seed_messages(db, 5)
+
+    response = await async_client.get("/api/messages", params={"after_id": 3})
+
+    assert [m["id"] for m in response.json()["messages"]] == [4, 5]
+
+
+@pytest.mark.asyncio
+async def test_get_messages_with_invalid_cursor(async_client):
+    response = await async_client.get("/api/messages", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_messages_with_both_directions(async_client):
+    response = await async_client.get("/api/messages", params={"before_id": 5, "after_id": 1})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_message_writes_patch_the_cache(async_client, db, redis_connection):
+    await seed_messages(db, 3)
+    await async_client.get("/api/messages")
+
+    created = await async_client.post("/api/send-message", json={
+        "content": "new message",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_by": "testname",
+    })
+    await async_client.patch("/api/update-message", json={"id": 2, "content": "edited"})
+    await async_client.request("DELETE", "/api/delete-message", json={"id": 1})
+
+    # Break the database behind the cache: the page must come from Redis alone
+    await db.execute(Message.__table__.delete())
+    await db.commit()
+    response = await async_client.get("/api/messages")
+
+    assert response.headers["X-Cache"] == "HIT"
+    messages = response.json()["messages"]
+    assert [m["id"] for m in messages] == [2, 3, created.json()["id"]]
+    assert messages[0]["content"] == "edited"
+    assert messages[0]["updated_at"] is not None
+
+
+@pytest.mark.asyncio
+async def test_get_messages_not_modified(async_client, db):
+    await seed_messages(db, 3)
+    first = await async_client.get("/api/messages")
+
+    unchanged = await async_client.get("/api/messages", headers={"If-None-Match": first.headers["ETag"]})
+    await async_client.patch("/api/update-message", json={"id": 2, "content": "edited"})
+    changed = await async_client.get("/api/messages", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != first.headers["ETag"]
+
+
+@pytest.mark.asyncio
+async def test_get_messages_changes_since_version(async_client, db):
+    await seed_messages(db, 3)
+    version = (await async_client.get("/api/messages")).json()["version"]
+
+    created = await async_client.post("/api/send-message", json={
+        "content": "new message",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_by": "testname",
+    })
+    await async_client.patch("/api/update-message", json={"id": 2, "content": "edited"})
+    await async_client.request("DELETE", "/api/delete-message", json={"id": 1})
+    await async_client.patch("/api/update-message", json={"id": created.json()["id"], "content": "edited"})
+
+    changes = (await async_client.get("/api/messages/changes", params={"since_version": version})).json()
+    latest = (await async_client.get("/api/messages")).json()
+
+    assert changes == {
+        "version": version + 4,
+        "created": [created.json()["id"]],
+        "updated": [2],
+        "deleted": [1],
+        "resync": False,
+    }
+    assert latest["version"] == changes["version"]
+
+
+@pytest.mark.asyncio
+async def test_get_messages_changes_before_pruned_version_asks_for_resync(async_client, db):
+    for content in ("one", "two", "three"):
+        await async_client.post("/api/send-message", json={
+            "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_by": "testname",
+        })
+
+    assert await prune_message_changes(db, keep_versions=1) == 2
+    pruned = (await async_client.get("/api/messages/changes", params={"since_version": 1})).json()
+    kept = (await async_client.get("/api/messages/changes", params={"since_version": 2})).json()
+
+    assert pruned == {"version": 3, "created": [], "updated": [], "deleted": [], "resync": True}
+    assert (kept["created"], kept["resync"]) == ([3], False)
+
+
+@pytest.mark.asyncio
+async def test_cached_and_database_pages_are_identical(async_client, db, monkeypatch):
+    await seed_messages(db, 3)
+    cached = await async_client.get("/api/messages")
+
+    async def uncached_page(*args, **kwargs):
+        return CachedPage(warm=True, fresh=True)
+
+    monkeypatch.setattr(chat.message_caches.room(), "page", uncached_page)
+    uncached = await async_client.get("/api/messages")
+
+    assert (cached.headers["X-Cache"], uncached.headers["X-Cache"]) == ("HIT", "MISS")
+    assert cached.content == uncached.content
+    assert uncached.headers["content-type"] == "application/json"
+    assert "x-frame-options" in uncached.headers
+
+
+@pytest.mark.asyncio
+async def test_only_older_database_pages_are_read_from_the_replica(app, async_client, db, monkeypatch):
+    await seed_messages(db, 60)
+    replica_reads = []
+
+    async def replica_session():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+            replica_reads.append(session.in_transaction())
+
+    async def uncached_page(*args, **kwargs):
+        return CachedPage(warm=True, fresh=True)
+
+    monkeypatch.setattr(chat.message_caches.room(), "page", uncached_page)
+    app.dependency_overrides[get_read_db] = replica_session
+    latest = await async_client.get("/api/messages")
+    older = await async_client.get("/api/messages", params={"before_id": 11})
+
+    assert (latest.status_code, older.status_code) == (200, 200)
+    assert replica_reads == [False, True]
+    assert latest.headers["etag"] == older.headers["etag"]
+
+
+@pytest.mark.asyncio
+async def test_export_messages_requires_admin(async_client):
+    response = await async_client.get("/api/messages/export")
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_export_messages_streams_ndjson(async_client, db, monkeypatch):
+    monkeypatch.setattr(chat, "ReadSessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {"testname"})
+    await seed_messages(db, 3)
+    db.add(Message(content="other", created_at=datetime.now(timezone.utc), created_by="othername"))
+    await db.commit()
+    await seed_users(db, "testname", "othername")
+
+    response = await async_client.get("/api/messages/export", params={"created_by": "testname"})
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.content.splitlines()
+    assert [orjson.loads(line)["id"] for line in lines] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_export_messages_gzip_with_time_range(async_client, db, monkeypatch):
+    monkeypatch.setattr(chat, "ReadSessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {"testname"})
+    db.add_all([
+        Message(content=f"message {day}", created_at=datetime(2025, 1, day, tzinfo=timezone.utc), created_by="testname")
+        for day in range(1, 6)
+    ])
+    await db.commit()
+
+    response = await async_client.get("/api/messages/export", params={
+        "format": "gzip", "since": "2025-01-02T00:00:00Z", "until": "2025-01-04T00:00:00Z",
+    })
+
+    lines = gzip.decompress(response.content).splitlines()
+    assert [orjson.loads(line)["content"] for line in lines] == ["message 2", "message 3"]
+
+
+def ndjson(*messages):
+    return b"".join(orjson.dumps(message) + b"\n" for message in messages)
+
+
+@pytest.mark.asyncio
+async def test_import_messages_requires_admin(async_client):
+    response = await async_client.post("/api/admin/import-messages", content=b"")
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_import_messages_rebuilds_cache(async_client, db, monkeypatch):
+    monkeypatch.setattr(chat, "SessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {"testname"})
+    await seed_messages(db, 2)
+    version = (await async_client.get("/api/messages")).json()["version"]
+
+    body = ndjson(
+        {"id": 10, "content": "kept id", "created_at": "2025-01-01T00:00:00Z", "created_by": "alice"},
+        {"content": "new id", "created_at": "2025-01-01T00:00:01Z", "created_by": "bob"},
+    )
+    response = await async_client.post(
+        "/api/admin/import-messages", content=gzip.compress(body), headers={"Content-Encoding": "gzip"}
+    )
+    page = (await async_client.get("/api/messages")).json()
+    changes = (await async_client.get("/api/messages/changes", params={"since_version": version})).json()
+
+    assert response.json() == {"imported": 2}
+    assert [(m["id"], m["content"]) for m in page["messages"]][2:] == [(3, "new id"), (10, "kept id")]
+    assert changes["created"] == [3, 10]
+
+
+@pytest.mark.asyncio
+async def test_import_messages_rejects_invalid_record(async_client, monkeypatch):
+    monkeypatch.setattr(chat, "SessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {"testname"})
+
+    body = ndjson({"content": "no sender", "created_at": "2025-01-01T00:00:00Z"})
+    response = await async_client.post("/api/admin/import-messages", content=body)
+
+    assert response.status_code == 400
+    assert response.headers["X-Error-Code"] == "INVALID_IMPORT_RECORD"
+
+
+@pytest.mark.asyncio
+async def test_import_messages_rejects_missing_room(async_client, monkeypatch):
+    monkeypatch.setattr(chat, "SessionLocal", TestingAsyncSessionLocal)
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {"testname"})
+
+    body = ndjson(
+        {"content": "fine", "created_at": "2025-01-01T00:00:00Z", "created_by": "alice"},
+        {"content": "lost", "created_at": "2025-01-01T00:00:01Z", "created_by": "alice", "room_id": 42},
+    )
+    response = await async_client.post("/api/admin/import-messages", content=body)
+
+    assert response.status_code == 404
+    assert response.headers["X-Error-Code"] == "ROOM_NOT_FOUND"
+    assert "line 2" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_search_messages_pages_through_matches(async_client, db):
+    db.add_all([
+        Message(content=content, created_at=datetime(2025, 1, day, tzinfo=timezone.utc), created_by=sender)
+        for day, (content, sender) in enumerate([
+            ("deploy is done", "alice"),
+            ("lunch?", "bob"),
+            ("Deploy failed again", "bob"),
+            ("new deploy at 5", "alice"),
+            ("100% deploy_ready", "alice"),
+        ], start=1)
+    ])
+    await db.commit()
+    await seed_users(db, "alice", "bob")
+
+    first = (await async_client.get("/api/messages/search", params={"q": "deploy", "limit": 2})).json()
+    second = (await async_client.get(first["next"])).json()
+    filtered = (await async_client.get("/api/messages/search", params={
+        "q": "deploy", "created_by": "alice", "until": "2025-01-04T00:00:00Z",
+    })).json()
+    literal = (await async_client.get("/api/messages/search", params={"q": "0% d"})).json()
+
+    assert [m["id"] for m in first["messages"]] == [5, 4]
+    assert [m["id"] for m in second["messages"]] == [3, 1]
+    assert second["next_cursor"] is None
+    assert [m["id"] for m in filtered["messages"]] == [1]
+    assert [m["id"] for m in literal["messages"]] == [5]
+
+
+@pytest.mark.asyncio
+async def test_rooms_have_their_own_history(async_client, db):
+    await seed_messages(db, 3)
+    room = (await async_client.post("/api/rooms", json={"name": "random"})).json()
+    sent = await async_client.post("/api/send-message", json={
+        "content": "hello room", "created_at": "2025-01-01T00:00:00Z", "created_by": "testname", "room_id": room["id"]
+    })
+
+    general = (await async_client.get("/api/messages")).json()
+    in_room = (await async_client.get("/api/messages", params={"room_id": room["id"]})).json()
+    rooms = (await async_client.get("/api/rooms")).json()
+
+    assert [r["name"] for r in rooms["rooms"]] == ["general", "random"]
+    assert [m["id"] for m in general["messages"]] == [1, 2, 3]
+    assert [(m["id"], m["room_id"]) for m in in_room["messages"]] == [(sent.json()["id"], room["id"])]
+    assert in_room["version"] == 1
+
+
+@pytest.mark.asyncio
+async def test_send_message_to_missing_room(async_client):
+    response = await async_client.post("/api/send-message", json={
+        "content": "hello", "created_at": "2025-01-01T00:00:00Z", "created_by": "testname", "room_id": 42
+    })
+
+    assert response.status_code == 404
+    assert response.headers["X-Error-Code"] == "ROOM_NOT_FOUND"
+
+
+@pytest.mark.asyncio
+async def test_reading_a_missing_room(async_client):
+    for path, params in [
+        ("/api/messages", {"room_id": 42}),
+        ("/api/messages/changes", {"since_version": 0, "room_id": 42}),
+        ("/api/messages/search", {"q": "hello", "room_id": 42}),
+    ]:
+        response = await async_client.get(path, params=params)
+
+        assert response.status_code == 404
+        assert response.headers["X-Error-Code"] == "ROOM_NOT_FOUND"
+    # No cache is kept for a room that does not exist
+    assert 42 not in chat.message_caches
@@ -0,0 +1,17 @@
+import pytest
+
+from src.routes.metrics import router as metrics_router
+from src import dependencies
+
+
+@pytest.mark.asyncio
+async def test_metrics_require_admin(app, async_client, monkeypatch):
+    app.include_router(metrics_router, prefix="/api")
+
+    forbidden = await async_client.get("/api/metrics")
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {"testname"})
+    allowed = await async_client.get("/api/metrics")
+
+    assert forbidden.status_code == 403
+    assert allowed.status_code == 200
+    assert "websockets" in allowed.json()
@@ -0,0 +1,111 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src.core.connection_manager import ConnectionManager
+from src.routes import chat
+
+
+class StubWriter:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, content, created_at, created_by, room_id):
+        self.submitted.append((content, created_by, room_id))
+        return len(self.submitted)
+
+
+@pytest.fixture
+def ws_client(app, monkeypatch):
+    monkeypatch.setattr(chat, "manager", ConnectionManager())
+    monkeypatch.setattr(chat, "message_writer", StubWriter())
+    return TestClient(app)
+
+
+def receive_until(websocket, type: str):
+    while True:
+        frame = websocket.receive_json()
+        if frame["type"] == type:
+            return frame
+
+
+@pytest.mark.asyncio
+async def test_message_is_acked_and_broadcast(ws_client):
+    with ws_client.websocket_connect("/api/ws") as websocket:
+        websocket.send_json({"v": 1, "type": "message", "ref": "c1", "data": {"content": "hello"}})
+
+        message = receive_until(websocket, "message")
+        ack = receive_until(websocket, "ack")
+
+    assert message["data"]["content"] == "hello"
+    assert message["data"]["created_by"] == "testname"
+    assert ack == {"v": 1, "type": "ack", "ref": "c1", "data": {"ok": True, "id": message["data"]["id"], "seq": message["seq"]}}
+
+
+@pytest.mark.asyncio
+async def test_username_query_parameter_is_ignored(ws_client):
+    with ws_client.websocket_connect("/api/ws?username=someone_else") as websocket:
+        presence = receive_until(websocket, "presence")
+        websocket.send_json({"v": 1, "type": "message", "ref": "c1", "data": {"content": "hello"}})
+        message = receive_until(websocket, "message")
+
+    assert "someone_else" not in str(presence["data"])
+    assert message["data"]["created_by"] == "testname"
+    assert chat.message_writer.submitted == [("hello", "testname", 1)]
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_missed_messages(ws_client):
+    with ws_client.websocket_connect("/api/ws") as websocket:
+        for content in ("one", "two"):
+            websocket.send_json({"v": 1, "type": "message", "data": {"content": content}})
+            last_seq = receive_until(websocket, "message")["seq"]
+
+    with ws_client.websocket_connect("/api/ws") as websocket:
+        websocket.send_json({"v": 1, "type": "resume", "ref": "r1", "data": {"last_seq": last_seq - 1}})
+
+        message = receive_until(websocket, "message")
+        ack = receive_until(websocket, "ack")
+
+    assert (message["seq"], message["data"]["content"]) == (last_seq, "two")
+    assert ack["data"] == {"ok": True, "replayed": 1, "complete": True}
+
+
+@pytest.mark.asyncio
+async def test_malformed_frames_are_rejected(ws_client):
+    with ws_client.websocket_connect("/api/ws") as websocket:
+        websocket.send_text("not json")
+        websocket.send_json({"v": 2, "type": "message", "data": {"content": "hello"}})
+        websocket.send_text("x" * 10_000)
+        websocket.send_json({"v": 1, "type": "message", "ref": "c2", "data": {"content": "hi", "room_id": 5}})
+
+        errors = [receive_until(websocket, "ack")["data"]["error"] for _ in range(4)]
+
+    assert errors[:3] == ["malformed frame", "malformed frame", "frame too large or of the wrong type"]
+    assert errors[3] == "not subscribed to room 5"
+    assert chat.message_writer.submitted == []
+
+
+@pytest.mark.asyncio
+async def test_frame_size_counts_bytes(ws_client):
+    # Fewer characters than WS_MAX_FRAME_BYTES, but more bytes
+    frame = '{"v": 1, "type": "message", "data": {"content": "' + "é" * 2100 + '"}}'
+    with ws_client.websocket_connect("/api/ws") as websocket:
+        websocket.send_text(frame)
+
+        ack = receive_until(websocket, "ack")
+
+    assert len(frame) < chat.WS_MAX_FRAME_BYTES < len(frame.encode())
+    assert ack["data"]["error"] == "frame too large or of the wrong type"
+
+
+@pytest.mark.asyncio
+async def test_msgpack_subprotocol(ws_client):
+    msgpack = pytest.importorskip("msgpack")
+    with ws_client.websocket_connect("/api/ws", subprotocols=["chat.v1.msgpack"]) as websocket:
+        assert websocket.accepted_subprotocol == "chat.v1.msgpack"
+        websocket.send_bytes(msgpack.packb({"v": 1, "type": "typing", "data": {"room_id": 1}}))
+
+        frames = [msgpack.unpackb(websocket.receive_bytes()) for _ in range(2)]
+
+    assert [frame["type"] for frame in frames] == ["presence", "typing"]
+    assert frames[1]["data"] == {"room_id": 1, "username": "testname"}
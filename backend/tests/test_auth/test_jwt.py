@@ -1,7 +1,23 @@
+from collections import OrderedDict
+import time
+
+from fakeredis import FakeAsyncRedis
+import jwt
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
 
-from src.utils import create_access_token, verify_token
+from src.utils import create_access_token, verify_token, load_signing_keys, token_revocations, VerifiedTokenCache
 from src.dependencies import get_current_user
+from src.exceptions import AuthenticationError
+
+
+@pytest.fixture(autouse=True)
+def revocations(monkeypatch):
+    monkeypatch.setattr(token_revocations, "redis", FakeAsyncRedis(decode_responses=True))
+    monkeypatch.setattr(token_revocations, "_local", {})
+    monkeypatch.setattr(token_revocations, "_read", OrderedDict())
+    return token_revocations
 
 
 @pytest.mark.asyncio
@@ -15,6 +31,103 @@ async def test_verify_token():
 @pytest.mark.asyncio
 async def test_get_current_user():
     token = create_access_token({"sub": "testname"})
-    user = get_current_user(token)
+    user = await get_current_user(token)
+
+    assert user.username == "testname"
+
+
+@pytest.mark.asyncio
+async def test_tokens_issued_before_a_password_change_are_rejected(revocations):
+    old_token = create_access_token({"sub": "revokedname"})
+    await get_current_user(old_token)
+
+    await revocations.revoke_user("revokedname")
+    # Another worker only knows the change from Redis, once its last read is stale
+    revocations._local.clear()
+    revocations._read.clear()
+    new_token = create_access_token({"sub": "revokedname"})
+
+    with pytest.raises(AuthenticationError):
+        await get_current_user(old_token)
+    assert (await get_current_user(new_token)).username == "revokedname"
+
+
+@pytest.mark.asyncio
+async def test_revocations_are_read_from_redis_once_per_refresh(revocations, monkeypatch):
+    token = create_access_token({"sub": "refreshname"})
+    reads = []
+    get = revocations.redis.get
+
+    async def counting_get(key):
+        reads.append(key)
+        return await get(key)
+
+    monkeypatch.setattr(revocations.redis, "get", counting_get)
+    for _ in range(3):
+        await get_current_user(token)
+    assert len(reads) == 1
+
+    # A change made on another worker applies once the refresh interval has passed
+    await revocations.redis.set(revocations.KEY_PREFIX + "refreshname", repr(time.time()))
+    await get_current_user(token)
+    monkeypatch.setattr(revocations, "refresh", 0)
+    with pytest.raises(AuthenticationError):
+        await get_current_user(token)
+    assert len(reads) == 2
+
+
+@pytest.mark.asyncio
+async def test_verified_token_is_cached(monkeypatch):
+    token = create_access_token({"sub": "cachedname"})
+    await get_current_user(token)
+
+    def fail_decode(*args, **kwargs):
+        raise AssertionError("signature checked again")
+
+    monkeypatch.setattr(jwt, "decode", fail_decode)
+    user = await get_current_user(token)
+
+    assert user.username == "cachedname"
+
+
+def test_token_cache_drops_expired_tokens():
+    cache = VerifiedTokenCache(max_size=10)
+    cache.put("expired", {"sub": "testname", "exp": time.time() - 1})
+
+    assert cache.get("expired") is None
+
+
+def test_token_cache_is_bounded():
+    cache = VerifiedTokenCache(max_size=2)
+    for token in ("first", "second", "third"):
+        cache.put(token, {"sub": "testname", "exp": time.time() + 60})
+
+    assert cache.get("first") is None
+    assert cache.get("third").user.username == "testname"
+
+
+def test_token_cache_invalidate_user():
+    cache = VerifiedTokenCache(max_size=10)
+    cache.put("first", {"sub": "testname", "exp": time.time() + 60})
+    cache.put("second", {"sub": "othername", "exp": time.time() + 60})
+    cache.invalidate_user("testname")
+
+    assert cache.get("first") is None
+    assert cache.get("second") is not None
+
+
+def test_load_signing_keys_eddsa(tmp_path):
+    private_key = Ed25519PrivateKey.generate()
+    private_path = tmp_path / "private.pem"
+    public_path = tmp_path / "public.pem"
+    private_path.write_bytes(private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ))
+    public_path.write_bytes(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ))
+
+    signing_key, verifying_key = load_signing_keys("EdDSA", "unused", str(private_path), str(public_path))
+    token = jwt.encode({"sub": "testname"}, signing_key, "EdDSA")
 
-    assert user.username == "testname"
\ No newline at end of file
+    assert jwt.decode(token, verifying_key, ["EdDSA"])["sub"] == "testname"
@@ -0,0 +1,50 @@
+import pytest
+from fakeredis import FakeAsyncRedis
+
+from src.core.backplane import Backplane, KEY_PRESENCE, KEY_PRESENCE_WORKER, KEY_PRESENCE_WORKERS, RedisBackplane
+
+
+@pytest.mark.asyncio
+async def test_users_of_a_silent_worker_go_offline():
+    redis = FakeAsyncRedis(decode_responses=True)
+    crashed = RedisBackplane(redis, presence_ttl=30)
+    alive = RedisBackplane(redis, presence_ttl=30)
+    await crashed.join("alice")
+    await crashed.join("bob")
+    await alive.join("bob")
+    await crashed.heartbeat()
+    await alive.heartbeat()
+
+    # The crashed worker never heartbeats again
+    await redis.zadd(KEY_PRESENCE_WORKERS, {crashed.worker_id: 0})
+    await alive.heartbeat()
+
+    assert await redis.hgetall(KEY_PRESENCE) == {"bob": "1"}
+    assert await alive.join("alice") is True
+
+
+@pytest.mark.asyncio
+async def test_stopped_worker_leaves_and_heartbeat_repairs_counts():
+    redis = FakeAsyncRedis(decode_responses=True)
+    backplane = RedisBackplane(redis)
+    await backplane.join("alice")
+    await backplane.join("alice")
+    # One of the joins got lost on its way to Redis
+    await redis.hset(KEY_PRESENCE, "alice", 1)
+    await redis.hset(KEY_PRESENCE_WORKER + backplane.worker_id, "alice", 1)
+
+    await backplane.heartbeat()
+    assert await redis.hget(KEY_PRESENCE, "alice") == "2"
+
+    await backplane.stop()
+    assert await redis.hgetall(KEY_PRESENCE) == {}
+    assert await redis.zcard(KEY_PRESENCE_WORKERS) == 0
+
+
+def test_incomplete_backplane_cannot_be_created():
+    class PublishOnly(Backplane):
+        async def publish(self, kind: str, data: str):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
@@ -0,0 +1,340 @@
+import asyncio
+import json
+import pytest
+
+from src.core.backplane import InMemoryBackplane, InMemoryHub
+from src.core.connection_manager import Connection, ConnectionManager, OverflowPolicy
+from src.core.frames import Frame, SUBPROTOCOL_MSGPACK
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent: list[str] = []
+        self.closed_with: int | None = None
+
+    async def accept(self, subprotocol: str | None = None):
+        pass
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def send_bytes(self, message: bytes):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def drain():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def message(content: str):
+    return Frame.event("message", {"content": content})
+
+
+def contents(websocket: FakeWebSocket):
+    frames = [json.loads(sent) for sent in websocket.sent]
+    return [frame["data"]["content"] for frame in frames if frame["type"] == "message"]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_is_not_blocked_by_slow_connection():
+    manager = ConnectionManager(max_queue_size=16)
+    fast, slow = FakeWebSocket(), FakeWebSocket(delay=10)
+    await manager.connect(fast, "fast")
+    await manager.connect(slow, "slow")
+
+    await asyncio.wait_for(manager.broadcast(message("hello")), timeout=0.1)
+    await drain()
+
+    assert "hello" in contents(fast)
+    assert "hello" not in contents(slow)
+
+    await manager.disconnect(slow)
+    await manager.disconnect(fast)
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_latest_frames():
+    manager = ConnectionManager(max_queue_size=2, overflow_policy=OverflowPolicy.DROP_OLDEST)
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "testname")
+    await drain()
+    connection = manager.activate_connections[websocket]
+
+    for i in range(5):
+        await manager.broadcast(message(str(i)))
+    await drain()
+
+    assert contents(websocket)[-2:] == ["3", "4"]
+    assert connection.dropped == 3
+
+    await manager.disconnect(websocket)
+
+
+@pytest.mark.asyncio
+async def test_coalesce_replaces_pending_frame():
+    websocket = FakeWebSocket()
+    connection = Connection(websocket, "testname", max_queue_size=8, overflow_policy=OverflowPolicy.COALESCE)
+
+    connection.send(Frame.from_object({"userlist": ["first"]}), coalesce_key="userlist")
+    connection.send(Frame.from_object({"userlist": ["first", "second"]}), coalesce_key="userlist")
+    connection.start()
+    await drain()
+
+    assert [json.loads(m)["userlist"] for m in websocket.sent] == [["first", "second"]]
+
+    await connection.close()
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_evicts_slow_consumer():
+    manager = ConnectionManager(max_queue_size=1, overflow_policy=OverflowPolicy.DISCONNECT)
+    slow = FakeWebSocket(delay=10)
+    await manager.connect(slow, "slow")
+
+    await manager.broadcast(message("one"))
+    await manager.broadcast(message("two"))
+
+    assert slow not in manager.activate_connections
+    assert slow.closed_with == 1013
+
+
+@pytest.mark.asyncio
+async def test_backplane_fans_out_across_managers():
+    hub = InMemoryHub()
+    first = ConnectionManager(backplane=InMemoryBackplane(hub))
+    second = ConnectionManager(backplane=InMemoryBackplane(hub))
+    alice, bob = FakeWebSocket(), FakeWebSocket()
+    await first.connect(alice, "alice")
+    await second.connect(bob, "bob")
+
+    await first.broadcast(message("hello"))
+    await drain()
+
+    assert "hello" in contents(alice)
+    assert "hello" in contents(bob)
+
+    await first.disconnect(alice)
+    await second.disconnect(bob)
+
+
+@pytest.mark.asyncio
+async def test_presence_snapshot_then_batched_deltas():
+    manager = ConnectionManager(presence_window=0.01)
+    alice, bob, carol = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await manager.connect(alice, "alice")
+    await asyncio.sleep(0.02)
+
+    await manager.connect(bob, "bob")
+    await manager.connect(carol, "carol")
+    await manager.disconnect(carol)
+    await asyncio.sleep(0.02)
+
+    assert json.loads(alice.sent[0]) == {"v": 1, "type": "presence", "data": {"members": ["alice"]}}
+    assert json.loads(bob.sent[0])["data"] == {"members": ["alice", "bob"]}
+    assert json.loads(alice.sent[-1])["data"] == {"joined": ["bob"], "left": []}
+    assert alice.sent[-1] is bob.sent[-1]
+
+    await manager.disconnect(bob)
+    await asyncio.sleep(0.02)
+    assert json.loads(alice.sent[-1])["data"] == {"joined": [], "left": ["bob"]}
+
+    await manager.disconnect(alice)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_only_room_members():
+    manager = ConnectionManager()
+    alice, bob = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(alice, "alice")
+    await manager.connect(bob, "bob", rooms=(2,))
+
+    await manager.broadcast(message("to general"))
+    await manager.broadcast(message("to room 2"), room_id=2)
+    await drain()
+
+    assert "to general" in contents(alice) and "to general" not in contents(bob)
+    assert "to room 2" in contents(bob) and "to room 2" not in contents(alice)
+
+    manager.subscribe(alice, 2)
+    manager.unsubscribe(bob, 2)
+    await manager.broadcast(message("again"), room_id=2)
+    await drain()
+
+    assert "again" in contents(alice) and "again" not in contents(bob)
+
+    await manager.disconnect(alice)
+    await manager.disconnect(bob)
+    assert manager.rooms == {}
+
+
+@pytest.mark.asyncio
+async def test_binary_connection_gets_msgpack_frames():
+    msgpack = pytest.importorskip("msgpack")
+    manager = ConnectionManager()
+    text, binary = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(text, "text")
+    await manager.connect(binary, "binary", subprotocol=SUBPROTOCOL_MSGPACK)
+
+    await manager.broadcast(Frame.event("typing", {"room_id": 1, "username": "text"}), transient=True)
+    await drain()
+
+    assert json.loads(text.sent[-1]) == msgpack.unpackb(binary.sent[-1])
+    assert msgpack.unpackb(binary.sent[-1])["type"] == "typing"
+
+    await manager.disconnect(text)
+    await manager.disconnect(binary)
+
+
+@pytest.mark.asyncio
+async def test_room_events_are_numbered_and_transient_ones_are_not():
+    manager = ConnectionManager()
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "testname")
+
+    assert await manager.broadcast(message("one")) == 1
+    assert await manager.broadcast(Frame.event("typing", {"room_id": 1}), transient=True) is None
+    assert await manager.broadcast(message("two")) == 2
+    await drain()
+
+    frames = [json.loads(sent) for sent in websocket.sent[1:]]
+    assert [frame.get("seq") for frame in frames] == [1, None, 2]
+
+    await manager.disconnect(websocket)
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_missed_events_of_own_rooms():
+    manager = ConnectionManager()
+    for content in ("one", "two", "three"):
+        await manager.broadcast(message(content))
+    await manager.broadcast(message("elsewhere"), room_id=2)
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "testname")
+
+    assert await manager.resume(websocket, 1) == (2, True)
+    await drain()
+
+    assert contents(websocket) == ["two", "three"]
+
+    await manager.disconnect(websocket)
+
+
+@pytest.mark.asyncio
+async def test_resume_falls_back_to_the_event_log():
+    hub = InMemoryHub()
+    earlier = ConnectionManager(backplane=InMemoryBackplane(hub))
+    for content in ("one", "two", "three"):
+        await earlier.broadcast(message(content))
+    # Started after the events, so its replay buffer does not have them
+    manager = ConnectionManager(backplane=InMemoryBackplane(hub))
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "testname")
+
+    assert await manager.resume(websocket, 1) == (2, True)
+    await manager.broadcast(message("four"))
+    await drain()
+
+    assert contents(websocket) == ["two", "three", "four"]
+
+    await manager.disconnect(websocket)
+
+
+@pytest.mark.asyncio
+async def test_resume_past_the_event_log_is_incomplete():
+    manager = ConnectionManager(backplane=InMemoryBackplane(InMemoryHub(events_length=2)), replay_buffer_size=2)
+    for content in ("one", "two", "three", "four"):
+        await manager.broadcast(message(content))
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "testname")
+
+    assert await manager.resume(websocket, 1) == (0, False)
+    assert await manager.resume(websocket, 4) == (0, True)
+
+    await manager.disconnect(websocket)
+
+
+@pytest.mark.asyncio
+async def test_silent_connection_is_pinged_then_evicted():
+    manager = ConnectionManager(heartbeat_interval=10, idle_timeout=30, timer_tick=1)
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "testname")
+    connection = manager.activate_connections[websocket]
+
+    connection.last_seen -= 10
+    for _ in range(10):
+        manager.timers.advance()
+    await drain()
+    assert json.loads(websocket.sent[-1])["type"] == "ping"
+
+    connection.last_seen -= 30
+    for _ in range(10):
+        manager.timers.advance()
+    await drain()
+
+    assert websocket not in manager.activate_connections
+    assert websocket.closed_with == 1001
+    assert manager.stats()["evicted"] == {"idle": 1}
+    assert manager.stats()["timers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_connections_per_user_are_capped():
+    manager = ConnectionManager(max_connections_per_user=2)
+    first, second, third = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+
+    assert await manager.connect(first, "testname")
+    assert await manager.connect(second, "testname")
+    assert not await manager.connect(third, "testname")
+    assert third.closed_with == 1008
+
+    await manager.disconnect(first)
+    assert await manager.connect(third, "testname")
+    assert manager.stats() | {"evicted": None} == {
+        "live": 2, "users": 1, "accepted": 3, "disconnected": 1, "refused": 1, "evicted": None, "timers": 2
+    }
+
+    await manager.disconnect(second)
+    await manager.disconnect(third)
+
+
+@pytest.mark.asyncio
+async def test_stopping_a_manager_takes_its_users_offline():
+    hub = InMemoryHub()
+    stopping = ConnectionManager(backplane=InMemoryBackplane(hub), presence_window=0.01)
+    staying = ConnectionManager(backplane=InMemoryBackplane(hub), presence_window=0.01)
+    alice, bob = FakeWebSocket(), FakeWebSocket()
+    await stopping.connect(alice, "alice")
+    await staying.connect(bob, "bob")
+    await asyncio.sleep(0.02)
+
+    await stopping.stop()
+    await drain()
+
+    assert list(hub.presence) == ["bob"]
+    assert alice.closed_with == 1001
+    assert json.loads(bob.sent[-1])["data"] == {"joined": [], "left": ["alice"]}
+
+    await staying.disconnect(bob)
+
+
+@pytest.mark.asyncio
+async def test_connection_is_dropped_when_presence_cannot_be_recorded(monkeypatch):
+    manager = ConnectionManager()
+
+    async def failing_join(username):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(manager.backplane, "join", failing_join)
+    websocket = FakeWebSocket()
+
+    assert await manager.connect(websocket, "alice") is False
+    assert manager.activate_connections == {}
+    assert manager.user_connections == {}
+    assert websocket.closed_with == 1011
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import pytest
+
+from src.core.hashing import PasswordHasher
+from src.database.db import get_password_hash, verify_password
+from src.exceptions import PasswordHashingOverloadedError
+
+
+async def sample_loop_lag(stop: asyncio.Event, interval: float = 0.001):
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+    return sorted(samples)
+
+
+@pytest.mark.asyncio
+async def test_login_burst_keeps_event_loop_responsive():
+    hasher = PasswordHasher(max_workers=4, max_pending=64)
+    hashed = get_password_hash("testpassword")
+    stop = asyncio.Event()
+    lag = asyncio.create_task(sample_loop_lag(stop))
+
+    results = await asyncio.gather(*(
+        hasher.run(verify_password, "testpassword", hashed) for _ in range(8)
+    ))
+    stop.set()
+
+    # A blocking bcrypt call would stall every tick of the burst by 100-300 ms
+    samples = await lag
+    assert all(results)
+    assert samples[int(len(samples) * 0.95)] < 0.01
+    assert hasher.stats()["completed"] == 8
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_calls_beyond_max_pending():
+    hasher = PasswordHasher(max_workers=1, max_pending=2)
+
+    results = await asyncio.gather(
+        *(hasher.run(get_password_hash, "testpassword") for _ in range(3)),
+        return_exceptions=True
+    )
+
+    assert sum(isinstance(r, PasswordHashingOverloadedError) for r in results) == 1
+    assert hasher.stats()["rejected"] == 1
+    hasher.shutdown()
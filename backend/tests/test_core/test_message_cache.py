@@ -0,0 +1,199 @@
+import asyncio
+import pytest
+from fakeredis import FakeAsyncRedis, FakeServer
+from redis.exceptions import ConnectionError
+
+from src.core.message_cache import MessageCache, RoomMessageCaches
+
+
+def item(id: int):
+    return f'{{"id": {id}, "content": "message {id}"}}'
+
+
+class CountingLoader:
+    def __init__(self, messages: dict[int, str], delay: float = 0):
+        self.messages = messages
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, limit: int):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.messages, True, 0
+
+
+@pytest.mark.asyncio
+async def test_cold_cache_serves_nothing(redis_connection):
+    cache = MessageCache(redis_connection, loader=CountingLoader({}))
+
+    page = await cache.page(None, None, 10)
+
+    assert not page.warm
+    assert page.items is None
+
+
+@pytest.mark.asyncio
+async def test_window_is_trimmed_and_floor_raised(redis_connection):
+    cache = MessageCache(redis_connection, loader=CountingLoader({}), window=3)
+    await cache.rebuild({1: item(1), 2: item(2)}, complete=True)
+
+    await cache.append({3: item(3), 4: item(4)})
+
+    assert (await cache.page(None, None, 3)).items is None
+    assert (await cache.page(None, None, 2))[2:4] == ([item(3), item(4)], True)
+    assert (await cache.page(3, None, 5)).items is None
+    assert (await cache.page(None, 2, 5))[2:4] == ([item(3), item(4)], False)
+    assert (await cache.page(None, 0, 5)).items is None
+
+
+@pytest.mark.asyncio
+async def test_complete_history_pages_to_the_start(redis_connection):
+    cache = MessageCache(redis_connection, loader=CountingLoader({}))
+    await cache.rebuild({1: item(1), 2: item(2), 3: item(3)}, complete=True)
+
+    await cache.remove(2)
+
+    assert (await cache.page(3, None, 10))[2:4] == ([item(1)], False)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_rebuild_once(redis_connection):
+    loader = CountingLoader({1: item(1)}, delay=0.05)
+    cache = MessageCache(redis_connection, loader=loader)
+
+    await asyncio.gather(*(cache.ensure_warm() for _ in range(50)))
+
+    assert loader.calls == 1
+    assert (await cache.page(None, None, 10)).items == [item(1)]
+
+
+@pytest.mark.asyncio
+async def test_waits_for_rebuild_by_another_worker(redis_connection):
+    loader = CountingLoader({1: item(1)})
+    cache = MessageCache(redis_connection, loader=loader)
+    other_worker = MessageCache(redis_connection, loader=CountingLoader({1: item(1)}))
+    await redis_connection.set(cache.key_rebuild_lock, "other-worker", px=1000)
+
+    waiting = asyncio.create_task(cache.ensure_warm())
+    await asyncio.sleep(0.1)
+    await other_worker.rebuild({1: item(1)}, complete=True)
+    await waiting
+
+    assert loader.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_stale_cache_is_served_while_refreshing(redis_connection):
+    loader = CountingLoader({1: item(1), 2: item(2)})
+    cache = MessageCache(redis_connection, loader=loader)
+    await cache.rebuild({1: item(1)}, complete=True)
+    await redis_connection.delete(cache.key_fresh)
+
+    stale = await cache.page(None, None, 10)
+    cache.refresh_in_background()
+    await asyncio.sleep(0.05)
+
+    assert stale.warm and not stale.fresh
+    assert stale.items == [item(1)]
+    assert (await cache.page(None, None, 10)).items == [item(1), item(2)]
+
+
+@pytest.mark.asyncio
+async def test_version_waits_for_changes_applied_out_of_order(redis_connection):
+    cache = MessageCache(redis_connection, loader=CountingLoader({}))
+    await cache.rebuild({1: item(1)}, complete=True, version=4)
+
+    await cache.append({3: item(3)}, version=6)
+    ahead = await cache.page(None, None, 10)
+    await cache.append({2: item(2)}, version=5)
+    caught_up = await cache.page(None, None, 10)
+
+    assert (ahead.version, ahead.etag) == (4, '"4.1"')
+    assert (caught_up.version, caught_up.etag) == (6, '"6"')
+    assert (await cache.page(None, None, 10, if_none_match='"6"')).not_modified
+
+
+@pytest.mark.asyncio
+async def test_local_cache_serves_repeated_reads_until_a_change(redis_connection):
+    cache = MessageCache(redis_connection, loader=CountingLoader({}))
+    await cache.rebuild({1: item(1)}, complete=True)
+    await cache.page(None, None, 10)
+
+    await redis_connection.zadd(cache.key_log, {item(2): 2})
+    assert (await cache.page(None, None, 10)).items == [item(1)]
+    assert cache.local.hits == 1
+
+    await cache.append({3: item(3)})
+    assert (await cache.page(None, None, 10)).items == [item(1), item(2), item(3)]
+
+
+@pytest.mark.asyncio
+async def test_room_caches_keep_the_most_recently_used(redis_connection):
+    caches = RoomMessageCaches(redis_connection, lambda room_id: CountingLoader({}), max_rooms=2)
+    first = caches.room(1)
+    caches.room(2)
+    caches.room(1)
+    caches.room(3)
+
+    assert 2 not in caches
+    assert caches.room(1) is first
+    assert caches.stats()["rooms"] == 2
+
+
+@pytest.mark.asyncio
+async def test_changes_invalidate_local_caches_of_other_workers(redis_connection):
+    caches = RoomMessageCaches(redis_connection, lambda room_id: CountingLoader({}))
+    other_worker = MessageCache(redis_connection, loader=CountingLoader({}))
+    await caches.start()
+    await asyncio.sleep(0.05)
+    cache = caches.room()
+    await cache.rebuild({1: item(1)}, complete=True)
+    await cache.page(None, None, 10)
+
+    await other_worker.remove(1)
+    await asyncio.sleep(0.1)
+
+    assert (await cache.page(None, None, 10)).items == []
+    await caches.stop()
+
+
+@pytest.mark.asyncio
+async def test_change_missed_while_redis_is_down_drops_the_cache():
+    server = FakeServer()
+    cache = MessageCache(FakeAsyncRedis(server=server, decode_responses=True), loader=CountingLoader({}))
+    await cache.rebuild({1: item(1)}, complete=True)
+
+    server.connected = False
+    await cache.append({2: item(2)})
+    assert cache.dirty
+
+    server.connected = True
+    assert not (await cache.page(None, None, 10)).warm
+    assert not cache.dirty
+
+
+@pytest.mark.asyncio
+async def test_change_missed_by_one_worker_makes_every_worker_rebuild(redis_connection, monkeypatch):
+    loader = CountingLoader({1: item(1)})
+    failing_worker = MessageCache(redis_connection, loader=loader)
+    other_caches = RoomMessageCaches(redis_connection, lambda room_id: loader)
+    await other_caches.start()
+    await asyncio.sleep(0.05)
+    other_worker = other_caches.room()
+    await failing_worker.rebuild({1: item(1)}, complete=True)
+    assert (await other_worker.page(None, None, 10)).items == [item(1)]
+
+    async def redis_down(*args, **kwargs):
+        raise ConnectionError("connection lost")
+
+    # Only this worker loses the change; Redis stays up for the other one
+    monkeypatch.setattr(failing_worker, "_append", redis_down)
+    loader.messages = {1: item(1), 2: item(2)}
+    await failing_worker.append({2: item(2)})
+    await asyncio.sleep(0.05)
+
+    assert not failing_worker.dirty
+    assert not (await other_worker.page(None, None, 10)).warm
+    await other_worker.ensure_warm()
+    assert (await other_worker.page(None, None, 10)).items == [item(1), item(2)]
+    await other_caches.stop()
@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+import orjson
+
+from src.core.message_json import dump_message, dump_messages_page
+from src.schemas.message import MessageListResponse
+
+
+def test_dump_message_matches_response_model():
+    message = {
+        "id": 7,
+        "content": "Hello world!",
+        "created_at": datetime(2025, 9, 6, 15, 39, 21, 834072, tzinfo=timezone.utc),
+        "updated_at": None,
+        "created_by": "testname",
+        "room_id": 1,
+    }
+
+    expected = MessageListResponse.MessageListResponseItem(**message).model_dump_json()
+
+    assert dump_message(message) == expected
+
+
+def test_cached_messages_are_embedded_as_they_are():
+    items = [dump_message({"id": id, "content": "hi", "created_at": datetime(2025, 1, 1), "created_by": "testname", "room_id": 1})
+             for id in (1, 2)]
+
+    body = dump_messages_page(items, next_cursor=None, version=3)
+
+    assert MessageListResponse.model_validate_json(body).messages[1].id == 2
+    assert orjson.loads(body)["version"] == 3
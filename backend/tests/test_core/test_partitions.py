@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import select
+
+from src.core.partitions import (
+    Partition,
+    PartitionMaintainer,
+    expired_partitions,
+    missing_partitions,
+    month_start,
+    parse_partition
+)
+from src.database.db import create_messages
+from src.database.models.message import MessageChange
+
+from ..conftest import async_engine
+
+
+NOW = datetime(2025, 11, 17, 9, 30, tzinfo=timezone.utc)
+
+
+def utc(year, month):
+    return datetime(year, month, 1, tzinfo=timezone.utc)
+
+
+def test_month_start_crosses_years():
+    assert month_start(NOW) == utc(2025, 11)
+    assert month_start(NOW, 2) == utc(2026, 1)
+    assert month_start(NOW, -11) == utc(2024, 12)
+
+
+def test_parse_partition_bounds():
+    legacy = parse_partition("messages_legacy", "FOR VALUES FROM (MINVALUE) TO ('2025-11-01 00:00:00+00')")
+    monthly = parse_partition(
+        "messages_p202511", "FOR VALUES FROM ('2025-11-01 03:00:00+03') TO ('2025-12-01 00:00:00+00')"
+    )
+
+    assert legacy == Partition("messages_legacy", None, utc(2025, 11))
+    assert monthly == Partition("messages_p202511", utc(2025, 11), utc(2025, 12))
+    assert parse_partition("messages_default", "DEFAULT").default
+
+
+def test_missing_partitions_skip_covered_months():
+    existing = [
+        Partition("messages_legacy", None, utc(2025, 12)),
+        Partition("messages_p202601", utc(2026, 1), utc(2026, 2)),
+        Partition("messages_default", None, None, default=True),
+    ]
+
+    missing = missing_partitions(existing, NOW, months_ahead=3)
+
+    assert missing == [
+        ("messages_p202512", utc(2025, 12), utc(2026, 1)),
+        ("messages_p202602", utc(2026, 2), utc(2026, 3)),
+    ]
+
+
+def test_expired_partitions_keep_retention_window():
+    existing = [
+        Partition("messages_legacy", None, utc(2025, 8)),
+        Partition("messages_p202508", utc(2025, 8), utc(2025, 9)),
+        Partition("messages_p202509", utc(2025, 9), utc(2025, 10)),
+        Partition("messages_default", None, None, default=True),
+    ]
+
+    expired = expired_partitions(existing, NOW, retention_months=2)
+
+    assert [partition.name for partition in expired] == ["messages_legacy", "messages_p202508"]
+
+
+@pytest.mark.asyncio
+async def test_maintenance_prunes_old_message_changes(db):
+    for content in ("one", "two", "three"):
+        await create_messages(db, [{"content": content, "created_at": NOW, "created_by": "testname"}])
+
+    await PartitionMaintainer(async_engine, changes_retention=2).maintain(NOW)
+
+    versions = await db.scalars(select(MessageChange.version).order_by(MessageChange.version))
+    assert list(versions) == [2, 3]
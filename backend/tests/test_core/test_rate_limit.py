@@ -0,0 +1,18 @@
+import pytest
+from fakeredis import FakeAsyncRedis, FakeServer
+from fastapi_limiter import FastAPILimiter
+
+from src.core.rate_limit import FailOpenRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_requests_pass_while_redis_is_down(monkeypatch):
+    server = FakeServer()
+    server.connected = False
+    monkeypatch.setattr(FastAPILimiter, "redis", FakeAsyncRedis(server=server))
+    monkeypatch.setattr(FastAPILimiter, "lua_sha", "sha")
+    limiter = FailOpenRateLimiter(times=1, seconds=60)
+    allowed = FailOpenRateLimiter.allowed_unchecked
+
+    assert await limiter._check("key") == 0
+    assert FailOpenRateLimiter.allowed_unchecked == allowed + 1
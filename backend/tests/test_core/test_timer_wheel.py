@@ -0,0 +1,33 @@
+from src.core.timer_wheel import TimerWheel
+
+
+def test_timers_fire_on_their_tick_across_turns():
+    wheel = TimerWheel(tick=1, slots=4)
+    fired = []
+    wheel.schedule("soon", 1, lambda: fired.append("soon"))
+    wheel.schedule("later", 6, lambda: fired.append("later"))
+
+    wheel.advance()
+    assert fired == ["soon"]
+
+    for _ in range(4):
+        wheel.advance()
+    assert fired == ["soon"]
+
+    wheel.advance()
+    assert fired == ["soon", "later"]
+    assert len(wheel) == 0
+
+
+def test_rescheduling_replaces_and_cancel_removes():
+    wheel = TimerWheel(tick=1, slots=4)
+    fired = []
+    wheel.schedule("key", 1, lambda: fired.append("first"))
+    wheel.schedule("key", 2, lambda: fired.append("second"))
+    wheel.schedule("gone", 1, lambda: fired.append("gone"))
+    wheel.cancel("gone")
+
+    wheel.advance()
+    wheel.advance()
+
+    assert fired == ["second"]
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import select
+
+from src.core.write_behind import MessageWriter
+from src.database.db import create_message
+from src.database.models.message import Message
+
+from ..conftest import TestingAsyncSessionLocal
+
+
+@pytest.mark.asyncio
+async def test_submitted_messages_are_stored_in_batches(db):
+    flushed = []
+
+    async def on_flush(batch, versions):
+        flushed.append(len(batch))
+
+    writer = MessageWriter(TestingAsyncSessionLocal, batch_size=3, flush_interval=0.01, on_flush=on_flush)
+    await writer.start()
+
+    ids = await asyncio.gather(*(
+        writer.submit(f"message {i}", datetime.now(timezone.utc), "testname")
+        for i in range(7)
+    ))
+    await writer.stop()
+
+    result = await db.execute(select(Message.id, Message.content).order_by(Message.id))
+    assert [tuple(row) for row in result] == [(id, f"message {i}") for i, id in enumerate(ids)]
+    assert ids == sorted(set(ids))
+    assert sum(flushed) == 7
+    assert max(flushed) == 3
+
+
+@pytest.mark.asyncio
+async def test_ids_follow_store_order_with_other_inserts(db):
+    writer = MessageWriter(TestingAsyncSessionLocal, batch_size=10, flush_interval=0.01)
+    await writer.start()
+
+    first = await writer.submit("first", None, "testname")
+    async with TestingAsyncSessionLocal() as session:
+        between, _ = await create_message(session, "between", datetime.now(timezone.utc), "testname")
+    last = await writer.submit("last", None, "testname")
+    await writer.stop()
+
+    assert first < between.id < last
+
+
+@pytest.mark.asyncio
+async def test_submit_fills_missing_created_at(db):
+    writer = MessageWriter(TestingAsyncSessionLocal, batch_size=10, flush_interval=0.01)
+    await writer.start()
+
+    message_id = await writer.submit("hello", None, "testname")
+    await writer.stop()
+
+    message = await db.get(Message, message_id)
+    assert message.created_at is not None
+
+
+@pytest.mark.asyncio
+async def test_submit_raises_when_the_batch_cannot_be_stored(db, monkeypatch):
+    async def failing_create_messages(session, rows):
+        raise RuntimeError("database down")
+
+    monkeypatch.setattr("src.core.write_behind.create_messages", failing_create_messages)
+    monkeypatch.setattr("src.core.write_behind.FLUSH_ATTEMPTS", 1)
+    writer = MessageWriter(TestingAsyncSessionLocal, batch_size=10, flush_interval=0.01)
+    await writer.start()
+
+    with pytest.raises(RuntimeError):
+        await writer.submit("hello", None, "testname")
+    await writer.stop()
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import event
+
+from src.core.bulk_import import import_messages
+from src.database.db import clamp_created_at, create_message, get_messages_page
+from src.database.models.message import Message
+
+from ..conftest import async_engine, TestingAsyncSessionLocal
+
+
+def test_clamp_created_at_keeps_client_times_near_server_time(monkeypatch):
+    monkeypatch.setattr("src.database.db.MESSAGES_CLOCK_SKEW_SECONDS", 60)
+    now = datetime.now(timezone.utc)
+
+    assert clamp_created_at(now - timedelta(seconds=10)) == now - timedelta(seconds=10)
+    assert now - timedelta(seconds=60) <= clamp_created_at(now - timedelta(days=30)) < now - timedelta(seconds=59)
+    assert now + timedelta(seconds=60) <= clamp_created_at(now + timedelta(days=30)) < now + timedelta(seconds=61)
+    assert clamp_created_at(None) >= now
+    assert clamp_created_at(now.replace(tzinfo=None)) == now
+
+
+@pytest.mark.asyncio
+async def test_pages_lose_no_rows_outside_the_created_at_bound(db, monkeypatch):
+    monkeypatch.setattr("src.database.db.MESSAGES_CLOCK_SKEW_SECONDS", 60)
+    now = datetime.now(timezone.utc)
+    # Imported or old rows: 1, 3 and 5 lie far from their id neighbours in time
+    times = [now + timedelta(days=1), now, now - timedelta(days=30), now, now - timedelta(days=1), now, now]
+    db.add_all([
+        Message(id=i, content=f"message {i}", created_at=created_at, created_by="alice")
+        for i, created_at in enumerate(times, start=1)
+    ])
+    await db.commit()
+
+    before, _ = await get_messages_page(db, before_id=4, limit=10)
+    after, _ = await get_messages_page(db, after_id=2, limit=10)
+    unknown, _ = await get_messages_page(db, before_id=99, limit=10)
+    assert [row.id for row in before] == [1, 2, 3]
+    assert [row.id for row in after] == [3, 4, 5, 6, 7]
+    assert [row.id for row in unknown] == [1, 2, 3, 4, 5, 6, 7]
+
+    # Walking the history one short page at a time visits every row once
+    seen, cursor, has_more = [], 8, True
+    while has_more:
+        page, has_more = await get_messages_page(db, before_id=cursor, limit=2)
+        seen = [row.id for row in page] + seen
+        cursor = page[0].id
+    assert seen == [1, 2, 3, 4, 5, 6, 7]
+
+    seen, cursor, has_more = [], 0, True
+    while has_more:
+        page, has_more = await get_messages_page(db, after_id=cursor, limit=2)
+        seen += [row.id for row in page]
+        cursor = page[-1].id
+    assert seen == [1, 2, 3, 4, 5, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_pages_in_time_order_stay_bounded(db, monkeypatch):
+    monkeypatch.setattr("src.database.db.MESSAGES_CLOCK_SKEW_SECONDS", 60)
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        Message(id=i, content=f"message {i}", created_at=now + timedelta(seconds=i), created_by="alice")
+        for i in range(1, 6)
+    ])
+    await db.commit()
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        page, has_more = await get_messages_page(db, before_id=5, limit=2)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert ([row.id for row in page], has_more) == ([3, 4], True)
+    # Cursor time, bounded page and the empty check of what the bound left out
+    assert len(statements) == 3
+
+
+async def as_records(records):
+    for record in records:
+        yield record
+
+
+@pytest.mark.asyncio
+async def test_imported_old_messages_page_like_any_other(db):
+    now = datetime.now(timezone.utc)
+    for i in range(3):
+        await create_message(db, f"live {i}", now, "alice")
+    # Years old, yet they get ids after the live messages
+    imported, _ = await import_messages(TestingAsyncSessionLocal, as_records([
+        {"content": f"imported {i}", "created_at": datetime(2020, 1, 1 + i, tzinfo=timezone.utc), "created_by": "bob"}
+        for i in range(4)
+    ]))
+    await create_message(db, "live again", now, "alice")
+    assert imported == 4
+
+    seen, cursor, has_more = [], 99, True
+    while has_more:
+        page, has_more = await get_messages_page(db, before_id=cursor, limit=2)
+        seen = [row.id for row in page] + seen
+        cursor = page[0].id
+    assert seen == list(range(1, 9))
+
+    # After the live messages, a bound from the cursor's time would leave out the imported ones
+    seen, cursor, has_more = [], 0, True
+    while has_more:
+        page, has_more = await get_messages_page(db, after_id=cursor, limit=3)
+        seen += [row.id for row in page]
+        cursor = page[-1].id
+    assert seen == list(range(1, 9))
@@ -0,0 +1,22 @@
+import pytest
+
+from src.database import db as database
+
+from ..conftest import async_engine
+
+
+@pytest.mark.asyncio
+async def test_verify_schema_rejects_unmigrated_database(db, monkeypatch):
+    monkeypatch.setattr(database, "engine", async_engine)
+    monkeypatch.setattr(database, "DB_SCHEMA_CHECK", "verify")
+
+    with pytest.raises(RuntimeError, match="alembic upgrade head"):
+        await database.verify_schema()
+
+
+@pytest.mark.asyncio
+async def test_verify_schema_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(database, "engine", None)
+    monkeypatch.setattr(database, "DB_SCHEMA_CHECK", "off")
+
+    await database.verify_schema()
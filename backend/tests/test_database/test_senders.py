@@ -0,0 +1,43 @@
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import select
+
+from src.database.db import backfill_message_senders, create_message, create_messages, copy_messages
+from src.database.models.message import Message
+from src.database.models.user import User
+
+
+@pytest.mark.asyncio
+async def test_backfill_sets_sender_in_batches(db):
+    db.add_all([User(username="alice", hashed_password="hash"), User(username="bob", hashed_password="hash")])
+    db.add_all([
+        Message(content=f"message {i}", created_at=datetime.now(timezone.utc), created_by=sender)
+        for i, sender in enumerate(["alice", "bob", "alice", "nobody", "bob"])
+    ])
+    await db.commit()
+
+    updated = await backfill_message_senders(db, batch_size=2)
+    again = await backfill_message_senders(db, batch_size=2)
+
+    senders = (await db.execute(select(Message.created_by, User.username).outerjoin(User).order_by(Message.id))).all()
+    assert updated == 4
+    assert again == 0
+    assert [sender for _, sender in senders] == ["alice", "bob", "alice", None, "bob"]
+
+
+@pytest.mark.asyncio
+async def test_writes_set_sender(db):
+    user = User(username="alice", hashed_password="hash")
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    user_id = user.id
+    now = datetime.now(timezone.utc)
+
+    message, _ = await create_message(db, "single", now, "alice")
+    assert message.sender_id == user_id
+    await create_messages(db, [{"id": 100, "content": "batch", "created_at": now, "created_by": "alice"}])
+    await copy_messages(db, [{"content": "copied", "created_at": now, "updated_at": None, "created_by": "alice"}])
+
+    sender_ids = (await db.execute(select(Message.sender_id))).scalars().all()
+    assert sender_ids == [user_id] * 3
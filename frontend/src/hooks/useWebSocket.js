@@ -4,43 +4,106 @@ import { parseTimestamp } from '../utils/dateUtils';
 
 import { WS_BASE_URL } from '../config/api';
 
-export function useWebSocket({ username, onMessage, onOnlineCount, dateHeadersCreated }) {
+// Versioned envelope of the chat WebSocket protocol: {v, type, data, ref}
+const PROTOCOL_VERSION = 1;
+const SUBPROTOCOL = 'chat.v1.json';
+const RECONNECT_DELAY_MS = 1000;
+const RECONNECT_MAX_DELAY_MS = 30000;
+
+const systemMessage = (text) => ({
+    id: null,
+    text: text,
+    timestamp: null,
+    sender: '<System>',
+});
+
+export function useWebSocket({ username, onMessage, onOnlineCount, onResync, dateHeadersCreated }) {
     const ws = useRef(null);
     const [userlist, setUserlist] = useState([])
     const onMessageRef = useRef(onMessage);
     const onOnlineCountRef = useRef(onOnlineCount);
     const lastDateRef = useRef(null);
+    const onResyncRef = useRef(onResync);
+    // Sequence number of the last room event received, sent back on reconnect to resume
+    const lastSeqRef = useRef(null);
 
     useEffect(() => { onMessageRef.current = onMessage }, [onMessage]);
     useEffect(() => { onOnlineCountRef.current = onOnlineCount }, [onOnlineCount]);
+    useEffect(() => { onResyncRef.current = onResync }, [onResync]);
+    useEffect(() => { onOnlineCountRef.current && onOnlineCountRef.current(userlist.length) }, [userlist]);
 
     useEffect(() => {
-        ws.current = new WebSocket(WS_BASE_URL + username);
-
-        ws.current.onopen = () => {
-            const newMessage = {
-                sender: '<System>',
-                text: `User ${username} entered the chat`,
-                timestamp: null,
+        let closing = false;
+        let reconnectDelay = RECONNECT_DELAY_MS;
+        let reconnectTimer = null;
+
+        const connect = () => {
+            ws.current = new WebSocket(WS_BASE_URL, SUBPROTOCOL);
+            ws.current.onopen = () => {
+                reconnectDelay = RECONNECT_DELAY_MS;
+                if(lastSeqRef.current !== null) {
+                    ws.current.send(JSON.stringify({
+                        v: PROTOCOL_VERSION, type: 'resume', ref: 'resume', data: { last_seq: lastSeqRef.current }
+                    }));
+                }
+            };
+            ws.current.onmessage = handleMessage;
+            ws.current.onclose = () => {
+                if(closing) {
+                    return;
+                }
+                reconnectTimer = setTimeout(connect, reconnectDelay);
+                reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY_MS);
             };
-            ws.current.send(
-                JSON.stringify({
-                    content: newMessage.text,
-                    created_at: newMessage.timestamp,
-                    created_by: newMessage.sender,
-                })
-            );
         };
 
-        ws.current.onmessage = (event) => {
-            const eventJSON = JSON.parse(event.data);
-            if(eventJSON.userlist) {
-                var userlist = Object.keys(eventJSON.userlist).map((key) => [key, eventJSON.userlist[key]]);
-                onOnlineCountRef.current && onOnlineCountRef.current(userlist.length);
-                setUserlist(eventJSON.userlist)
+        const handleMessage = (event) => {
+            const envelope = JSON.parse(event.data);
+            if(envelope.v !== PROTOCOL_VERSION) {
                 return;
             }
-            if(eventJSON.content != `User ${username} entered the chat`) {
+            if(envelope.seq !== undefined) {
+                // Replayed and live events may overlap right after a resume
+                if(lastSeqRef.current !== null && envelope.seq <= lastSeqRef.current) {
+                    return;
+                }
+                lastSeqRef.current = envelope.seq;
+            }
+            if(envelope.type === 'ping') {
+                ws.current.send(JSON.stringify({ v: PROTOCOL_VERSION, type: 'pong' }));
+                return;
+            }
+            if(envelope.type === 'ack') {
+                if(!envelope.data.ok) {
+                    console.log(`Error: server rejected frame: ${envelope.data.error}`);
+                }
+                else if(envelope.ref === 'resume' && !envelope.data.complete) {
+                    // Missed too much to replay: the history has to be loaded again
+                    onResyncRef.current && onResyncRef.current();
+                }
+                return;
+            }
+            if(envelope.type === 'presence') {
+                if(envelope.data.members) {
+                    setUserlist(envelope.data.members);
+                    return;
+                }
+                const { joined, left } = envelope.data;
+                setUserlist(prev => {
+                    const next = prev.filter(user => !left.includes(user));
+                    joined.forEach(user => { if(!next.includes(user)) next.push(user) });
+                    return next;
+                });
+                joined.filter(user => user !== username).forEach(user => {
+                    onMessageRef.current && onMessageRef.current(systemMessage(`User ${user} entered the chat`));
+                });
+                left.filter(user => user !== username).forEach(user => {
+                    onMessageRef.current && onMessageRef.current(systemMessage(`User ${user} left the chat`));
+                });
+                return;
+            }
+            if(envelope.type === 'message') {
+                const eventJSON = envelope.data;
                 const parsedDate = parseTimestamp(eventJSON.created_at);
                 const currentDate = parsedDate ? new Date(
                     parsedDate.getFullYear(),
@@ -89,39 +152,32 @@ export function useWebSocket({ username, onMessage, onOnlineCount, dateHeadersCr
             }
         };
 
+        connect();
+
+        // Other users learn about the leave from the presence delta
         const handleBeforeUnload = () => {
-            if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-                const newMessage = {
-                    id: null,
-                    sender: '<System>',
-                    text: `User ${username} left the chat`,
-                    timestamp: null,
-                };
-                ws.current.send(
-                    JSON.stringify({
-                        content: newMessage.text,
-                        created_at: newMessage.timestamp,
-                        created_by: newMessage.sender,
-                    })
-                );
+            closing = true;
+            if (ws.current) {
+                ws.current.close();
             }
         };
 
         window.addEventListener('beforeunload', handleBeforeUnload);
 
         return () => {
+            closing = true;
+            clearTimeout(reconnectTimer);
             window.removeEventListener('beforeunload', handleBeforeUnload);
             if (ws.current) {
-                ws.current.onopen = null;
                 ws.current.onmessage = null;
                 ws.current.close();
             }
         };
     }, [username]);
 
-    const sendMessage = (msgObj) => {
+    const sendMessage = (data) => {
         if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-            ws.current.send(JSON.stringify(msgObj));
+            ws.current.send(JSON.stringify({ v: PROTOCOL_VERSION, type: 'message', data: data }));
         }
     };
 
@@ -22,6 +22,8 @@ export function Chat() {
 	const username = user?.username || "";
 	const [onlineUsers, setOnlineUsers] = useState(0);
 	const dateHeadersCreatedRef = useRef(new Set());
+	// Bumped when a reconnect missed more than the server can replay
+	const [historyVersion, setHistoryVersion] = useState(0);
 	const onMessage = useCallback(
 		(msg) => {
 			setMessages(prev => [...prev, msg]);
@@ -39,10 +41,15 @@ export function Chat() {
 		(count) => setOnlineUsers(count),
 		[]
 	);
+	const onResync = useCallback(
+		() => setHistoryVersion(version => version + 1),
+		[]
+	);
 	const {ws, sendMessage, userlist, } = useWebSocket({
 		username: username,
 		onMessage, 
 		onOnlineCount,
+		onResync,
 		dateHeadersCreated: dateHeadersCreatedRef.current,
 	  });
 	const {makeRequest} = useApi()
@@ -108,7 +115,7 @@ export function Chat() {
 		};
 	
 		loadMessages();
-	}, []);
+	}, [historyVersion]);
 	
 	useEffect(() => {
 		const lastMessage = messages[messages.length - 1];
@@ -127,29 +134,15 @@ export function Chat() {
 
 		const timestamp = new Date();
 
-		try {
-			const response = await makeRequest("send-message", {
-				method: "POST",
-				body: JSON.stringify({
-					"content": inputValue,
-					"created_at": timestamp,
-					"created_by": username,
-				}),
+		// The server assigns the id, stores the message and echoes it back to everyone
+		if(ws.current.readyState === WebSocket.OPEN) {
+			sendMessage({
+				"content": inputValue,
+				"created_at": timestamp
 			});
-
-			if(ws.current.readyState === WebSocket.OPEN) {
-				sendMessage({
-					"id": response.id,
-					"content": inputValue,
-					"created_at": timestamp,
-					"created_by": username
-				});
-			}
-			else {
-				console.log("Error: Server is close but you're trying to send request");
-			}
-		} catch (err) {
-			console.error("Failed to send message:", err);
+		}
+		else {
+			console.log("Error: Server is close but you're trying to send request");
 		}
 
 		setInputValue('');